@@ -0,0 +1,278 @@
+import json
+import logging
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, Throttled
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .idempotency import ais_replay, idempotent
+from .matching import nearest_geofence_details
+from .models import Geofence
+from .serializers import AttendanceSerializer
+from .services import AttendanceSequenceError, aget_attendance_state, check_sequence, record_attendance
+from .spatial_index import aget_geofence_index, match_geofence
+from .spatialite import spatialite_enabled
+from .throttling import AttendanceWriteThrottle, GlobalAttendanceWriteThrottle
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAPIView(View):
+    """
+    Base for the native async endpoints served on the ASGI stack.
+
+    DRF 3.14 views are synchronous, so these are plain async Django views
+    with the same JWT authentication and JSON responses. Reads use the async
+    ORM; writes that need a transaction run in a worker thread through
+    sync_to_async, so no thread is held while a request waits on I/O.
+    """
+    authentication = JWTAuthentication()
+    throttle_classes = ()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Token authenticated like the DRF views, no CSRF cookie involved
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await sync_to_async(self.authentication.authenticate)(request)
+        except (AuthenticationFailed, InvalidToken) as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return self.respond(detail, status.HTTP_401_UNAUTHORIZED)
+        if auth is None:
+            return self.respond(
+                {'detail': 'Authentication credentials were not provided.'},
+                status.HTTP_401_UNAUTHORIZED
+            )
+        request.user, request.auth = auth
+
+        # Replays of completed Idempotency-Key requests run nothing, never throttle them
+        throttles = [] if self.throttle_classes and await ais_replay(request) else self.throttle_classes
+        for throttle in [throttle_class() for throttle_class in throttles]:
+            if not throttle.allow_request(request, self):
+                wait = throttle.wait()
+                response = self.respond({'detail': Throttled(wait).detail}, status.HTTP_429_TOO_MANY_REQUESTS)
+                response['Retry-After'] = str(math.ceil(wait))
+                return response
+
+        return await super().dispatch(request, *args, **kwargs)
+
+    def respond(self, data, status_code=status.HTTP_200_OK):
+        response = JsonResponse(data, status=status_code, encoder=JSONEncoder, safe=False)
+        # Like a DRF Response, keep the data around (idempotent replays cache it)
+        response.data = data
+        return response
+
+    def get_data(self, request):
+        """The parsed body; JSON that is not an object comes back as is for the view to refuse"""
+        if request.content_type == 'application/json':
+            try:
+                return json.loads(request.body or b'{}')
+            except ValueError:
+                return {}
+        return request.POST
+
+    def parse_coordinates(self, latitude, longitude):
+        lat = float(latitude)
+        lng = float(longitude)
+        if not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+            raise ValueError("Coordinates out of valid range")
+        return lat, lng
+
+
+class AsyncClockInOutView(AsyncAPIView):
+    """Async counterpart of ClockInOutView, same request and responses"""
+    throttle_classes = [AttendanceWriteThrottle, GlobalAttendanceWriteThrottle]
+
+    @idempotent
+    async def post(self, request, action, *args, **kwargs):
+        try:
+            data = self.get_data(request)
+            if not isinstance(data, dict):
+                return self.respond({'error': 'Request body must be a JSON object'}, status.HTTP_400_BAD_REQUEST)
+            latitude = data.get('latitude')
+            longitude = data.get('longitude')
+
+            if not latitude or not longitude:
+                return self.respond({'error': 'Location data is required'}, status.HTTP_400_BAD_REQUEST)
+
+            try:
+                lat, lng = self.parse_coordinates(latitude, longitude)
+            except (TypeError, ValueError) as e:
+                return self.respond(
+                    {'error': 'Invalid location data', 'details': str(e)},
+                    status.HTTP_400_BAD_REQUEST
+                )
+
+            if spatialite_enabled():
+                match = await sync_to_async(match_geofence)(lat, lng)
+            else:
+                # Matching is in-memory; the database is only hit if the index is stale
+                match = (await aget_geofence_index()).match(lat, lng)
+            within_geofence, distance = match.geofence, match.distance
+
+            if not within_geofence:
+                return self.respond(
+                    {
+                        'error': 'Not within any geofence',
+                        'details': {
+                            'nearest_geofence': nearest_geofence_details(match, lat, lng)
+                        }
+                    },
+                    status.HTTP_403_FORBIDDEN
+                )
+
+            try:
+                check_sequence(await aget_attendance_state(request.user), action)
+                attendance = await sync_to_async(record_attendance)(
+                    request.user, action, within_geofence, lat, lng
+                )
+            except AttendanceSequenceError as e:
+                return self.respond({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+            return self.respond(
+                {
+                    'success': True,
+                    'data': AttendanceSerializer(attendance).data,
+                    'geofence': {
+                        'name': within_geofence.name,
+                        'distance': distance
+                    }
+                },
+                status.HTTP_201_CREATED
+            )
+
+        except Exception:
+            logger.exception("Unexpected error in attendance processing")
+            return self.respond({'error': 'Internal server error'}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncAutoClockOutView(AsyncAPIView):
+    """Async counterpart of AutoClockOutView, same request and responses"""
+    throttle_classes = [AttendanceWriteThrottle, GlobalAttendanceWriteThrottle]
+
+    async def post(self, request, *args, **kwargs):
+        user = request.user
+        try:
+            data = self.get_data(request)
+            if not isinstance(data, dict):
+                return self.respond({'error': 'Request body must be a JSON object'}, status.HTTP_400_BAD_REQUEST)
+            latitude = data.get('latitude')
+            longitude = data.get('longitude')
+            original_geofence_id = data.get('original_geofence_id')
+
+            if not all([latitude, longitude, original_geofence_id]):
+                return self.respond(
+                    {'error': 'Missing required fields: latitude, longitude, original_geofence_id'},
+                    status.HTTP_400_BAD_REQUEST
+                )
+
+            try:
+                lat, lng = self.parse_coordinates(latitude, longitude)
+            except (TypeError, ValueError) as e:
+                return self.respond(
+                    {'error': 'Invalid location data', 'details': str(e)},
+                    status.HTTP_400_BAD_REQUEST
+                )
+
+            try:
+                original_geofence = await Geofence.objects.aget(pk=original_geofence_id)
+            except (Geofence.DoesNotExist, ValueError):
+                return self.respond({'error': 'Original geofence not found'}, status.HTTP_400_BAD_REQUEST)
+
+            state = await aget_attendance_state(user)
+            if not state.is_clocked_in:
+                return self.respond(
+                    {'error': 'No active clock-in found. User is not currently clocked in.'},
+                    status.HTTP_400_BAD_REQUEST
+                )
+
+            if state.geofence_id != original_geofence.id:
+                logger.warning(f"Auto clock-out geofence mismatch: clocked in at {state.geofence_id}, trying to clock out from {original_geofence_id}")
+
+            try:
+                attendance = await sync_to_async(record_attendance)(
+                    user, 'clock-out', original_geofence, lat, lng, is_auto=True
+                )
+            except AttendanceSequenceError:
+                return self.respond(
+                    {'error': 'No active clock-in found. User is not currently clocked in.'},
+                    status.HTTP_400_BAD_REQUEST
+                )
+
+            logger.info(f"Auto clock-out successful: User {user.username} from {original_geofence.name}")
+
+            return self.respond(
+                {
+                    'success': True,
+                    'message': f'Auto clock-out from {original_geofence.name} recorded successfully',
+                    'data': {
+                        'id': attendance.id,
+                        'user': user.username,
+                        'geofence': {
+                            'id': original_geofence.id,
+                            'name': original_geofence.name
+                        },
+                        'type': 'clock-out',
+                        'is_auto': True,
+                        'timestamp': attendance.timestamp,
+                        'location': {
+                            'latitude': lat,
+                            'longitude': lng
+                        }
+                    }
+                },
+                status.HTTP_201_CREATED
+            )
+
+        except Exception as e:
+            logger.exception(f"Auto clock-out error for user {user.username}: {str(e)}")
+            return self.respond(
+                {
+                    'error': 'Failed to process auto clock-out',
+                    'details': str(e) if settings.DEBUG else 'Internal server error'
+                },
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class AsyncCurrentAttendanceStatusView(AsyncAPIView):
+    """Async counterpart of CurrentAttendanceStatusView"""
+
+    async def get(self, request):
+        try:
+            state = await aget_attendance_state(request.user)
+
+            response_data = {
+                'isClockedIn': False,
+                'lastAction': None,
+                'lastActionTime': None,
+                'lastGeofence': None
+            }
+
+            if state.last_action:
+                response_data = {
+                    'isClockedIn': state.is_clocked_in,
+                    'lastAction': state.last_action,
+                    'lastActionTime': state.last_action_time,
+                    'lastGeofence': {
+                        'id': state.geofence.id,
+                        'name': state.geofence.name
+                    } if state.geofence else None
+                }
+
+            return self.respond(response_data)
+
+        except Exception as e:
+            logger.error(f"Error fetching current attendance status: {str(e)}")
+            return self.respond({'error': 'Internal server error'}, status.HTTP_500_INTERNAL_SERVER_ERROR)
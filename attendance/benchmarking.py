@@ -0,0 +1,66 @@
+"""Helpers shared by the load-testing management commands"""
+import io
+import json
+import statistics
+import sys
+import time
+
+LOCAL_SERVER = {
+    'SERVER_NAME': 'localhost',
+    'SERVER_PORT': '80',
+    'SERVER_PROTOCOL': 'HTTP/1.1',
+    'REMOTE_ADDR': '127.0.0.1',
+    'wsgi.errors': sys.stderr,
+    'wsgi.url_scheme': 'http',
+    'wsgi.version': (1, 0),
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': False,
+    'wsgi.run_once': False,
+}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, `fraction` in [0, 1]"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def latency_summary(latencies):
+    """Mean and tail latencies in milliseconds from durations in seconds"""
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {
+        'mean': statistics.mean(milliseconds) if milliseconds else 0.0,
+        'p50': percentile(milliseconds, 0.50),
+        'p95': percentile(milliseconds, 0.95),
+        'p99': percentile(milliseconds, 0.99),
+        'max': max(milliseconds, default=0.0),
+    }
+
+
+def call_wsgi(application, method, path, token, data=None):
+    """
+    Send one JSON request through a WSGI application in this thread.
+    Returns (status code, response body, seconds).
+    """
+    body = json.dumps(data).encode() if data is not None else b''
+    environ = dict(
+        LOCAL_SERVER,
+        REQUEST_METHOD=method,
+        PATH_INFO=path,
+        QUERY_STRING='',
+        CONTENT_TYPE='application/json',
+        CONTENT_LENGTH=str(len(body)),
+        HTTP_AUTHORIZATION=f'Bearer {token}',
+    )
+    environ['wsgi.input'] = io.BytesIO(body)
+
+    codes = []
+    start = time.perf_counter()
+    response = application(environ, lambda status, headers, exc_info=None: codes.append(int(status[:3])))
+    try:
+        content = b''.join(response)
+    finally:
+        response.close()
+    return codes[0], content, time.perf_counter() - start
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+SPATIAL_BACKENDS = ('memory', 'spatialite')
+
+
+@register()
+def check_spatial_backend(app_configs, **kwargs):
+    backend = getattr(settings, 'GEOFENCE_SPATIAL_BACKEND', 'memory')
+    if backend not in SPATIAL_BACKENDS:
+        return [Error(
+            f"GEOFENCE_SPATIAL_BACKEND must be one of {', '.join(SPATIAL_BACKENDS)}, not {backend!r}",
+            id='attendance.E001',
+        )]
+    if backend == 'spatialite':
+        return [Warning(
+            "The SpatiaLite geofence backend is experimental: the test suite only runs it where "
+            "mod_spatialite can be loaded, which CI cannot.",
+            hint="Load the shapes and compare them with the in-memory matcher using "
+                 "`manage.py sync_geofence_shapes --verify 1000` before relying on it.",
+            id='attendance.W001',
+        )]
+    return []
@@ -0,0 +1,106 @@
+import math
+
+EARTH_RADIUS_M = 6371000  # Earth radius in meters
+GEOFENCE_BUFFER_M = 10  # Tolerance added to every geofence radius
+
+# Widens bounding boxes a hair so float rounding never rejects a border point
+BBOX_PAD_DEG = 1e-9
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate distance in meters between two points using Haversine formula
+    """
+    # Convert decimal degrees to radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = (math.sin(dlat/2)**2 +
+         math.cos(lat1) * math.cos(lat2) *
+         math.sin(dlon/2)**2)
+    c = 2 * math.asin(math.sqrt(min(a, 1.0)))
+    return EARTH_RADIUS_M * c
+
+
+def bounding_box(latitude, longitude, distance):
+    """
+    Half extents in degrees (half_lat, half_lng) of the smallest lat/lng box
+    holding every point within `distance` meters of the center.
+    half_lng is 180 when the circle reaches a pole.
+    """
+    angular = distance / EARTH_RADIUS_M
+    half_lat = math.degrees(angular) + BBOX_PAD_DEG
+    lat = math.radians(latitude)
+
+    if angular >= math.pi / 2 - abs(lat):
+        return half_lat, 180.0
+
+    half_lng = math.degrees(math.asin(math.sin(angular) / math.cos(lat)))
+    return half_lat, half_lng + BBOX_PAD_DEG
+
+
+def wrap_longitude(delta):
+    """Normalize a longitude difference into [-180, 180)"""
+    return (delta + 180.0) % 360.0 - 180.0
+
+
+def destination(lat, lng, distance, bearing):
+    """Point `distance` meters from (lat, lng) along the great circle at `bearing` degrees"""
+    lat1, lng1, theta = math.radians(lat), math.radians(lng), math.radians(bearing)
+    angular = distance / EARTH_RADIUS_M
+    lat2 = math.asin(math.sin(lat1) * math.cos(angular) + math.cos(lat1) * math.sin(angular) * math.cos(theta))
+    lng2 = lng1 + math.atan2(math.sin(theta) * math.sin(angular) * math.cos(lat1),
+                             math.cos(angular) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), wrap_longitude(math.degrees(lng2))
+
+
+def in_bounding_box(lat, lng, center_lat, center_lng, half_lat, half_lng):
+    """Cheap rejection test against a box built by bounding_box()"""
+    if abs(lat - center_lat) > half_lat:
+        return False
+    return abs(wrap_longitude(lng - center_lng)) <= half_lng
+
+
+# Equirectangular fast path
+#
+# With the cosine taken at the mean latitude of the two points, the
+# equirectangular distance e differs from the haversine distance h by
+#
+#     |e - h| <= h * (s / R)**2 / (8 * cos(phi)**2)
+#
+# where s bounds the separation and phi bounds |latitude| of both points.
+# Measured worst cases sit about 3x below this (e.g. 3.5e-4 relative at
+# s = 100 km, phi = 80 deg). Points inside a geofence bounding box are at
+# most ~2 * limit from its center, so using s = 2 * limit the fast path can
+# settle any point whose approximate distance is further than
+# limit * tolerance from the boundary. Only the thin band in between, and
+# geofences too large or too close to a pole, fall back to haversine.
+EQUIRECT_MAX_LIMIT_M = 50000
+EQUIRECT_MAX_LATITUDE = 85.0
+EQUIRECT_MIN_TOLERANCE = 1e-9  # Covers float rounding in both formulas
+
+
+def equirectangular_tolerance(latitude, limit):
+    """
+    Relative error bound of the equirectangular distance for points inside
+    the bounding box of a circle of `limit` meters at `latitude`.
+    Returns None when the fast path must not be used.
+    """
+    half_lat, _ = bounding_box(latitude, 0.0, limit)
+    max_latitude = abs(latitude) + half_lat
+    if limit > EQUIRECT_MAX_LIMIT_M or max_latitude > EQUIRECT_MAX_LATITUDE:
+        return None
+
+    separation = 2 * limit / EARTH_RADIUS_M
+    bound = separation ** 2 / (8 * math.cos(math.radians(max_latitude)) ** 2)
+    return max(bound, EQUIRECT_MIN_TOLERANCE)
+
+
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    """Fast planar approximation of the distance in meters between two nearby points"""
+    lat1, lat2 = math.radians(lat1), math.radians(lat2)
+    x = math.radians(wrap_longitude(lon2 - lon1)) * math.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS_M * math.sqrt(x * x + y * y)
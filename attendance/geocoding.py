@@ -0,0 +1,147 @@
+import functools
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .geo import haversine_distance
+from .spatial_index import get_geofence_index
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def get_gmaps_client():
+    """Google Maps client, created on first use instead of at import time"""
+    import googlemaps
+
+    return googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+
+
+class GoogleMapsGeocoder:
+    """Reverse geocoding through the Google Maps API (one call per point)"""
+    name = 'google'
+
+    def reverse_geocode_many(self, points):
+        client = get_gmaps_client()
+        addresses = []
+        for lat, lng in points:
+            results = client.reverse_geocode((lat, lng))
+            addresses.append(results[0]['formatted_address'] if results else '')
+        return addresses
+
+
+class StubGeocoder:
+    """Offline provider for development and tests: labels points with the geofence holding them"""
+    name = 'stub'
+
+    def reverse_geocode_many(self, points):
+        index = get_geofence_index()
+        addresses = []
+        for lat, lng in points:
+            match = index.match(lat, lng)
+            site = match.geofence.name if match.geofence else 'Unknown location'
+            addresses.append(f"{site} ({lat:.4f}, {lng:.4f})")
+        return addresses
+
+
+class ReverseGeocoder:
+    """
+    Reverse geocoding behind two cache levels: an in-process LRU and the
+    GeocodedLocation table, both keyed by coordinates rounded to
+    `precision` decimals. Lookups are batched: one query for every key
+    missing from the LRU, then provider calls in chunks of `batch_size`
+    for the keys nobody has resolved yet.
+    """
+
+    def __init__(self, provider=None, precision=None, cache_size=None, batch_size=None):
+        self.provider = provider or import_string(
+            getattr(settings, 'REVERSE_GEOCODING_PROVIDER', 'attendance.geocoding.StubGeocoder')
+        )()
+        self.precision = precision if precision is not None else getattr(settings, 'REVERSE_GEOCODING_PRECISION', 4)
+        self.cache_size = cache_size or getattr(settings, 'REVERSE_GEOCODING_CACHE_SIZE', 10000)
+        self.batch_size = batch_size or getattr(settings, 'REVERSE_GEOCODING_BATCH_SIZE', 50)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def round(self, lat, lng):
+        lat, lng = round(lat, self.precision), round(lng, self.precision)
+        return f"{lat:.{self.precision}f},{lng:.{self.precision}f}", lat, lng
+
+    def _remember(self, key, address):
+        with self._lock:
+            self._cache[key] = address
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def reverse_geocode(self, lat, lng):
+        return self.reverse_geocode_many([(lat, lng)])[0]
+
+    def reverse_geocode_many(self, points):
+        """Address for each (lat, lng), or None where the provider failed"""
+        from .models import GeocodedLocation
+
+        keys = [self.round(lat, lng) for lat, lng in points]
+        found = {}
+        with self._lock:
+            for key, _, _ in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+
+        missing = {key: (lat, lng) for key, lat, lng in keys if key not in found}
+        if missing:
+            for key, address in GeocodedLocation.objects.filter(key__in=list(missing)).values_list('key', 'address'):
+                found[key] = address
+                self._remember(key, address)
+                del missing[key]
+
+        missing = list(missing.items())
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            try:
+                addresses = self.provider.reverse_geocode_many([point for _, point in chunk])
+            except Exception as e:
+                logger.error(f"Reverse geocoding failed for {len(chunk)} points: {str(e)}")
+                continue
+            GeocodedLocation.objects.bulk_create([
+                GeocodedLocation(key=key, latitude=lat, longitude=lng, address=address, provider=self.provider.name)
+                for (key, (lat, lng)), address in zip(chunk, addresses)
+            ], ignore_conflicts=True)
+            for (key, _), address in zip(chunk, addresses):
+                found[key] = address
+                self._remember(key, address)
+
+        return [found.get(key) for key, _, _ in keys]
+
+
+@functools.lru_cache(maxsize=None)
+def get_reverse_geocoder():
+    return ReverseGeocoder()
+
+
+def label_attendance(rows):
+    """
+    Add an `address` to serialized attendance rows in one batched lookup.
+    Points inside their geofence are snapped to its center, so every
+    clock-in at a site shares a single cached address.
+    """
+    index = get_geofence_index()
+    points = []
+    labelled = []
+    for row in rows:
+        if row.get('latitude') is None or row.get('longitude') is None:
+            continue
+        lat, lng = row['latitude'], row['longitude']
+        entry = index.get(row.get('geofence'))
+        if entry is not None and haversine_distance(lat, lng, entry.latitude, entry.longitude) <= entry.limit:
+            lat, lng = entry.latitude, entry.longitude
+        points.append((lat, lng))
+        labelled.append(row)
+
+    for row, address in zip(labelled, get_reverse_geocoder().reverse_geocode_many(points)):
+        row['address'] = address
+    return rows
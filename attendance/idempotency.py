@@ -0,0 +1,188 @@
+import functools
+import hashlib
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# How long a key stays claimed by a request that has not finished yet
+PENDING_TIMEOUT = 60
+
+PENDING = 'pending'
+DONE = 'done'
+
+
+def get_idempotency_cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE', 'default')]
+
+
+class IdempotentRequest:
+    """
+    A request carrying an Idempotency-Key. Keys are scoped to the user, and
+    a fingerprint of the method, path and body tells a retry apart from a
+    different request reusing the same key.
+    """
+
+    def __init__(self, request, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        self.cache_key = f'attendance:idempotency:{request.user.pk}:{digest}'
+        fingerprint = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+        fingerprint.update(request.body)
+        self.fingerprint = fingerprint.hexdigest()
+        self.ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+    def pending(self):
+        return {'state': PENDING, 'fingerprint': self.fingerprint}
+
+    def completed(self, response):
+        """Cache entry for a finished response, or None if a retry should run the view again"""
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            return None
+        return {
+            'state': DONE,
+            'fingerprint': self.fingerprint,
+            'status': response.status_code,
+            'data': response.data,
+        }
+
+    def replays(self, entry):
+        return entry is not None and entry['state'] == DONE and entry['fingerprint'] == self.fingerprint
+
+    def outcome(self, entry):
+        """(data, status, replayed) to answer with when the key is already taken"""
+        if entry is not None and entry['fingerprint'] != self.fingerprint:
+            return (
+                {'error': 'This Idempotency-Key was already used for a different request'},
+                status.HTTP_422_UNPROCESSABLE_ENTITY,
+                False,
+            )
+        if entry is None or entry['state'] == PENDING:
+            return (
+                {'error': 'A request with this Idempotency-Key is still being processed'},
+                status.HTTP_409_CONFLICT,
+                False,
+            )
+        return entry['data'], entry['status'], True
+
+
+def invalid_key(key):
+    if len(key) > MAX_KEY_LENGTH:
+        return {'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}
+    return None
+
+
+def keyed_request(request):
+    """IdempotentRequest for a request with a valid Idempotency-Key, else None"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key or invalid_key(key):
+        return None
+    return IdempotentRequest(request, key)
+
+
+def is_replay(request):
+    """Whether `request` repeats a completed request, and so only needs its stored response"""
+    idempotent_request = keyed_request(request)
+    return idempotent_request is not None and idempotent_request.replays(
+        get_idempotency_cache().get(idempotent_request.cache_key)
+    )
+
+
+async def ais_replay(request):
+    idempotent_request = keyed_request(request)
+    return idempotent_request is not None and idempotent_request.replays(
+        await get_idempotency_cache().aget(idempotent_request.cache_key)
+    )
+
+
+class ReplayUnthrottledMixin:
+    """
+    For DRF views with an @idempotent handler. Throttles run in initial(),
+    before the handler, so a retry of a completed request could be refused
+    with 429 instead of getting its stored response. Replays run nothing,
+    so they skip the throttles.
+    """
+
+    def check_throttles(self, request):
+        if not is_replay(request):
+            super().check_throttles(request)
+
+
+def idempotent(method):
+    """
+    Make a view's POST handler honour the Idempotency-Key header.
+
+    The first request with a key claims it and its response is cached for
+    IDEMPOTENCY_KEY_TTL seconds; a repeat of the same request gets that
+    response back (flagged with Idempotent-Replayed: true) without the
+    handler running again. Server errors are not cached, so those retries
+    go through. Works on DRF views and on AsyncAPIView handlers.
+    """
+    if iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def async_wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return await method(view, request, *args, **kwargs)
+            error = invalid_key(key)
+            if error:
+                return view.respond(error, status.HTTP_400_BAD_REQUEST)
+
+            cache = get_idempotency_cache()
+            idempotent_request = IdempotentRequest(request, key)
+            if not await cache.aadd(idempotent_request.cache_key, idempotent_request.pending(), PENDING_TIMEOUT):
+                data, status_code, replayed = idempotent_request.outcome(
+                    await cache.aget(idempotent_request.cache_key)
+                )
+                response = view.respond(data, status_code)
+                if replayed:
+                    response[REPLAYED_HEADER] = 'true'
+                return response
+
+            try:
+                response = await method(view, request, *args, **kwargs)
+            except BaseException:
+                await cache.adelete(idempotent_request.cache_key)
+                raise
+            entry = idempotent_request.completed(response)
+            if entry is None:
+                await cache.adelete(idempotent_request.cache_key)
+            else:
+                await cache.aset(idempotent_request.cache_key, entry, idempotent_request.ttl)
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return method(view, request, *args, **kwargs)
+        error = invalid_key(key)
+        if error:
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+
+        cache = get_idempotency_cache()
+        idempotent_request = IdempotentRequest(request, key)
+        if not cache.add(idempotent_request.cache_key, idempotent_request.pending(), PENDING_TIMEOUT):
+            data, status_code, replayed = idempotent_request.outcome(cache.get(idempotent_request.cache_key))
+            return Response(data, status=status_code, headers={REPLAYED_HEADER: 'true'} if replayed else None)
+
+        try:
+            response = method(view, request, *args, **kwargs)
+        except BaseException:
+            cache.delete(idempotent_request.cache_key)
+            raise
+        entry = idempotent_request.completed(response)
+        if entry is None:
+            cache.delete(idempotent_request.cache_key)
+        else:
+            cache.set(idempotent_request.cache_key, entry, idempotent_request.ttl)
+        return response
+
+    return wrapper
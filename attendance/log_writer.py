@@ -0,0 +1,279 @@
+import atexit
+import logging
+import math
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+
+from .models import LocationPing, LoginLog
+from .stats import bump_stat
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# Minimum seconds between two queue overflow warnings
+OVERFLOW_WARNING_INTERVAL = 10
+
+
+class BatchWriter:
+    """
+    Buffers unsaved model instances in memory and writes them with
+    bulk_create from a background thread, so the request never waits on a
+    database write.
+
+    A batch is written once it holds `batch_size` objects or `flush_interval`
+    seconds after its first object, whichever comes first. Pending objects
+    are written when the process exits. If the queue is full the object is
+    saved synchronously instead of being dropped, and counted as an overflow.
+
+    Subclasses name their settings prefix (<PREFIX>_BATCH_SIZE,
+    <PREFIX>_FLUSH_INTERVAL, <PREFIX>_QUEUE_SIZE, <PREFIX>_ASYNC) and the
+    `model` they write, or override write_batch() and write_now() to queue
+    something other than model instances.
+    """
+    settings_prefix = None
+    model = None
+    label = 'object'
+    default_batch_size = 200
+    default_flush_interval = 1.0
+    default_queue_size = 10000
+
+    def __init__(self, batch_size=None, flush_interval=None, max_queue_size=None):
+        prefix = self.settings_prefix
+        self.batch_size = batch_size or getattr(settings, f'{prefix}_BATCH_SIZE', self.default_batch_size)
+        self.flush_interval = flush_interval or getattr(settings, f'{prefix}_FLUSH_INTERVAL', self.default_flush_interval)
+        self.max_queue_size = max_queue_size or getattr(settings, f'{prefix}_QUEUE_SIZE', self.default_queue_size)
+        self.counters = dict.fromkeys(('enqueued', 'written', 'batches', 'overflowed', 'failed'), 0)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._last_overflow_warning = None
+
+    def _ensure_started(self):
+        # Started lazily, and again in a forked worker since threads do not survive a fork
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                atexit.register(self.close)
+            self._pid = os.getpid()
+            name = f"{self.label.replace(' ', '-')}-writer"
+            self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+            self._thread.start()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    def write_batch(self, batch):
+        self.model.objects.bulk_create(batch)
+
+    def write_now(self, obj):
+        obj.save()
+
+    def after_write(self, batch):
+        """Called with every batch written"""
+
+    def log(self, obj):
+        """Queue an unsaved model instance for writing"""
+        if not getattr(settings, f'{self.settings_prefix}_ASYNC', True):
+            self.write_now(obj)
+            return
+
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(obj)
+        except queue.Full:
+            self._count('overflowed')
+            now = time.monotonic()
+            if self._last_overflow_warning is None or now - self._last_overflow_warning >= OVERFLOW_WARNING_INTERVAL:
+                self._last_overflow_warning = now
+                logger.warning(
+                    f"{self.label.capitalize()} queue full ({self.max_queue_size} events), writing synchronously; "
+                    f"{self.counters['overflowed']} overflows so far"
+                )
+            self.write_now(obj)
+            return
+        self._count('enqueued')
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far; returns False if the writer did not finish in time"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout=10.0):
+        """Stop the writer after writing every queued event"""
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(
+                f"{self.label.capitalize()} writer did not stop within {timeout}s, {self._queue.qsize()} events unwritten"
+            )
+
+    def _run(self):
+        batch = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is None or item is _STOP or isinstance(item, threading.Event):
+                    self._write(batch)
+                    batch, deadline = [], None
+                    if isinstance(item, threading.Event):
+                        item.set()
+                    elif item is _STOP:
+                        return
+                    continue
+
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) >= self.batch_size:
+                    self._write(batch)
+                    batch, deadline = [], None
+        finally:
+            connection.close()
+
+    def _write(self, batch):
+        if not batch:
+            return
+
+        close_old_connections()
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            self._count('failed', len(batch))
+            logger.error(f"Failed to write {len(batch)} {self.label}s: {str(e)}")
+            return
+
+        self._count('written', len(batch))
+        self._count('batches')
+        self.after_write(batch)
+
+
+def pending_logout_key(user_id):
+    return f'attendance:pending-logout:{user_id}'
+
+
+class LoginLogWriter(BatchWriter):
+    """
+    Login events, written off the login request path.
+
+    A logout served by another process before the login was written finds
+    no session. It leaves its time in the cache (defer_logout) for a little
+    longer than a flush interval, and the writer closes the login with it
+    when inserting it.
+    """
+    settings_prefix = 'LOGIN_LOG'
+    model = LoginLog
+    label = 'login log'
+    # Seconds a deferred logout outlives the flush interval
+    pending_logout_grace = 5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Logins written already closed by a deferred logout
+        self.counters.update(closed=0)
+
+    def defer_logout(self, user_id, logout_time):
+        """Keep a logout that found no session for the login still queued elsewhere"""
+        # add(): a repeated logout keeps the first one
+        cache.add(pending_logout_key(user_id), logout_time,
+                  timeout=math.ceil(self.flush_interval) + self.pending_logout_grace)
+
+    def apply_pending_logouts(self, batch):
+        """Close each user's latest open login preceding their deferred logout"""
+        keys = {pending_logout_key(login_log.user_id): login_log.user_id for login_log in batch}
+        applied = []
+        for key, logout_time in cache.get_many(keys).items():
+            login_log = max(
+                (login_log for login_log in batch
+                 if login_log.user_id == keys[key] and login_log.logout_time is None
+                 and login_log.login_time <= logout_time),
+                key=lambda login_log: login_log.login_time, default=None,
+            )
+            if login_log is not None:
+                login_log.logout_time = logout_time
+                applied.append(key)
+        if applied:
+            cache.delete_many(applied)
+            self._count('closed', len(applied))
+
+    def write_batch(self, batch):
+        self.apply_pending_logouts(batch)
+        self.model.objects.bulk_create(batch)
+        # bulk_create skips post_save, keep the dashboard counters in step here
+        bump_stat('recent_logins', len(batch))
+        bump_stat('active_logins', sum(1 for login_log in batch if login_log.logout_time is None))
+
+    def write_now(self, login_log):
+        self.apply_pending_logouts([login_log])
+        login_log.save()
+
+
+class LocationPingWriter(BatchWriter):
+    """Location pings from clocked-in phones, written in large batches"""
+    settings_prefix = 'LOCATION_PING'
+    model = LocationPing
+    label = 'location ping'
+    default_batch_size = 500
+    default_flush_interval = 2.0
+    default_queue_size = 50000
+
+
+class TrailWriter(BatchWriter):
+    """Location trail points (trails.TrailPoint), appended to each shift's trail in batches"""
+    settings_prefix = 'LOCATION_TRAIL'
+    label = 'trail point'
+    default_batch_size = 500
+    default_flush_interval = 2.0
+    default_queue_size = 50000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Points older than the end of their trail, and exact repeats skipped
+        self.counters.update(merged=0, duplicates=0)
+
+    def write_batch(self, batch):
+        from .trails import append_trail_points
+
+        counts = append_trail_points(batch)
+        self._count('merged', counts['merged'])
+        self._count('duplicates', counts['duplicates'])
+
+    def write_now(self, point):
+        self.write_batch([point])
+
+
+login_log_writer = LoginLogWriter()
+location_ping_writer = LocationPingWriter()
+trail_writer = TrailWriter()
@@ -0,0 +1,224 @@
+import json
+import random
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+from attendance.benchmarking import call_wsgi, latency_summary
+from attendance.geo import destination
+from attendance.models import Geofence
+from attendance.spatial_index import publish_geofence_change
+from attendance.spatialite import rebuild_shapes, spatialite_enabled
+from attendance.stats import invalidate_stat
+from attendance.versioning import next_geofence_version
+
+CENTER = (6.5244, 3.3792)
+
+# Expected status code of every step of a client's cycle
+CYCLE = (
+    ('status', 200),
+    ('clock-in', 201),
+    ('status', 200),
+    ('auto-clockout', 201),
+    ('clock-in', 201),
+    ('clock-out', 201),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end attendance benchmark: seeds users and geofences, then many "
+        "concurrent clients run status / clock-in / auto clock-out / clock-out "
+        "cycles through the WSGI stack against ClockInOutView, AutoClockOutView "
+        "and CurrentAttendanceStatusView. Reports throughput, p50/p95/p99 latency "
+        "and queries per request, optionally saved as JSON and compared with a "
+        "baseline run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--geofences', type=int, default=50)
+        parser.add_argument('--clients', type=int, default=16, help="Concurrent simulated clients")
+        parser.add_argument('--cycles', type=int, default=3, help="Clock cycles per user")
+        parser.add_argument('--area-km', type=float, default=20, help="Side of the square geofences are spread over")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--throttle', action='store_true', help="Keep the attendance write throttles on")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--baseline', help="Fail if results regress against this JSON file")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative regression")
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded users and geofences")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        users, geofences = self.seed(prefix, rng, options)
+        self.stdout.write(f"Seeded {len(users)} users and {len(geofences)} geofences ({prefix})")
+
+        try:
+            with override_settings(ATTENDANCE_THROTTLE_ENABLED=options['throttle']):
+                samples, elapsed = self.run(users, geofences, rng, options)
+        finally:
+            if not options['keep']:
+                Geofence.objects.filter(name__startswith=prefix).delete()
+                User.objects.filter(username__startswith=prefix).delete()
+
+        results = self.summarize(samples, elapsed, options)
+        self.report(results)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def seed(self, prefix, rng, options):
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}-{i}", role='employee') for i in range(options['users'])
+        ])
+        half = options['area_km'] * 500
+        geofences = []
+        for i in range(options['geofences']):
+            lat, lng = destination(*CENTER, rng.uniform(0, half), rng.uniform(0, 360))
+            geofences.append(Geofence(
+                name=f"{prefix}-site-{i}", latitude=lat, longitude=lng,
+                radius=rng.uniform(50, 300), created_by=users[0],
+            ))
+        with transaction.atomic():
+            version = next_geofence_version()
+            for geofence in geofences:
+                geofence.version = version
+            geofences = Geofence.objects.bulk_create(geofences)
+        # bulk_create skips the signals: reload the geofence index and counters
+        publish_geofence_change()
+        if spatialite_enabled():
+            rebuild_shapes(Geofence.objects.all())
+        invalidate_stat('total_geofences')
+        invalidate_stat('total_users')
+        return users, geofences
+
+    def run(self, users, geofences, rng, options):
+        application = get_wsgi_application()
+        clients = [
+            (str(RefreshToken.for_user(user).access_token), geofences[i % len(geofences)], random.Random(rng.random()))
+            for i, user in enumerate(users)
+        ]
+
+        def client(args):
+            token, geofence, client_rng = args
+            samples = []
+            for _ in range(options['cycles']):
+                for step, expected in CYCLE:
+                    method, path, data = self.build_request(step, geofence, client_rng)
+                    queries = []
+
+                    def count(execute, sql, params, many, context):
+                        queries.append(sql)
+                        return execute(sql, params, many, context)
+
+                    with connection.execute_wrapper(count):
+                        code, _, seconds = call_wsgi(application, method, path, token, data)
+                    samples.append((step, code, code == expected, seconds, len(queries)))
+            return samples
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as executor:
+            samples = [sample for client_samples in executor.map(client, clients) for sample in client_samples]
+        return samples, time.perf_counter() - start
+
+    def build_request(self, step, geofence, rng):
+        bearing = rng.uniform(0, 360)
+        if step == 'status':
+            return 'GET', '/api/current/attendance/', None
+        if step == 'auto-clockout':
+            # Well outside the geofence the user clocked in at
+            lat, lng = destination(geofence.latitude, geofence.longitude, geofence.radius * 3, bearing)
+            return 'POST', '/api/attendance/auto-clockout/', {
+                'latitude': lat, 'longitude': lng, 'original_geofence_id': geofence.id,
+            }
+        lat, lng = destination(geofence.latitude, geofence.longitude, rng.uniform(0, geofence.radius / 2), bearing)
+        return 'POST', f'/api/attendance/{step}/', {'latitude': lat, 'longitude': lng}
+
+    def describe(self, samples, elapsed):
+        status_codes = defaultdict(int)
+        for _, code, _, _, _ in samples:
+            status_codes[str(code)] += 1
+        return {
+            'requests': len(samples),
+            'throughput': len(samples) / elapsed if elapsed else 0.0,
+            'unexpected': sum(1 for _, _, ok, _, _ in samples if not ok),
+            'status_codes': dict(status_codes),
+            'latency_ms': latency_summary([seconds for _, _, _, seconds, _ in samples]),
+            'queries_per_request': sum(queries for *_, queries in samples) / len(samples) if samples else 0.0,
+        }
+
+    def summarize(self, samples, elapsed, options):
+        by_endpoint = defaultdict(list)
+        for sample in samples:
+            by_endpoint[sample[0]].append(sample)
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'revision': self.revision(),
+            'database': connection.vendor,
+            'config': {name: options[name] for name in ('users', 'geofences', 'clients', 'cycles', 'area_km', 'seed', 'throttle')},
+            'elapsed': elapsed,
+            'overall': self.describe(samples, elapsed),
+            'endpoints': {name: self.describe(rows, elapsed) for name, rows in sorted(by_endpoint.items())},
+        }
+
+    def revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def report(self, results):
+        self.stdout.write(f"{'endpoint':<15} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'unexpected':>10}")
+        rows = list(results['endpoints'].items()) + [('overall', results['overall'])]
+        for name, result in rows:
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{name:<15} {result['requests']:>8} {result['throughput']:>8.1f} {latency['p50']:>8.1f} "
+                f"{latency['p95']:>8.1f} {latency['p99']:>8.1f} {result['queries_per_request']:>8.2f} "
+                f"{result['unexpected']:>10}"
+            )
+        if results['overall']['unexpected']:
+            self.stdout.write(self.style.WARNING(f"Unexpected status codes: {results['overall']['status_codes']}"))
+
+    def compare(self, results, path, tolerance):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        current_rows = dict(results['endpoints'], overall=results['overall'])
+        baseline_rows = dict(baseline.get('endpoints', {}), overall=baseline['overall'])
+        for name, current in current_rows.items():
+            before = baseline_rows.get(name)
+            if before is None:
+                continue
+            if current['throughput'] < before['throughput'] * (1 - tolerance):
+                regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {current['throughput']:.1f} req/s")
+            if current['latency_ms']['p95'] > before['latency_ms']['p95'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {before['latency_ms']['p95']:.1f} -> {current['latency_ms']['p95']:.1f} ms")
+            if current['queries_per_request'] > before['queries_per_request'] + 0.5:
+                regressions.append(
+                    f"{name}: queries/request {before['queries_per_request']:.2f} -> {current['queries_per_request']:.2f}"
+                )
+
+        if regressions:
+            raise CommandError("Performance regressions against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path} (tolerance {tolerance:.0%})"))
@@ -0,0 +1,107 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import User
+from attendance.models import Attendance, Complaint, Geofence, LoginLog
+from attendance.serializers import (
+    AttendanceFlatSerializer,
+    AttendanceSerializer,
+    ComplaintFlatSerializer,
+    ComplaintSerializer,
+    LoginLogFlatSerializer,
+    LoginLogSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF serializers with and without select_related against the lean "
+        "flat serializers for the attendance, complaint and login-log lists. "
+        "Seeds rows inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Rows seeded per model")
+        parser.add_argument('--users', type=int, default=50, help="Distinct users owning the rows")
+        parser.add_argument('--repeat', type=int, default=3, help="Timing runs per mode (best is kept)")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = self.seed(options['rows'], options['users'])
+            cases = [
+                ('attendance', Attendance.objects.filter(user__in=users),
+                 AttendanceSerializer, AttendanceFlatSerializer, ('user', 'geofence')),
+                ('complaints', Complaint.objects.filter(user__in=users),
+                 ComplaintSerializer, ComplaintFlatSerializer, ('user',)),
+                ('login-logs', LoginLog.objects.filter(user__in=users),
+                 LoginLogSerializer, LoginLogFlatSerializer, ('user',)),
+            ]
+
+            self.stdout.write(f"{'endpoint':<12} {'mode':<16} {'rows':>7} {'queries':>8} {'ms':>10} {'ms/10k rows':>12}")
+            for name, queryset, serializer_class, flat_class, related in cases:
+                # Every run builds a fresh queryset so nothing is served from a result cache
+                modes = [
+                    ('drf', lambda qs=queryset, s=serializer_class: s(qs.all(), many=True).data),
+                    ('drf+related', lambda qs=queryset, s=serializer_class, r=related:
+                        s(qs.select_related(*r), many=True).data),
+                    ('lean', lambda qs=queryset, f=flat_class: self.lean(qs, f)),
+                    ('lean fields=3', lambda qs=queryset, f=flat_class: self.lean(qs, f, ['id', 'user', 'user_details'])),
+                ]
+                for mode, run in modes:
+                    rows, queries, elapsed = self.measure(run, options['repeat'])
+                    per_10k = elapsed * 10000 / rows if rows else 0
+                    self.stdout.write(f"{name:<12} {mode:<16} {rows:>7} {queries:>8} {elapsed:>10.1f} {per_10k:>12.1f}")
+
+            transaction.set_rollback(True)
+
+    def lean(self, queryset, flat_class, fields=None):
+        serializer = flat_class(fields)
+        return serializer.serialize(queryset.values(*serializer.paths))
+
+    def measure(self, run, repeat):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            rows = len(run())
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return rows, len(queries), best
+
+    def seed(self, rows, user_count):
+        prefix = f"bench-{uuid.uuid4().hex[:8]}"
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}-{i}", role='employee') for i in range(user_count)
+        ])
+        geofences = Geofence.objects.bulk_create([
+            Geofence(name=f"{prefix}-site-{i}", latitude=6.5 + i / 100, longitude=3.3, radius=100,
+                     created_by=users[0])
+            for i in range(10)
+        ])
+        now = timezone.now()
+        Attendance.objects.bulk_create([
+            Attendance(user=users[i % user_count], geofence=geofences[i % len(geofences)],
+                       type='clock-in' if i % 2 == 0 else 'clock-out',
+                       latitude=6.5, longitude=3.3, timestamp=now)
+            for i in range(rows)
+        ], batch_size=1000)
+        Complaint.objects.bulk_create([
+            Complaint(user=users[i % user_count], subject=f"Complaint {i}", message="Benchmark row")
+            for i in range(rows)
+        ], batch_size=1000)
+        LoginLog.objects.bulk_create([
+            LoginLog(user=users[i % user_count], ip_address='127.0.0.1', user_agent='benchmark')
+            for i in range(rows)
+        ], batch_size=1000)
+        return users
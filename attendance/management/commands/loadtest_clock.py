@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+from attendance.benchmarking import call_wsgi, latency_summary
+from attendance.models import Geofence
+
+SITE = (6.5244, 3.3792)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the clock-in/out and status endpoints through the WSGI handler "
+        "(sync views, a fixed pool of worker threads) and the ASGI handler "
+        "(async views, one event loop) in-process and compare throughput. "
+        "--client-latency simulates slow mobile uploads: it holds a WSGI worker "
+        "thread but only parks an ASGI request on the event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=200, help="Seeded users, one token each")
+        parser.add_argument('--threads', type=int, default=16, help="WSGI worker threads")
+        parser.add_argument('--concurrency', type=int, default=500, help="In-flight ASGI requests")
+        parser.add_argument('--client-latency', type=float, default=200, help="Milliseconds before the body arrives")
+        parser.add_argument('--endpoint', choices=['status', 'clock'], default='status')
+        parser.add_argument('--mode', choices=['both', 'wsgi', 'asgi'], default='both')
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded users and geofence")
+
+    def handle(self, *args, **options):
+        prefix = f"loadtest-{uuid.uuid4().hex[:8]}"
+        users = User.objects.bulk_create([
+            User(username=f"{prefix}-{i}", role='employee') for i in range(options['users'])
+        ])
+        geofence = Geofence.objects.create(
+            name=prefix, latitude=SITE[0], longitude=SITE[1], radius=200, created_by=users[0]
+        )
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in users]
+        latency = options['client_latency'] / 1000
+
+        try:
+            results = {}
+            for mode in (['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]):
+                requests = self.build_requests(options['endpoint'], tokens, options['requests'], mode)
+                if mode == 'wsgi':
+                    results[mode] = self.run_wsgi(requests, options['threads'], latency)
+                else:
+                    results[mode] = asyncio.run(self.run_asgi(requests, options['concurrency'], latency))
+                self.report(mode, results[mode])
+        finally:
+            if not options['keep']:
+                geofence.delete()
+                User.objects.filter(username__startswith=prefix).delete()
+
+        if len(results) == 2 and results['wsgi']['throughput']:
+            ratio = results['asgi']['throughput'] / results['wsgi']['throughput']
+            self.stdout.write(f"ASGI/WSGI throughput: {ratio:.2f}x")
+
+    def build_requests(self, endpoint, tokens, count, mode):
+        base = '/api/async' if mode == 'asgi' else '/api'
+        requests = []
+        for i in range(count):
+            token = tokens[i % len(tokens)]
+            if endpoint == 'status':
+                requests.append(('GET', f'{base}/current/attendance/', token, None))
+            else:
+                # Consecutive requests per user alternate in and out
+                action = 'clock-in' if (i // len(tokens)) % 2 == 0 else 'clock-out'
+                data = {'latitude': SITE[0], 'longitude': SITE[1]}
+                requests.append(('POST', f'{base}/attendance/{action}/', token, data))
+        return requests
+
+    def run_wsgi(self, requests, threads, latency):
+        application = get_wsgi_application()
+
+        def call(request):
+            method, path, token, body = request
+            start = time.perf_counter()
+            # The worker thread is held while the client sends its request
+            time.sleep(latency)
+            code, _, _ = call_wsgi(application, method, path, token, body)
+            return code, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            outcomes = list(executor.map(call, requests))
+        return self.summarize(outcomes, time.perf_counter() - start)
+
+    async def run_asgi(self, requests, concurrency, latency):
+        application = get_asgi_application()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(request):
+            method, path, token, data = request
+            body = json.dumps(data).encode() if data is not None else b''
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': method,
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode(),
+                'query_string': b'',
+                'root_path': '',
+                'headers': [
+                    (b'host', b'localhost'),
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'authorization', f'Bearer {token}'.encode()),
+                ],
+                'client': ('127.0.0.1', 0),
+                'server': ('localhost', 80),
+            }
+            codes = []
+            finished = asyncio.Event()
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    await asyncio.sleep(latency)
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    codes.append(message['status'])
+                elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                    finished.set()
+
+            async with semaphore:
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                return codes[0], time.perf_counter() - start
+
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(call(request) for request in requests))
+        return self.summarize(outcomes, time.perf_counter() - start)
+
+    def summarize(self, outcomes, elapsed):
+        codes = {}
+        for code, _ in outcomes:
+            codes[code] = codes.get(code, 0) + 1
+        return {
+            'requests': len(outcomes),
+            'elapsed': elapsed,
+            'throughput': len(outcomes) / elapsed if elapsed else 0.0,
+            'status_codes': codes,
+            **latency_summary([duration for _, duration in outcomes]),
+        }
+
+    def report(self, mode, result):
+        self.stdout.write(
+            f"{mode.upper()}: {result['requests']} requests in {result['elapsed']:.2f}s "
+            f"= {result['throughput']:.1f} req/s, latency ms "
+            f"p50 {result['p50']:.1f} p95 {result['p95']:.1f} p99 {result['p99']:.1f}, "
+            f"status codes {result['status_codes']}"
+        )
@@ -0,0 +1,27 @@
+from argparse import ArgumentTypeError
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from attendance.rollups import rebuild_rollups
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily attendance rollup table from raw attendance records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help="First day to rebuild (YYYY-MM-DD)")
+        parser.add_argument('--end', type=parse_date, help="Last day to rebuild (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        deleted, created = rebuild_rollups(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt attendance rollups: removed {deleted} rows, created {created} rows"
+        ))
@@ -0,0 +1,96 @@
+import time
+from argparse import ArgumentTypeError
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance.payroll import PayrollRunner, worker_throughput
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise ArgumentTypeError(f"invalid month '{value}', expected YYYY-MM")
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the shift totals of every active user over a pay period in "
+        "parallel chunks. Finished chunks are checkpointed, so running the "
+        "same period again resumes where a failed run stopped."
+    )
+
+    def add_arguments(self, parser):
+        period = parser.add_mutually_exclusive_group(required=True)
+        period.add_argument('--month', type=parse_month, help="Pay period month (YYYY-MM)")
+        period.add_argument('--start', type=parse_date, help="First day of the pay period (YYYY-MM-DD), with --end")
+        parser.add_argument('--end', type=parse_date, help="Last day of the pay period (YYYY-MM-DD)")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Worker processes (default: CPU count, 0: compute in this process)")
+        parser.add_argument('--chunk-size', type=int, default=250, help="Users per chunk")
+        parser.add_argument('--dry-run', action='store_true', help="Compute without writing anything")
+        parser.add_argument('--restart', action='store_true', help="Discard the period's saved results first")
+
+    def handle(self, *args, **options):
+        if options['month']:
+            start = options['month']
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        elif options['end']:
+            start, end = options['start'], options['end']
+        else:
+            raise CommandError("--start needs --end")
+        if end < start:
+            raise CommandError("The pay period ends before it starts")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        if end >= date.today():
+            self.stdout.write(self.style.WARNING(f"The pay period ends on {end}, shifts may still be open"))
+
+        runner = PayrollRunner(start, end, workers=options['workers'], chunk_size=options['chunk_size'],
+                               dry_run=options['dry_run'])
+        run = runner.get_run(restart=options['restart'] and not options['dry_run'])
+        if run is not None and run.status == 'completed' and not options['restart']:
+            self.stdout.write(f"Payroll {start} to {end} is already complete, use --restart to compute it again")
+            return
+
+        pending = len(runner.pending_users(run))
+        done = run.entries.count() if run is not None else 0
+        self.stdout.write(
+            f"Payroll {start} to {end}{' (dry run)' if runner.dry_run else ''}: {pending} users to compute"
+            f"{f', {done} already done' if done else ''}, {runner.workers or 'no'} workers"
+        )
+
+        started = time.perf_counter()
+        totals = {'users': 0, 'hours': 0.0, 'unmatched': 0}
+
+        def on_chunk(result):
+            totals['users'] += len(result.user_ids)
+            for user_totals in result.totals.values():
+                totals['hours'] += user_totals['seconds'] / 3600
+                totals['unmatched'] += user_totals['unmatched_clock_ins'] + user_totals['unmatched_clock_outs']
+            self.stdout.write(
+                f"  users {result.user_ids[0]}-{result.user_ids[-1]}: {len(result.user_ids)} users, "
+                f"{result.events} events in {result.elapsed:.2f}s ({result.worker}), {totals['users']}/{pending}"
+            )
+
+        results = runner.run(run, on_chunk=on_chunk)
+        elapsed = time.perf_counter() - started
+
+        for worker, stats in sorted(worker_throughput(results).items()):
+            self.stdout.write(
+                f"{worker}: {stats['chunks']} chunks, {stats['users']} users, {stats['events']} events in "
+                f"{stats['busy']:.2f}s, {stats['users_per_second']} users/s, {stats['events_per_second']} events/s"
+            )
+        rate = totals['users'] / elapsed if elapsed else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Computed' if runner.dry_run else 'Saved'} {totals['users']} users in {elapsed:.2f}s ({rate:.1f} users/s): "
+            f"{totals['hours']:.2f} hours, {totals['unmatched']} unmatched events"
+        ))
@@ -0,0 +1,58 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from attendance.geo import GEOFENCE_BUFFER_M, destination
+from attendance.matching import GeofenceMatcher
+from attendance.models import Geofence
+from attendance.spatialite import is_spatialite, rebuild_shapes, spatialite_match
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the SpatiaLite geofence shape table used when "
+        "GEOFENCE_SPATIAL_BACKEND = 'spatialite', and optionally check its "
+        "matches against the haversine matcher"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', type=int, default=0, metavar='POINTS',
+                            help="Compare this many random points near geofences with the haversine path")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not is_spatialite(connection):
+            raise CommandError("The default database is not SpatiaLite (django.contrib.gis.db.backends.spatialite)")
+
+        geofences = list(Geofence.objects.all())
+        count = rebuild_shapes(geofences)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} geofence shapes"))
+
+        if options['verify'] and geofences:
+            self.verify(geofences, options['verify'], random.Random(options['seed']))
+
+    def verify(self, geofences, points, rng):
+        matcher = GeofenceMatcher(geofences)
+        mismatches = 0
+        for _ in range(points):
+            geofence = rng.choice(geofences)
+            # Points spread inside, on and beyond the edge
+            distance = (geofence.radius + GEOFENCE_BUFFER_M) * rng.uniform(0, 1.5)
+            bearing = rng.uniform(0, 360)
+            lat, lng = destination(geofence.latitude, geofence.longitude, distance, bearing)
+
+            expected = matcher.match(lat, lng)
+            actual = spatialite_match(lat, lng)
+            if getattr(expected.geofence, 'id', None) != getattr(actual.geofence, 'id', None) or (
+                actual.geofence is None and getattr(expected.nearest, 'id', None) != getattr(actual.nearest, 'id', None)
+            ):
+                mismatches += 1
+                self.stdout.write(self.style.WARNING(
+                    f"({lat:.6f}, {lng:.6f}): haversine {expected.geofence or expected.nearest}, "
+                    f"spatialite {actual.geofence or actual.nearest}"
+                ))
+
+        if mismatches:
+            raise CommandError(f"{mismatches} of {points} points matched differently")
+        self.stdout.write(self.style.SUCCESS(f"All {points} points match the haversine path"))
@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from attendance.trails import seal_idle_chunks, trail_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the storage taken by shift trails, in bytes per point against "
+        "a row per point, optionally compressing idle open chunks first"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seal', action='store_true',
+                            help="Seal (compress) open chunks that have had no point for --idle hours")
+        parser.add_argument('--idle', type=float, default=12.0, metavar='HOURS')
+
+    def handle(self, *args, **options):
+        if options['seal']:
+            sealed = seal_idle_chunks(timezone.now() - timedelta(hours=options['idle']))
+            self.stdout.write(self.style.SUCCESS(f"Sealed {sealed} idle chunks"))
+
+        stats = trail_stats()
+        self.stdout.write(
+            f"{stats['points']} points in {stats['chunks']} chunks ({stats['sealed_chunks']} sealed), "
+            f"{stats['bytes']} bytes"
+        )
+        if not stats['points']:
+            return
+        self.stdout.write(
+            f"{stats['bytes_per_point']} bytes per point, against about {stats['row_bytes_per_point']} "
+            f"for a row per point: {stats['compression_ratio']}x smaller"
+        )
@@ -0,0 +1,197 @@
+from collections import namedtuple
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_M, GEOFENCE_BUFFER_M, bounding_box, equirectangular_tolerance
+from .polygons import prepare_boundary
+
+# geofence/distance: closest geofence containing the point (or None)
+# nearest/nearest_distance: closest geofence center among the fences checked
+GeofenceMatch = namedtuple('GeofenceMatch', ['geofence', 'distance', 'nearest', 'nearest_distance'])
+
+NO_MATCH = GeofenceMatch(None, None, None, None)
+
+
+def nearest_geofence_details(match, lat, lng):
+    """
+    The nearest geofence of an unmatched point, for the error response.
+    A circle reports the distance to its center and the radius required;
+    a polygon has no such radius, so it reports the distance to its edge.
+    """
+    geofence = match.nearest
+    if geofence is None:
+        return None
+    if geofence.is_polygon:
+        return {
+            'name': geofence.name,
+            'distance': prepare_boundary(geofence.boundary).boundary_distance(lat, lng),
+            'boundary': True,
+        }
+    return {
+        'name': geofence.name,
+        'distance': match.nearest_distance,
+        'required_radius': geofence.radius,
+    }
+
+
+class GeofenceMatcher:
+    """
+    Vectorized geofence matching engine.
+
+    Geofence centers and containment limits are held in contiguous arrays so
+    the distances from a point to every fence (or to a subset of rows) are
+    computed in a single NumPy pass instead of a Python loop.
+
+    Containment is tiered: a lat/lng bounding box rejects most fences, an
+    equirectangular approximation settles points clearly inside or outside
+    (see geo.equirectangular_tolerance), and haversine only runs for the few
+    points close to a boundary. Polygon geofences are matched by their
+    enclosing circle first and then by a prepared point-in-polygon test.
+    """
+
+    # Upper bound on the points x geofences distance matrix built at once
+    MAX_BLOCK_SIZE = 1_000_000
+
+    def __init__(self, geofences):
+        self.geofences = list(geofences)
+        self.rows = {geofence.id: row for row, geofence in enumerate(self.geofences)}
+        self.lat = np.radians(np.array([g.latitude for g in self.geofences], dtype=np.float64))
+        self.lng = np.radians(np.array([g.longitude for g in self.geofences], dtype=np.float64))
+        self.cos_lat = np.cos(self.lat)
+        self.limit = np.array([g.radius for g in self.geofences], dtype=np.float64) + GEOFENCE_BUFFER_M
+
+        boxes = [bounding_box(g.latitude, g.longitude, limit) for g, limit in zip(self.geofences, self.limit)]
+        self.half_lat = np.radians(np.array([box[0] for box in boxes], dtype=np.float64))
+        self.half_lng = np.radians(np.array([box[1] for box in boxes], dtype=np.float64))
+
+        # Half width of the band around each boundary the fast path cannot settle
+        tolerances = [equirectangular_tolerance(g.latitude, limit) for g, limit in zip(self.geofences, self.limit)]
+        self.band = np.array([np.inf if t is None else t for t in tolerances], dtype=np.float64) * self.limit
+
+        self.boundaries = {
+            row: prepare_boundary(g.boundary)
+            for row, g in enumerate(self.geofences) if getattr(g, 'boundary', None)
+        }
+
+    def __len__(self):
+        return len(self.geofences)
+
+    def distances(self, lat, lng, rows=None):
+        """Haversine distances in meters from one point to the selected rows"""
+        lat1 = np.radians(lat)
+        lng1 = np.radians(lng)
+        if rows is None:
+            lat2, lng2, cos_lat2 = self.lat, self.lng, self.cos_lat
+        else:
+            lat2, lng2, cos_lat2 = self.lat[rows], self.lng[rows], self.cos_lat[rows]
+
+        a = (np.sin((lat2 - lat1) / 2) ** 2 +
+             np.cos(lat1) * cos_lat2 * np.sin((lng2 - lng1) / 2) ** 2)
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def contains(self, lat, lng, rows):
+        """
+        Tiered containment test for one point against `rows`.
+        Returns (inside mask, approximate distances in meters); distances are
+        only meaningful where the point is inside.
+        """
+        lat1 = np.radians(lat)
+        lng1 = np.radians(lng)
+        lat2 = self.lat[rows]
+        dlat = lat2 - lat1
+        dlng = (self.lng[rows] - lng1 + np.pi) % (2 * np.pi) - np.pi
+
+        # Tier 1: bounding box
+        in_box = (np.abs(dlat) <= self.half_lat[rows]) & (np.abs(dlng) <= self.half_lng[rows])
+        inside = np.zeros(len(rows), dtype=bool)
+        approx = np.full(len(rows), np.inf)
+        if not in_box.any():
+            return inside, approx
+
+        # Tier 2: equirectangular approximation
+        boxed = np.flatnonzero(in_box)
+        x = dlng[boxed] * np.cos((lat1 + lat2[boxed]) / 2)
+        approx[boxed] = EARTH_RADIUS_M * np.sqrt(x * x + dlat[boxed] ** 2)
+        limit = self.limit[rows][boxed]
+        band = self.band[rows][boxed]
+        inside[boxed] = approx[boxed] <= limit - band
+
+        # Tier 3: haversine near the boundary
+        near_edge = boxed[~inside[boxed] & (approx[boxed] <= limit + band)]
+        if len(near_edge):
+            exact = self.distances(lat, lng, rows[near_edge])
+            approx[near_edge] = exact
+            inside[near_edge] = exact <= self.limit[rows[near_edge]]
+
+        # Polygons: the enclosing circle only prefilters
+        if self.boundaries:
+            for i in np.flatnonzero(inside):
+                boundary = self.boundaries.get(int(rows[i]))
+                if boundary is not None:
+                    inside[i] = boundary.contains(lat, lng)
+        return inside, approx
+
+    def match(self, lat, lng, rows=None, nearest=True):
+        """
+        Match one point against every geofence, or only against `rows`
+        (e.g. candidates from the spatial index). When rows are given the
+        nearest geofence is the nearest among them; pass nearest=False to
+        skip that search when only containment matters.
+        """
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.intp)
+        if not len(rows):
+            return NO_MATCH
+
+        nearest_geofence = nearest_distance = None
+        if nearest:
+            distances = self.distances(lat, lng, rows)
+            closest = int(np.argmin(distances))
+            nearest_geofence = self.geofences[rows[closest]]
+            nearest_distance = float(distances[closest])
+
+        inside, approx = self.contains(lat, lng, rows)
+        if not inside.any():
+            return GeofenceMatch(None, None, nearest_geofence, nearest_distance)
+
+        best = rows[int(np.argmin(np.where(inside, approx, np.inf)))]
+        distance = float(self.distances(lat, lng, [best])[0])
+        return GeofenceMatch(self.geofences[best], distance, nearest_geofence, nearest_distance)
+
+    def match_many(self, lats, lngs):
+        """
+        Match many points at once. Returns one GeofenceMatch per point, with
+        the nearest geofence taken over every fence.
+        """
+        lat_deg = np.asarray(lats, dtype=np.float64)
+        lng_deg = np.asarray(lngs, dtype=np.float64)
+        lats = np.radians(lat_deg)
+        lngs = np.radians(lng_deg)
+        if not len(self):
+            return [NO_MATCH] * len(lats)
+
+        results = []
+        block = max(1, self.MAX_BLOCK_SIZE // len(self))
+        for start in range(0, len(lats), block):
+            lat1 = lats[start:start + block, np.newaxis]
+            lng1 = lngs[start:start + block, np.newaxis]
+            a = (np.sin((self.lat - lat1) / 2) ** 2 +
+                 np.cos(lat1) * self.cos_lat * np.sin((self.lng - lng1) / 2) ** 2)
+            distances = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+            nearest = np.argmin(distances, axis=1)
+            inside = distances <= self.limit
+            for row, boundary in self.boundaries.items():
+                for i in np.flatnonzero(inside[:, row]):
+                    inside[i, row] = boundary.contains(lat_deg[start + i], lng_deg[start + i])
+            masked = np.where(inside, distances, np.inf)
+            best = np.argmin(masked, axis=1)
+
+            for i in range(len(distances)):
+                nearest_geofence = self.geofences[nearest[i]]
+                nearest_distance = float(distances[i, nearest[i]])
+                if np.isinf(masked[i, best[i]]):
+                    results.append(GeofenceMatch(None, None, nearest_geofence, nearest_distance))
+                else:
+                    results.append(GeofenceMatch(self.geofences[best[i]], float(distances[i, best[i]]),
+                                                 nearest_geofence, nearest_distance))
+        return results
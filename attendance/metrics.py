@@ -0,0 +1,147 @@
+import bisect
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# (metric name, RequestMetrics attribute, buckets, help)
+HISTOGRAMS = (
+    ('attendance_request_duration_seconds', 'total_time', SECONDS_BUCKETS, 'Total request time'),
+    ('attendance_request_db_seconds', 'db_time', SECONDS_BUCKETS, 'Time spent in database queries'),
+    ('attendance_request_serialize_seconds', 'serialize_time', SECONDS_BUCKETS, 'Time spent rendering the response'),
+    ('attendance_request_queries', 'queries', QUERY_BUCKETS, 'Database queries per request'),
+)
+
+# Measurements of the request being handled; sync_to_async copies the
+# context, so queries an async view runs in a worker thread count too
+current_request = contextvars.ContextVar('attendance_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('start', 'queries', 'db_time', 'serialize_time', 'total_time')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.total_time = 0.0
+
+    def finish(self):
+        self.total_time = time.perf_counter() - self.start
+
+    def server_timing(self):
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f'serialize;dur={self.serialize_time * 1000:.1f}, '
+            f'total;dur={self.total_time * 1000:.1f}'
+        )
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's metrics"""
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # First in the list: connection.execute_wrapper() pops the last one on exit
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class RollingHistogram:
+    """
+    Histogram over the last `window` seconds, kept as `slots` sub-windows
+    that are recycled as time moves on. Observing is one bisect and two
+    additions.
+    """
+
+    def __init__(self, buckets, window, slots):
+        self.buckets = buckets
+        self.slot_length = window / slots
+        self.slots = [[-1, None, 0.0] for _ in range(slots)]
+
+    def observe(self, value, now):
+        epoch = int(now // self.slot_length)
+        slot = self.slots[epoch % len(self.slots)]
+        if slot[0] != epoch:
+            slot[0], slot[1], slot[2] = epoch, [0] * (len(self.buckets) + 1), 0.0
+        slot[1][bisect.bisect_left(self.buckets, value)] += 1
+        slot[2] += value
+
+    def snapshot(self, now):
+        """(cumulative bucket counts ending with +Inf, sum) over the window"""
+        epoch = int(now // self.slot_length)
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for slot_epoch, slot_counts, slot_sum in self.slots:
+            if epoch - len(self.slots) < slot_epoch <= epoch:
+                counts = [a + b for a, b in zip(counts, slot_counts)]
+                total += slot_sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+
+class MetricsRegistry:
+    """
+    Rolling per-route histograms of request time, database time, render
+    time and query count. Kept per process: with several workers each one
+    reports its own traffic.
+    """
+
+    def __init__(self, window=None, slots=10):
+        self.window = window or getattr(settings, 'REQUEST_METRICS_WINDOW', 300)
+        self.slots = slots
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, metrics):
+        now = time.monotonic()
+        with self._lock:
+            histograms = self._routes.get((route, method))
+            if histograms is None:
+                histograms = self._routes[(route, method)] = [
+                    RollingHistogram(buckets, self.window, self.slots) for _, _, buckets, _ in HISTOGRAMS
+                ]
+            for histogram, (_, attribute, _, _) in zip(histograms, HISTOGRAMS):
+                histogram.observe(getattr(metrics, attribute), now)
+
+    def render(self):
+        """The histograms in the Prometheus text exposition format"""
+        now = time.monotonic()
+        with self._lock:
+            snapshots = {key: [h.snapshot(now) for h in histograms] for key, histograms in self._routes.items()}
+
+        lines = []
+        for position, (name, _, buckets, description) in enumerate(HISTOGRAMS):
+            lines.append(f'# HELP {name} {description} over the last {self.window} seconds.')
+            lines.append(f'# TYPE {name} histogram')
+            for (route, method), histograms in sorted(snapshots.items()):
+                counts, total = histograms[position]
+                labels = f'route="{route}",method="{method}"'
+                for bound, count in zip((*buckets, '+Inf'), counts):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {counts[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = MetricsRegistry()
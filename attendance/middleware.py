@@ -1,30 +1,57 @@
 #attendance/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.utils import timezone
+from .log_writer import login_log_writer
+from .metrics import RequestMetrics, current_request, request_metrics
 from .models import LoginLog
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 class LoginLoggingMiddleware:
+    # Runs natively in both stacks so async views on ASGI stay async
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
     
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
-        
+        self.log_login(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self.is_login(request, response):
+            # request.user may still need a database read
+            await sync_to_async(self.log_login)(request, response)
+        return response
+
+    def is_login(self, request, response):
+        return request.path == '/api/login/' and response.status_code == 200
+
+    def log_login(self, request, response):
         # Log successful logins
-        if request.path == '/api/login/' and response.status_code == 200:
+        if self.is_login(request, response):
             try:
                 if request.user.is_authenticated:
-                    LoginLog.objects.create(
+                    # Written in batches by a background thread
+                    login_log_writer.log(LoginLog(
                         user=request.user,
+                        login_time=timezone.now(),
                         ip_address=self.get_client_ip(request),
                         user_agent=request.META.get('HTTP_USER_AGENT', '')
-                    )
+                    ))
             except Exception as e:
                 logger.error(f"Failed to log login: {str(e)}")
-        
-        return response
     
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -32,4 +59,65 @@ class LoginLoggingMiddleware:
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request: query count, database time, response rendering
+    and total time. Sent back in a Server-Timing header and added to the
+    per-route histograms behind the metrics endpoint. Should sit first in
+    MIDDLEWARE so the total covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook
+        metrics = current_request.get()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.serialize_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        metrics.finish()
+        match = getattr(request, 'resolver_match', None)
+        # The URL pattern, not the path, keeps the number of series bounded
+        route = f'/{match.route}' if match is not None else 'unmatched'
+        request_metrics.observe(route, request.method, metrics)
+        if self.server_timing:
+            response['Server-Timing'] = metrics.server_timing()
+        return response
@@ -0,0 +1,38 @@
+# Generated by Django 4.2 on 2026-10-18 04:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0006_attendance_is_auto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='geofence',
+            name='boundary',
+            field=models.TextField(blank=True, help_text='Polygon as GeoJSON or WKT (lng/lat). Leave empty for a circular geofence', null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='max_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='max_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='min_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='min_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+    ]
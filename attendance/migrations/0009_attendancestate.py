@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-18 04:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_attendance_state(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    AttendanceState = apps.get_model('attendance', 'AttendanceState')
+
+    latest = {}
+    for attendance in Attendance.objects.order_by('user_id', 'timestamp', 'id').iterator(chunk_size=2000):
+        latest[attendance.user_id] = attendance
+
+    AttendanceState.objects.bulk_create([
+        AttendanceState(
+            user_id=user_id,
+            is_clocked_in=attendance.type == 'clock-in',
+            last_attendance_id=attendance.id,
+            last_action=attendance.type,
+            last_action_time=attendance.timestamp,
+            geofence_id=attendance.geofence_id,
+        )
+        for user_id, attendance in latest.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('attendance', '0008_alter_attendance_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='attendance_state', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('is_clocked_in', models.BooleanField(default=False)),
+                ('last_action', models.CharField(blank=True, choices=[('clock-in', 'Clock In'), ('clock-out', 'Clock Out')], max_length=20, null=True)),
+                ('last_action_time', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('geofence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='attendance.geofence')),
+                ('last_attendance', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='attendance.attendance')),
+            ],
+        ),
+        migrations.RunPython(backfill_attendance_state, migrations.RunPython.noop),
+    ]
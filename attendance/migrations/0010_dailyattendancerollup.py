@@ -0,0 +1,54 @@
+# Generated by Django 4.2 on 2026-10-18 04:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_rollups(apps, schema_editor):
+    Attendance = apps.get_model('attendance', 'Attendance')
+    DailyAttendanceRollup = apps.get_model('attendance', 'DailyAttendanceRollup')
+
+    rows = Attendance.objects.annotate(day=TruncDate('timestamp')).values('day', 'geofence_id', 'user_id').annotate(
+        clock_ins=Count('id', filter=Q(type='clock-in')),
+        clock_outs=Count('id', filter=Q(type='clock-out')),
+        auto_clock_outs=Count('id', filter=Q(type='clock-out', is_auto=True)),
+    ).order_by()
+    DailyAttendanceRollup.objects.bulk_create(
+        (DailyAttendanceRollup(**row) for row in rows.iterator(chunk_size=2000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('attendance', '0009_attendancestate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('clock_ins', models.PositiveIntegerField(default=0)),
+                ('clock_outs', models.PositiveIntegerField(default=0)),
+                ('auto_clock_outs', models.PositiveIntegerField(default=0)),
+                ('geofence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='attendance.geofence')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyattendancerollup',
+            index=models.Index(fields=['day', 'geofence'], name='attendance__day_efb51b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyattendancerollup',
+            constraint=models.UniqueConstraint(fields=('day', 'geofence', 'user'), name='unique_daily_rollup'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0010_dailyattendancerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['timestamp', 'id'], name='attendance__timesta_cdf7e8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='attendance__user_id_cbbd1b_idx'),
+        ),
+    ]
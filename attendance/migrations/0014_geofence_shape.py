@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Frozen copy of the shape table DDL in attendance/spatialite.py. The table
+# starts empty: `manage.py sync_geofence_shapes` loads the geofences.
+SHAPE_TABLE = 'attendance_geofence_shape'
+
+
+def create_shape_table(apps, schema_editor):
+    # Only SpatiaLite databases get the geometry table
+    if not getattr(schema_editor.connection.ops, 'spatialite', False):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {SHAPE_TABLE} (geofence_id integer NOT NULL PRIMARY KEY)")
+        cursor.execute("SELECT COUNT(*) FROM geometry_columns WHERE f_table_name = %s", [SHAPE_TABLE])
+        if cursor.fetchone()[0]:
+            return
+        cursor.execute(f"SELECT AddGeometryColumn('{SHAPE_TABLE}', 'area', 4326, 'GEOMETRY', 'XY')")
+        cursor.execute(f"SELECT AddGeometryColumn('{SHAPE_TABLE}', 'center', 4326, 'POINT', 'XY')")
+        cursor.execute(f"SELECT CreateSpatialIndex('{SHAPE_TABLE}', 'area')")
+        cursor.execute(f"SELECT CreateSpatialIndex('{SHAPE_TABLE}', 'center')")
+
+
+def drop_shape_table(apps, schema_editor):
+    if not getattr(schema_editor.connection.ops, 'spatialite', False):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for column in ('area', 'center'):
+            cursor.execute(f"SELECT DisableSpatialIndex('{SHAPE_TABLE}', '{column}')")
+            cursor.execute(f"DROP TABLE IF EXISTS idx_{SHAPE_TABLE}_{column}")
+            cursor.execute(f"SELECT DiscardGeometryColumn('{SHAPE_TABLE}', '{column}')")
+        cursor.execute(f"DROP TABLE IF EXISTS {SHAPE_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0013_geocodedlocation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_shape_table, drop_shape_table),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 04:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('attendance', '0015_locationping'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationTrail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('sealed', models.BooleanField(default=False)),
+                ('last_latitude', models.BigIntegerField(default=0)),
+                ('last_longitude', models.BigIntegerField(default=0)),
+                ('last_time', models.BigIntegerField(default=0)),
+                ('attendance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trail_chunks', to='attendance.attendance')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trail_chunks', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='locationtrail',
+            constraint=models.UniqueConstraint(fields=('attendance', 'sequence'), name='unique_trail_chunk'),
+        ),
+    ]
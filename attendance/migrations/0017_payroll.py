@@ -0,0 +1,79 @@
+# Generated by Django 4.2 on 2026-10-18 04:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('attendance', '0016_locationtrail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_user_id', models.IntegerField()),
+                ('last_user_id', models.IntegerField()),
+                ('users', models.PositiveIntegerField()),
+                ('events', models.PositiveIntegerField()),
+                ('worker', models.CharField(max_length=50)),
+                ('elapsed', models.FloatField(help_text='Seconds the worker spent on the chunk')),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PayrollEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hours', models.DecimalField(decimal_places=2, max_digits=8)),
+                ('shifts', models.PositiveIntegerField(default=0)),
+                ('auto_clock_outs', models.PositiveIntegerField(default=0)),
+                ('unmatched_clock_ins', models.PositiveIntegerField(default=0)),
+                ('unmatched_clock_outs', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='running', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='payrollrun',
+            constraint=models.UniqueConstraint(fields=('period_start', 'period_end'), name='unique_payroll_period'),
+        ),
+        migrations.AddField(
+            model_name='payrollentry',
+            name='chunk',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='attendance.payrollchunk'),
+        ),
+        migrations.AddField(
+            model_name='payrollentry',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='attendance.payrollrun'),
+        ),
+        migrations.AddField(
+            model_name='payrollentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='payrollchunk',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='attendance.payrollrun'),
+        ),
+        migrations.AddConstraint(
+            model_name='payrollentry',
+            constraint=models.UniqueConstraint(fields=('run', 'user'), name='unique_payroll_entry'),
+        ),
+    ]
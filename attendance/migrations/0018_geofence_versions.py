@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 04:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def version_existing_geofences(apps, schema_editor):
+    # Existing geofences all become version 1, what a first full fetch returns
+    Geofence = apps.get_model('attendance', 'Geofence')
+    GeofenceSetVersion = apps.get_model('attendance', 'GeofenceSetVersion')
+    db = schema_editor.connection.alias
+    has_geofences = Geofence.objects.using(db).exists()
+    GeofenceSetVersion.objects.using(db).create(pk=1, version=1 if has_geofences else 0)
+    Geofence.objects.using(db).update(version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0017_payroll'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeofenceSetVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('pruned_version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GeofenceTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geofence_id', models.IntegerField()),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='geofence',
+            name='version',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(version_existing_geofences, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,73 @@
-from django.db import models
+from django.db import models, router, transaction
+from django.utils import timezone
 from users.models import User
+from .polygons import describe_boundary, parse_boundary
 
 class Geofence(models.Model):
     name = models.CharField(max_length=255)
     latitude = models.FloatField()
     longitude = models.FloatField()
     radius = models.FloatField(help_text="Radius in meters")
+    boundary = models.TextField(
+        null=True, blank=True,
+        help_text="Polygon as GeoJSON or WKT (lng/lat). Leave empty for a circular geofence"
+    )
+    # Cached bounding box of the polygon, empty for circular geofences
+    min_latitude = models.FloatField(null=True, blank=True, editable=False)
+    min_longitude = models.FloatField(null=True, blank=True, editable=False)
+    max_latitude = models.FloatField(null=True, blank=True, editable=False)
+    max_longitude = models.FloatField(null=True, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='geofences')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Geofence set version of the last change (see versioning.py)
+    version = models.BigIntegerField(default=0, db_index=True, editable=False)
     
     def __str__(self):
         return self.name
+
+    @property
+    def is_polygon(self):
+        return bool(self.boundary)
+
+    def save(self, *args, **kwargs):
+        # Polygons keep latitude/longitude/radius as their enclosing circle so
+        # the circular lookup path can prefilter them
+        if self.boundary:
+            for field, value in describe_boundary(parse_boundary(self.boundary)).items():
+                setattr(self, field, value)
+        else:
+            self.boundary = None
+            self.min_latitude = self.min_longitude = None
+            self.max_latitude = self.max_longitude = None
+
+        from .versioning import next_geofence_version
+
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        # The version and the change commit together
+        with transaction.atomic(using=using):
+            self.version = next_geofence_version(using)
+            super().save(*args, **kwargs)
+
+
+class GeofenceSetVersion(models.Model):
+    """Single row: the current geofence set version, and how far tombstones were pruned"""
+    version = models.BigIntegerField(default=0)
+    pruned_version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Geofence set version {self.version}"
+
+
+class GeofenceTombstone(models.Model):
+    """A deleted geofence, so delta fetches can report it"""
+    geofence_id = models.IntegerField()
+    version = models.BigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Geofence {self.geofence_id} deleted at version {self.version}"
     
 
 
@@ -22,20 +79,198 @@ class Attendance(models.Model):
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendances')
     geofence = models.ForeignKey(Geofence, on_delete=models.CASCADE, related_name='attendances', null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Defaults to now, but replayed offline events keep their original time
+    timestamp = models.DateTimeField(default=timezone.now)
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     latitude = models.FloatField()
     longitude = models.FloatField()
     is_auto = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.type} at {self.timestamp}"
+
+
+class AttendanceState(models.Model):
+    """
+    Current clock state of a user, one row per user. Updated in the same
+    transaction as every attendance write, so reading it replaces looking up
+    the user's latest Attendance row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='attendance_state')
+    is_clocked_in = models.BooleanField(default=False)
+    last_attendance = models.ForeignKey(Attendance, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_action = models.CharField(max_length=20, choices=Attendance.TYPE_CHOICES, null=True, blank=True)
+    last_action_time = models.DateTimeField(null=True, blank=True)
+    geofence = models.ForeignKey(Geofence, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {'clocked in' if self.is_clocked_in else 'clocked out'}"
     
 
 
 
 
+class LocationPing(models.Model):
+    """
+    A location reported by a clocked-in phone. Written in batches by
+    log_writer.location_ping_writer; `geofence` and `distance` refer to the
+    geofence the user was clocked in at when the ping arrived.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='location_pings')
+    geofence = models.ForeignKey(Geofence, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    accuracy = models.FloatField(null=True, blank=True, help_text="Reported accuracy in meters")
+    distance = models.FloatField(null=True, blank=True, help_text="Meters from the geofence center")
+    timestamp = models.DateTimeField()
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} at ({self.latitude}, {self.longitude}) {self.timestamp}"
+
+
+class LocationTrail(models.Model):
+    """
+    A chunk of the movement trail of one shift, identified by its clock-in.
+    Points are delta-encoded into `data` (see trails.py); the last chunk
+    of a shift stays open for appends, full chunks are sealed and
+    compressed.
+    """
+    attendance = models.ForeignKey(Attendance, on_delete=models.CASCADE, related_name='trail_chunks')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='trail_chunks')
+    sequence = models.PositiveIntegerField()
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    point_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+    sealed = models.BooleanField(default=False)
+    # Last encoded point, what the next appended delta is taken from
+    last_latitude = models.BigIntegerField(default=0)
+    last_longitude = models.BigIntegerField(default=0)
+    last_time = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['attendance', 'sequence'], name='unique_trail_chunk'),
+        ]
+
+    def __str__(self):
+        return f"Trail of {self.attendance_id} #{self.sequence}: {self.point_count} points"
+
+
+class DailyAttendanceRollup(models.Model):
+    """
+    Attendance counts per day, geofence and user. Maintained incrementally by
+    the attendance write path; `manage.py rebuild_attendance_rollups`
+    recomputes it from the raw Attendance table.
+    """
+    day = models.DateField()
+    geofence = models.ForeignKey(Geofence, on_delete=models.CASCADE, related_name='daily_rollups', null=True, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    clock_ins = models.PositiveIntegerField(default=0)
+    clock_outs = models.PositiveIntegerField(default=0)
+    auto_clock_outs = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'geofence', 'user'], name='unique_daily_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'geofence']),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.geofence_id} on {self.day}: {self.clock_ins} in / {self.clock_outs} out"
+
+
+class PayrollRun(models.Model):
+    """
+    Shift totals of every active user over a pay period, computed by
+    `manage.py run_payroll` in chunks of users. A run that stopped part-way
+    is resumed: users with an entry are not computed again.
+    """
+    STATUS_CHOICES = (
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    )
+
+    period_start = models.DateField()
+    period_end = models.DateField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period_start', 'period_end'], name='unique_payroll_period'),
+        ]
+
+    def __str__(self):
+        return f"Payroll {self.period_start} to {self.period_end} ({self.status})"
+
+
+class PayrollChunk(models.Model):
+    """Checkpoint of one chunk of users, written in the same transaction as their entries"""
+    run = models.ForeignKey(PayrollRun, on_delete=models.CASCADE, related_name='chunks')
+    first_user_id = models.IntegerField()
+    last_user_id = models.IntegerField()
+    users = models.PositiveIntegerField()
+    events = models.PositiveIntegerField()
+    worker = models.CharField(max_length=50)
+    elapsed = models.FloatField(help_text="Seconds the worker spent on the chunk")
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.run_id}: users {self.first_user_id}-{self.last_user_id}"
+
+
+class PayrollEntry(models.Model):
+    run = models.ForeignKey(PayrollRun, on_delete=models.CASCADE, related_name='entries')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payroll_entries')
+    chunk = models.ForeignKey(PayrollChunk, on_delete=models.CASCADE, related_name='entries')
+    hours = models.DecimalField(max_digits=8, decimal_places=2)
+    shifts = models.PositiveIntegerField(default=0)
+    auto_clock_outs = models.PositiveIntegerField(default=0)
+    unmatched_clock_ins = models.PositiveIntegerField(default=0)
+    unmatched_clock_outs = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'user'], name='unique_payroll_entry'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.hours}h in run {self.run_id}"
+
+
+class GeocodedLocation(models.Model):
+    """
+    Persistent reverse-geocoding cache. Coordinates are rounded (see
+    REVERSE_GEOCODING_PRECISION) so nearby points share one provider call.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    address = models.TextField(blank=True)
+    provider = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key}: {self.address}"
+
+
 class Complaint(models.Model):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
@@ -56,7 +291,8 @@ class Complaint(models.Model):
 
 class LoginLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='login_logs')
-    login_time = models.DateTimeField(auto_now_add=True)
+    # Set when the login happens, the row itself may be written later in a batch
+    login_time = models.DateTimeField(default=timezone.now)
     logout_time = models.DateTimeField(null=True, blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(null=True, blank=True)
@@ -0,0 +1,108 @@
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over (timestamp, id), newest first.
+
+    Cursors are opaque tokens holding the (timestamp, id) of the row a page
+    starts after, so every page is a single indexed range scan and deep
+    pages cost the same as the first one, unlike OFFSET pagination.
+    """
+    page_size = 50
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def encode_cursor(self, row, reverse=False):
+        # Rows are model instances, or dicts in lean mode
+        timestamp, pk = (row['timestamp'], row['id']) if isinstance(row, dict) else (row.timestamp, row.pk)
+        token = f"{timestamp.isoformat()}|{pk}|{int(reverse)}"
+        cursor = base64.urlsafe_b64encode(token.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            timestamp, pk, reverse = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None:
+                raise ValueError
+            return timestamp, int(pk), reverse == '1'
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = remove_query_param(request.build_absolute_uri(), self.cursor_query_param)
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        reverse = False
+        if cursor is None:
+            queryset = queryset.order_by('-timestamp', '-id')
+        else:
+            timestamp, pk, reverse = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+                ).order_by('timestamp', 'id')
+            else:
+                queryset = queryset.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+                ).order_by('-timestamp', '-id')
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Moving backwards there is always a next page, moving forwards there
+        # is a previous page whenever we did not start from the top
+        has_next = has_more if not reverse else True
+        has_previous = has_more if reverse else cursor is not None
+
+        self.next_link = self.encode_cursor(rows[-1]) if rows and has_next else None
+        self.previous_link = self.encode_cursor(rows[0], reverse=True) if rows and has_previous else None
+        return rows
+
+    def get_next_link(self):
+        return self.next_link
+
+    def get_previous_link(self):
+        return self.previous_link
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
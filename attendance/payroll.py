@@ -0,0 +1,164 @@
+"""
+Parallel, resumable payroll runs.
+
+The active users still missing an entry in the run are split into chunks
+of user ids. Each chunk's shift totals are computed from Attendance by a
+worker process with the timesheet query (timesheets.py), reading only.
+The parent writes every finished chunk's entries in one transaction,
+together with its PayrollChunk checkpoint. A run that crashes keeps its
+finished chunks, and running it again only computes the users left.
+"""
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+import django
+from django.db import connections, transaction
+from django.utils import timezone
+
+from users.models import User
+from .models import PayrollChunk, PayrollEntry, PayrollRun
+from .services import retry_on_lock
+from .timesheets import Timesheet
+
+TOTAL_FIELDS = ('seconds', 'shifts', 'auto_clock_outs', 'unmatched_clock_ins', 'unmatched_clock_outs')
+
+ChunkResult = namedtuple('ChunkResult', ['user_ids', 'totals', 'events', 'worker', 'elapsed'])
+
+
+def setup_worker():
+    # Spawned workers start without Django set up; for forked ones this is a no-op
+    django.setup()
+
+
+def compute_chunk(period_start, period_end, user_ids):
+    """Shift totals per user of one chunk; runs in a worker process"""
+    started = time.perf_counter()
+    tz = timezone.get_current_timezone()
+    timesheet = Timesheet(
+        timezone.make_aware(datetime.combine(period_start, dt_time.min), tz),
+        timezone.make_aware(datetime.combine(period_end + timedelta(days=1), dt_time.min), tz),
+        user_ids=user_ids,
+    ).compute()
+
+    totals = {user_id: dict.fromkeys(TOTAL_FIELDS, 0) for user_id in user_ids}
+    for (day, geofence_id, user_id), row in timesheet.rows.items():
+        user_totals = totals[user_id]
+        for field in TOTAL_FIELDS:
+            user_totals[field] += row[field]
+    return ChunkResult(user_ids, totals, timesheet.events_read, f'pid {os.getpid()}', time.perf_counter() - started)
+
+
+@retry_on_lock
+def save_chunk(run, result):
+    """Write a chunk's entries and its checkpoint, all or nothing"""
+    with transaction.atomic():
+        chunk = PayrollChunk.objects.create(
+            run=run, first_user_id=result.user_ids[0], last_user_id=result.user_ids[-1],
+            users=len(result.user_ids), events=result.events, worker=result.worker, elapsed=result.elapsed,
+        )
+        PayrollEntry.objects.bulk_create([
+            PayrollEntry(
+                run=run, user_id=user_id, chunk=chunk,
+                hours=Decimal(totals['seconds'] / 3600).quantize(Decimal('0.01')),
+                shifts=totals['shifts'],
+                auto_clock_outs=totals['auto_clock_outs'],
+                unmatched_clock_ins=totals['unmatched_clock_ins'],
+                unmatched_clock_outs=totals['unmatched_clock_outs'],
+            )
+            for user_id, totals in result.totals.items()
+        ])
+    return chunk
+
+
+class PayrollRunner:
+    """
+    Computes a pay period with `workers` processes (0 computes the chunks in
+    this process), `chunk_size` users at a time. A dry run computes the same
+    chunks without writing anything.
+    """
+
+    def __init__(self, period_start, period_end, workers=None, chunk_size=250, dry_run=False):
+        self.period_start = period_start
+        self.period_end = period_end
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+
+    def get_run(self, restart=False):
+        """The period's run, created unless this is a dry run; a restart drops what it has"""
+        if self.dry_run:
+            return PayrollRun.objects.filter(period_start=self.period_start, period_end=self.period_end).first()
+        run, created = PayrollRun.objects.get_or_create(period_start=self.period_start, period_end=self.period_end)
+        if restart and not created:
+            with transaction.atomic():
+                run.chunks.all().delete()
+                run.status = 'running'
+                run.completed_at = None
+                run.save(update_fields=['status', 'completed_at'])
+        return run
+
+    def pending_users(self, run):
+        users = User.objects.filter(is_active=True)
+        if run is not None:
+            users = users.exclude(payroll_entries__run=run)
+        return list(users.order_by('id').values_list('id', flat=True))
+
+    def chunks(self, user_ids):
+        return [user_ids[i:i + self.chunk_size] for i in range(0, len(user_ids), self.chunk_size)]
+
+    def execute(self, chunks):
+        """Yield ChunkResults as chunks finish"""
+        if self.workers < 1:
+            for user_ids in chunks:
+                yield compute_chunk(self.period_start, self.period_end, user_ids)
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=setup_worker)
+        try:
+            futures = [
+                executor.submit(compute_chunk, self.period_start, self.period_end, user_ids)
+                for user_ids in chunks
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # On failure, stop without computing chunks nobody will save
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, run=None, on_chunk=None):
+        """Compute and save the pending chunks of `run`; returns the ChunkResults"""
+        results = []
+        for result in self.execute(self.chunks(self.pending_users(run))):
+            if not self.dry_run:
+                save_chunk(run, result)
+            results.append(result)
+            if on_chunk:
+                on_chunk(result)
+
+        if not self.dry_run and run.status != 'completed':
+            run.status = 'completed'
+            run.completed_at = timezone.now()
+            run.save(update_fields=['status', 'completed_at'])
+        return results
+
+
+def worker_throughput(results):
+    """Chunks, users, events and rates per worker, from the time each spent computing"""
+    workers = {}
+    for result in results:
+        stats = workers.setdefault(result.worker, {'chunks': 0, 'users': 0, 'events': 0, 'busy': 0.0})
+        stats['chunks'] += 1
+        stats['users'] += len(result.user_ids)
+        stats['events'] += result.events
+        stats['busy'] += result.elapsed
+    for stats in workers.values():
+        busy = stats['busy'] or float('inf')
+        stats['users_per_second'] = round(stats['users'] / busy, 1)
+        stats['events_per_second'] = round(stats['events'] / busy)
+    return workers
@@ -0,0 +1,108 @@
+import functools
+import math
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSException, GEOSGeometry, LineString, Point
+
+from .geo import haversine_distance
+
+POLYGON_TYPES = ('Polygon', 'MultiPolygon')
+
+
+def parse_boundary(boundary):
+    """
+    Parse a GeoJSON or WKT polygon (longitude/latitude order, WGS84).
+    Raises ValueError for anything that is not a valid (multi)polygon.
+    """
+    try:
+        geometry = GEOSGeometry(boundary, srid=4326)
+    except (GEOSException, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid boundary: {str(e)}")
+
+    if geometry.geom_type not in POLYGON_TYPES:
+        raise ValueError(f"Boundary must be a Polygon or MultiPolygon, got {geometry.geom_type}")
+    if not geometry.valid:
+        raise ValueError(f"Invalid boundary: {geometry.valid_reason}")
+    return geometry
+
+
+def describe_boundary(geometry):
+    """
+    Values cached on a polygon geofence: its centroid, the radius of a circle
+    around the centroid enclosing every vertex, and the bounding box.
+    """
+    centroid = geometry.centroid
+    hull = geometry.convex_hull
+    vertices = hull.coords[0] if hull.geom_type == 'Polygon' else hull.coords
+    radius = max(haversine_distance(centroid.y, centroid.x, lat, lng) for lng, lat in vertices)
+    min_lng, min_lat, max_lng, max_lat = geometry.extent
+    return {
+        'latitude': centroid.y,
+        'longitude': centroid.x,
+        # Edges are straight in lat/lng space, leave a little slack for curvature
+        'radius': radius * 1.01 + 1,
+        'min_latitude': min_lat,
+        'min_longitude': min_lng,
+        'max_latitude': max_lat,
+        'max_longitude': max_lng,
+    }
+
+
+class PreparedBoundary:
+    """
+    Point-in-polygon test against a polygon geofence.
+
+    Large polygons are simplified once, then wrapped in a GEOS prepared
+    geometry so repeated containment checks reuse its internal index. The
+    cached bounding box rejects far away points before GEOS is called.
+    """
+
+    def __init__(self, geometry):
+        threshold = getattr(settings, 'GEOFENCE_POLYGON_SIMPLIFY_THRESHOLD', 500)
+        if geometry.num_coords > threshold:
+            simplified = geometry.simplify(
+                getattr(settings, 'GEOFENCE_POLYGON_SIMPLIFY_TOLERANCE', 0.00001),
+                preserve_topology=True,
+            )
+            if simplified.geom_type in POLYGON_TYPES and not simplified.empty:
+                geometry = simplified
+
+        self.geometry = geometry
+        self.num_coords = geometry.num_coords
+        self.min_lng, self.min_lat, self.max_lng, self.max_lat = geometry.extent
+        self.prepared = geometry.prepared
+        # Build the prepared geometry's index now rather than on the first request
+        self.prepared.covers(geometry.centroid)
+
+    def contains(self, lat, lng):
+        if not (self.min_lat <= lat <= self.max_lat and self.min_lng <= lng <= self.max_lng):
+            return False
+        return self.prepared.covers(Point(lng, lat, srid=4326))
+
+    def rings(self):
+        polygons = [self.geometry] if self.geometry.geom_type == 'Polygon' else list(self.geometry)
+        for polygon in polygons:
+            yield from polygon
+
+    def boundary_distance(self, lat, lng):
+        """
+        Meters from the point to the nearest edge of the polygon (outer ring
+        or hole). The nearest edge point is found with longitudes scaled by
+        cos(lat), so it is exact up to the curvature across the polygon.
+        """
+        scale = math.cos(math.radians(lat))
+        point = Point(lng * scale, lat)
+        distance = None
+        for ring in self.rings():
+            scaled = LineString([(x * scale, y) for x, y in ring.coords])
+            nearest = scaled.interpolate(scaled.project(point))
+            ring_distance = haversine_distance(lat, lng, nearest.y, nearest.x / scale)
+            if distance is None or ring_distance < distance:
+                distance = ring_distance
+        return distance
+
+
+@functools.lru_cache(maxsize=4096)
+def prepare_boundary(boundary):
+    """Parse, simplify and prepare a boundary once per process"""
+    return PreparedBoundary(parse_boundary(boundary))
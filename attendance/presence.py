@@ -0,0 +1,150 @@
+"""
+Server-side exit detection from location pings.
+
+While a user is clocked in, every ping is checked against the one geofence
+they clocked in at, a constant-time test against the cached index entry.
+A small tracker per user, kept in the cache so every worker sees it, moves
+between two states:
+
+- inside: the last usable ping was inside the geofence, or in the
+  hysteresis band just outside it
+- leaving: pings have been clearly outside (beyond the exit margin, after
+  allowing for their reported accuracy) since `outside_since`
+
+A ping back inside the geofence returns the tracker to inside; pings in the
+band keep whatever state it is in, so a phone hovering at the edge does not
+flap. Once the user has been leaving for the dwell time, over at least
+GEOFENCE_EXIT_MIN_PINGS pings, they are clocked out automatically
+(is_auto=True) at the time and place of the first outside ping.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .geo import haversine_distance
+from .models import LocationPing
+from .polygons import prepare_boundary
+from .services import AttendanceSequenceError, get_attendance_state, record_attendance
+from .spatial_index import get_geofence_index
+
+logger = logging.getLogger(__name__)
+
+# Tracker states, and what process() reports when there is no tracker
+INSIDE = 'inside'
+LEAVING = 'leaving'
+CLOCKED_OUT = 'clocked-out'
+NOT_CLOCKED_IN = 'not-clocked-in'
+UNTRACKED = 'untracked'  # Clocked in at a geofence that no longer exists
+
+# Where a ping lies: pings in the band between the containment limit and
+# limit + margin keep the current state
+BAND = 'band'
+OUTSIDE = 'outside'
+
+
+def tracker_key(user_id):
+    return f'attendance:presence:{user_id}'
+
+
+class ExitDetector:
+    """Exit detection settings, and the tracker update for a batch of pings"""
+
+    def __init__(self, margin=None, dwell=None, min_pings=None, max_accuracy=None):
+        self.margin = margin if margin is not None else getattr(settings, 'GEOFENCE_EXIT_MARGIN_M', 25)
+        self.dwell = dwell if dwell is not None else getattr(settings, 'GEOFENCE_EXIT_DWELL_SECONDS', 120)
+        self.min_pings = min_pings or getattr(settings, 'GEOFENCE_EXIT_MIN_PINGS', 2)
+        self.max_accuracy = max_accuracy or getattr(settings, 'LOCATION_PING_MAX_ACCURACY_M', 100)
+        self.tracker_ttl = getattr(settings, 'GEOFENCE_EXIT_TRACKER_TTL', 24 * 60 * 60)
+
+    def classify(self, entry, lat, lng, accuracy):
+        """(INSIDE, BAND or OUTSIDE, distance from the center) of a ping against an indexed geofence"""
+        distance = haversine_distance(lat, lng, entry.latitude, entry.longitude)
+        if entry.geofence.boundary:
+            inside = prepare_boundary(entry.geofence.boundary).contains(lat, lng)
+        else:
+            inside = distance <= entry.limit
+        if inside:
+            return INSIDE, distance
+        # Clearly outside only when even the near edge of the accuracy circle
+        # is beyond the margin (for polygons, the margin around their enclosing circle)
+        return (OUTSIDE if distance - accuracy > entry.limit + self.margin else BAND), distance
+
+    def new_tracker(self, state):
+        return {'attendance': state.last_attendance_id, 'state': INSIDE, 'last_timestamp': None,
+                'outside_since': None, 'outside_pings': 0, 'exit': None}
+
+    def process(self, user, pings):
+        """
+        Queue `pings` (validated dicts with latitude, longitude, timestamp and
+        optional accuracy) for writing, to the shift's trail or as rows per
+        LOCATION_PING_STORAGE, and run them through the user's tracker.
+        Costs one state read and one cache round trip per call, plus the
+        clock-out write when an exit is confirmed.
+
+        Returns (state, auto clock-out Attendance or None).
+        """
+        from .log_writer import location_ping_writer, trail_writer
+        from .trails import TrailPoint
+
+        storage = getattr(settings, 'LOCATION_PING_STORAGE', 'trail')
+        state = get_attendance_state(user)
+        entry = get_geofence_index().get(state.geofence_id) if state.is_clocked_in else None
+        key = tracker_key(user.pk)
+        tracker = cache.get(key) if entry is not None else None
+        if tracker is None or tracker['attendance'] != state.last_attendance_id:
+            tracker = self.new_tracker(state)
+
+        confirmed = False
+        for ping in sorted(pings, key=lambda ping: ping['timestamp']):
+            lat, lng, timestamp = ping['latitude'], ping['longitude'], ping['timestamp']
+            accuracy = ping.get('accuracy') or 0.0
+            position = distance = None
+            if entry is not None:
+                position, distance = self.classify(entry, lat, lng, accuracy)
+            # The clock-in is gone when its geofence was deleted, only rows can keep the ping
+            in_shift = (state.is_clocked_in and state.last_attendance_id is not None and
+                        timestamp > state.last_action_time)
+            if in_shift and storage != 'rows':
+                trail_writer.log(TrailPoint(state.last_attendance_id, user.pk, lat, lng, timestamp))
+            if not in_shift or storage != 'trail':
+                location_ping_writer.log(LocationPing(
+                    user=user, geofence_id=entry.id if entry is not None else None, latitude=lat, longitude=lng,
+                    accuracy=ping.get('accuracy'), distance=distance, timestamp=timestamp,
+                ))
+
+            # Only accurate pings taken since the clock-in, in order, move the tracker
+            if entry is None or confirmed or accuracy > self.max_accuracy or timestamp <= state.last_action_time:
+                continue
+            if tracker['last_timestamp'] is not None and timestamp <= tracker['last_timestamp']:
+                continue
+            tracker['last_timestamp'] = timestamp
+
+            if position == INSIDE:
+                tracker.update(state=INSIDE, outside_since=None, outside_pings=0, exit=None)
+            elif position == OUTSIDE:
+                if tracker['state'] != LEAVING:
+                    tracker.update(state=LEAVING, outside_since=timestamp, outside_pings=0,
+                                   exit={'latitude': lat, 'longitude': lng})
+                tracker['outside_pings'] += 1
+                confirmed = (tracker['outside_pings'] >= self.min_pings and
+                             (timestamp - tracker['outside_since']).total_seconds() >= self.dwell)
+
+        if entry is None:
+            cache.delete(key)
+            return (UNTRACKED if state.is_clocked_in else NOT_CLOCKED_IN), None
+        if not confirmed:
+            cache.set(key, tracker, timeout=self.tracker_ttl)
+            return tracker['state'], None
+
+        cache.delete(key)
+        try:
+            attendance = record_attendance(
+                user, 'clock-out', entry.geofence, tracker['exit']['latitude'], tracker['exit']['longitude'],
+                is_auto=True, timestamp=tracker['outside_since'],
+            )
+        except AttendanceSequenceError:
+            # Clocked out by another request in the meantime
+            return CLOCKED_OUT, None
+        logger.info(f"Automatic clock-out: user {user.pk} left {entry.geofence.name} at {tracker['outside_since']}")
+        return CLOCKED_OUT, attendance
@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Attendance, DailyAttendanceRollup
+
+
+def _counts(attendances):
+    """Per (day, geofence, user) counters for the given attendance records"""
+    counts = {}
+    for attendance in attendances:
+        key = (timezone.localdate(attendance.timestamp), attendance.geofence_id, attendance.user_id)
+        counter = counts.setdefault(key, Counter())
+        if attendance.type == 'clock-in':
+            counter['clock_ins'] += 1
+        else:
+            counter['clock_outs'] += 1
+            if attendance.is_auto:
+                counter['auto_clock_outs'] += 1
+    return counts
+
+
+def apply_to_rollups(attendances, sign=1):
+    """
+    Add (or with sign=-1, remove) attendance records to the daily rollup.
+    Runs inside the caller's transaction so counts never drift from the
+    raw table.
+    """
+    for (day, geofence_id, user_id), counter in _counts(attendances).items():
+        deltas = {field: F(field) + sign * value for field, value in counter.items()}
+        rollup = DailyAttendanceRollup.objects.filter(day=day, geofence_id=geofence_id, user_id=user_id)
+        if rollup.update(**deltas) or sign < 0:
+            continue
+        try:
+            with transaction.atomic():
+                DailyAttendanceRollup.objects.create(
+                    day=day, geofence_id=geofence_id, user_id=user_id, **counter
+                )
+        except IntegrityError:
+            # Row created concurrently
+            rollup.update(**deltas)
+
+
+def rebuild_rollups(start_date=None, end_date=None):
+    """Recompute the rollup from Attendance, optionally for a date range only"""
+    attendances = Attendance.objects.all()
+    rollups = DailyAttendanceRollup.objects.all()
+    if start_date:
+        attendances = attendances.filter(timestamp__date__gte=start_date)
+        rollups = rollups.filter(day__gte=start_date)
+    if end_date:
+        attendances = attendances.filter(timestamp__date__lte=end_date)
+        rollups = rollups.filter(day__lte=end_date)
+
+    rows = attendances.annotate(day=TruncDate('timestamp')).values('day', 'geofence_id', 'user_id').annotate(
+        clock_ins=Count('id', filter=Q(type='clock-in')),
+        clock_outs=Count('id', filter=Q(type='clock-out')),
+        auto_clock_outs=Count('id', filter=Q(type='clock-out', is_auto=True)),
+    ).order_by()
+
+    with transaction.atomic():
+        deleted, _ = rollups.delete()
+        created = DailyAttendanceRollup.objects.bulk_create(
+            (DailyAttendanceRollup(**row) for row in rows.iterator(chunk_size=2000)),
+            batch_size=1000,
+        )
+    return deleted, len(created)
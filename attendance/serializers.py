@@ -1,14 +1,59 @@
+import functools
+import json
+import operator
+
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Geofence, Attendance, Complaint, LoginLog
+from .polygons import parse_boundary
 from users.models import User
 from users.serializers import UserSerializer
 
+
+class BoundaryField(serializers.CharField):
+    """Accepts a GeoJSON object as well as GeoJSON/WKT text"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict):
+            data = json.dumps(data)
+        return super().to_internal_value(data)
+
+
 class GeofenceSerializer(serializers.ModelSerializer):
     created_by = serializers.PrimaryKeyRelatedField(read_only=True)
+    boundary = BoundaryField(required=False, allow_null=True, allow_blank=True)
     
     class Meta:
         model = Geofence
-        fields = ['id', 'name', 'latitude', 'longitude', 'radius', 'created_by', 'created_at']
+        fields = [
+            'id', 'name', 'latitude', 'longitude', 'radius', 'boundary',
+            'min_latitude', 'min_longitude', 'max_latitude', 'max_longitude',
+            'created_by', 'created_at'
+        ]
+        read_only_fields = ['min_latitude', 'min_longitude', 'max_latitude', 'max_longitude']
+        # Derived from the boundary for polygon geofences
+        extra_kwargs = {
+            'latitude': {'required': False},
+            'longitude': {'required': False},
+            'radius': {'required': False},
+        }
+
+    def validate_boundary(self, value):
+        if not value:
+            return None
+        try:
+            parse_boundary(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+    def validate(self, data):
+        boundary = data.get('boundary', self.instance.boundary if self.instance else None)
+        if not boundary:
+            for field in ('latitude', 'longitude', 'radius'):
+                if data.get(field, getattr(self.instance, field, None)) is None:
+                    raise serializers.ValidationError({field: "This field is required for circular geofences."})
+        return data
     
     def create(self, validated_data):
         request = self.context.get('request')
@@ -40,6 +85,22 @@ class AttendanceSerializer(serializers.ModelSerializer):
         return data
     
 
+class ClockEventSerializer(serializers.Serializer):
+    """A single queued clock-in/out replayed by the mobile app"""
+    type = serializers.ChoiceField(choices=Attendance.TYPE_CHOICES)
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    timestamp = serializers.DateTimeField()
+
+
+class LocationPingSerializer(serializers.Serializer):
+    """One location sample sent by a clocked-in phone"""
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    accuracy = serializers.FloatField(min_value=0, required=False, allow_null=True)
+    timestamp = serializers.DateTimeField()
+
+
 class CurrentAttendanceStatusSerializer(serializers.Serializer):
     isClockedIn = serializers.BooleanField()
     lastAction = serializers.CharField()
@@ -88,9 +149,192 @@ class LoginLogSerializer(serializers.ModelSerializer):
 
 class AttendanceReportSerializer(serializers.Serializer):
     user_id = serializers.IntegerField(required=False)
-    start_date = serializers.DateField(required=False)
+    start_date = serializers.DateField()
     end_date = serializers.DateField(required=False)
     geofence_id = serializers.IntegerField(required=False)
+    group_by = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    breakdown = serializers.ChoiceField(choices=['geofence', 'user'], required=False)
+
+
+class TimesheetSerializer(serializers.Serializer):
+    start_date = serializers.DateField()
+    end_date = serializers.DateField(required=False)
+    user_id = serializers.IntegerField(required=False)
+    geofence_id = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if data.get('end_date') and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        return data
+
+
+    
+
+# Lean read mode
+#
+# Flat serializers map rows from QuerySet.values() straight to dicts with
+# getters worked out once per field selection, skipping DRF's per-field
+# machinery. Output matches the ModelSerializers above for the selected
+# fields.
+
+def format_datetime(value):
+    """Same ISO 8601 output as DRF's DateTimeField"""
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class FlatSerializer:
+    """
+    fields maps output names to a values() path, a (path, converter) pair,
+    or a nested FlatSerializer class with the relation prefix it reads from.
+    """
+    fields = {}
+    nested = {}
+
+    def __init__(self, fields=None):
+        selected = [name for name in self.get_field_names() if fields is None or name in fields]
+        if fields is not None and not selected:
+            raise serializers.ValidationError({'fields': "None of the requested fields exist"})
+        self.field_names = tuple(selected)
+        self.getters, self.paths = self.compile(self.field_names)
+
+    @classmethod
+    def get_field_names(cls):
+        return list(cls.fields) + list(cls.nested)
+
+    @classmethod
+    def _getters(cls, names, prefix):
+        """((name, getter(row)), ...) for the given fields, and the values() paths they read"""
+        getters = []
+        paths = []
+        for name in names:
+            if name in cls.nested:
+                relation, serializer = cls.nested[name]
+                inner, inner_paths = serializer._getters(serializer.get_field_names(), f'{prefix}{relation}__')
+                key = f'{prefix}{relation}__id'
+                getters.append((name, functools.partial(_nested_value, key, inner)))
+                paths.extend(inner_paths + [key])
+                continue
+
+            spec = cls.fields[name]
+            path, converter = spec if isinstance(spec, tuple) else (spec, None)
+            path = prefix + path
+            paths.append(path)
+            if converter is None:
+                getters.append((name, operator.itemgetter(path)))
+            else:
+                getters.append((name, functools.partial(_converted_value, path, converter)))
+        return tuple(getters), paths
+
+    @classmethod
+    @functools.lru_cache(maxsize=64)
+    def compile(cls, names):
+        """The getters and values() paths of the given fields, worked out once per selection"""
+        getters, paths = cls._getters(names, '')
+        return getters, tuple(dict.fromkeys(paths))
+
+    def serialize_row(self, row):
+        return {name: get(row) for name, get in self.getters}
+
+    def serialize(self, rows):
+        getters = self.getters
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+def _converted_value(path, converter, row):
+    return converter(row[path])
+
+
+def _nested_value(key, getters, row):
+    # A null relation renders as None, like the nested ModelSerializer
+    if row[key] is None:
+        return None
+    return {name: get(row) for name, get in getters}
+
+
+class UserFlatSerializer(FlatSerializer):
+    # The model fields UserSerializer renders, so both modes show the same user details
+    fields = {name: name for name in UserSerializer.Meta.fields}
+
+
+class GeofenceFlatSerializer(FlatSerializer):
+    fields = {
+        'id': 'id',
+        'name': 'name',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+        'radius': 'radius',
+        'boundary': 'boundary',
+        'min_latitude': 'min_latitude',
+        'min_longitude': 'min_longitude',
+        'max_latitude': 'max_latitude',
+        'max_longitude': 'max_longitude',
+        'created_by': 'created_by',
+        'created_at': ('created_at', format_datetime),
+    }
+
+
+class AttendanceFlatSerializer(FlatSerializer):
+    fields = {
+        'id': 'id',
+        'user': 'user_id',
+        'geofence': 'geofence_id',
+        'type': 'type',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+        'timestamp': ('timestamp', format_datetime),
+    }
+    nested = {
+        'user_details': ('user', UserFlatSerializer),
+        'geofence_details': ('geofence', GeofenceFlatSerializer),
+    }
+
+
+class ComplaintFlatSerializer(FlatSerializer):
+    fields = {
+        'id': 'id',
+        'user': 'user_id',
+        'subject': 'subject',
+        'message': 'message',
+        'status': 'status',
+        'admin_response': 'admin_response',
+        'created_at': ('created_at', format_datetime),
+        'updated_at': ('updated_at', format_datetime),
+    }
+    nested = {
+        'user_details': ('user', UserFlatSerializer),
+    }
+
+
+class LoginLogFlatSerializer(FlatSerializer):
+    fields = {
+        'id': 'id',
+        'user': 'user_id',
+        'login_time': ('login_time', format_datetime),
+        'logout_time': ('logout_time', format_datetime),
+        'ip_address': 'ip_address',
+        'user_agent': 'user_agent',
+    }
+    nested = {
+        'user_details': ('user', UserFlatSerializer),
+    }
 
 
-    
\ No newline at end of file
+class AttendanceExportSerializer(FlatSerializer):
+    """One flat row per attendance record for payroll exports"""
+    fields = {
+        'id': 'id',
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'geofence_id': 'geofence_id',
+        'geofence_name': 'geofence__name',
+        'type': 'type',
+        'is_auto': 'is_auto',
+        'latitude': 'latitude',
+        'longitude': 'longitude',
+        'timestamp': ('timestamp', format_datetime),
+    }
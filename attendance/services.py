@@ -0,0 +1,178 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from .models import Attendance, AttendanceState
+from .rollups import apply_to_rollups
+from .stats import bump_stat
+
+
+class AttendanceSequenceError(ValueError):
+    """Raised when a clock-in/out does not follow the user's current state"""
+
+
+SEQUENCE_ERRORS = {
+    'clock-in': "Already clocked in",
+    'clock-out': "No active clock-in found",
+}
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_lock(func):
+    """
+    Retry a write that fails because SQLite is locked by another writer,
+    up to DATABASE_LOCK_RETRIES times with jittered exponential backoff.
+    Inside an outer transaction the error is raised straight away: only
+    the outermost transaction can be retried.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'DATABASE_LOCK_RETRIES', 3)
+        delay = getattr(settings, 'DATABASE_LOCK_RETRY_DELAY', 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == retries or not is_lock_error(e) or transaction.get_connection().in_atomic_block:
+                    raise
+                time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    return wrapper
+
+
+def get_attendance_state(user):
+    """Single primary-key read of the user's clock state (unsaved if none yet)"""
+    try:
+        return AttendanceState.objects.select_related('geofence').get(pk=user.pk)
+    except AttendanceState.DoesNotExist:
+        return AttendanceState(user=user)
+
+
+async def aget_attendance_state(user):
+    """Async version of get_attendance_state() for the ASGI views"""
+    try:
+        return await AttendanceState.objects.select_related('geofence').aget(pk=user.pk)
+    except AttendanceState.DoesNotExist:
+        return AttendanceState(user=user)
+
+
+def check_sequence(state, action):
+    """Ensure `action` may follow the given state"""
+    if action not in SEQUENCE_ERRORS:
+        raise AttendanceSequenceError("Invalid action type")
+    if state.is_clocked_in == (action == 'clock-in'):
+        raise AttendanceSequenceError(SEQUENCE_ERRORS[action])
+
+
+def _advance_state(user, last, error, **expected):
+    """
+    Compare-and-set the user's state: only moves it if it still matches
+    `expected`, so two racing clock-ins cannot both succeed.
+    """
+    updated = AttendanceState.objects.filter(user=user, **expected).update(
+        is_clocked_in=last.type == 'clock-in',
+        last_attendance=last,
+        last_action=last.type,
+        last_action_time=last.timestamp,
+        geofence=last.geofence,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        raise AttendanceSequenceError(error)
+
+
+@retry_on_lock
+def record_attendance(user, action, geofence, latitude, longitude, is_auto=False, timestamp=None):
+    """
+    Create an attendance record and move the user's clock state in one
+    transaction. Raises AttendanceSequenceError if the user is not in the
+    state `action` requires, including when a concurrent request won.
+    """
+    if action not in SEQUENCE_ERRORS:
+        raise AttendanceSequenceError("Invalid action type")
+
+    with transaction.atomic():
+        AttendanceState.objects.get_or_create(user=user)
+        attendance = Attendance(
+            user=user,
+            geofence=geofence,
+            type=action,
+            latitude=latitude,
+            longitude=longitude,
+            is_auto=is_auto,
+            timestamp=timestamp or timezone.now(),
+        )
+        # Tells the post_save handler the state is moved here
+        attendance._recorded = True
+        attendance.save()
+        _advance_state(user, attendance, SEQUENCE_ERRORS[action], is_clocked_in=action == 'clock-out')
+        apply_to_rollups([attendance])
+    return attendance
+
+
+@retry_on_lock
+def record_attendance_batch(user, attendances, state):
+    """
+    Write a pre-sequenced list of Attendance objects with one bulk_create.
+    `state` is the AttendanceState the sequence was validated from; the
+    batch is refused if the user's state changed in the meantime.
+    """
+    if not attendances:
+        return attendances
+
+    with transaction.atomic():
+        AttendanceState.objects.get_or_create(user=user)
+        Attendance.objects.bulk_create(attendances)
+        _advance_state(user, attendances[-1], "Attendance changed while the batch was processed, please retry",
+                       is_clocked_in=state.is_clocked_in, last_attendance=state.last_attendance_id)
+        apply_to_rollups(attendances)
+        # bulk_create sends no post_save signals
+        transaction.on_commit(lambda: bump_stat('total_attendances', len(attendances)))
+        transaction.on_commit(lambda: bump_stat('recent_attendances', len(attendances)))
+    return attendances
+
+
+def _state_fields(last):
+    """AttendanceState fields for a user whose latest attendance is `last` (or who has none)"""
+    return {
+        'is_clocked_in': bool(last and last.type == 'clock-in'),
+        'last_attendance': last,
+        'last_action': last.type if last else None,
+        'last_action_time': last.timestamp if last else None,
+        'geofence_id': last.geofence_id if last else None,
+        'updated_at': timezone.now(),
+    }
+
+
+def latest_attendance(user_id):
+    return Attendance.objects.filter(user_id=user_id).order_by('-timestamp', '-id').first()
+
+
+def refresh_attendance_state(user_id):
+    """
+    Rebuild a user's state from their latest attendance if the attendance it
+    pointed to has been deleted
+    """
+    orphaned = AttendanceState.objects.filter(
+        user_id=user_id, last_attendance__isnull=True, last_action__isnull=False
+    )
+    if not orphaned.exists():
+        return
+    orphaned.update(**_state_fields(latest_attendance(user_id)))
+
+
+def sync_attendance_state(user_id):
+    """
+    Set a user's state from their latest attendance, after a record was
+    created or edited other than through record_attendance (the admin, a
+    shell)
+    """
+    AttendanceState.objects.update_or_create(user_id=user_id, defaults=_state_fields(latest_attendance(user_id)))
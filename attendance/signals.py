@@ -0,0 +1,124 @@
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from users.models import User
+from .models import Attendance, Complaint, Geofence, LoginLog
+from .metrics import install_query_recorder
+from .rollups import apply_to_rollups
+from .services import refresh_attendance_state, sync_attendance_state
+from .stats import bump_stat, invalidate_stat
+from .spatial_index import publish_geofence_change
+from .spatialite import delete_shape, save_shape, spatialite_enabled
+from .versioning import record_tombstone
+
+
+@receiver(post_save, sender=Geofence)
+def geofence_saved(sender, instance, created, using, **kwargs):
+    if spatialite_enabled():
+        # Same transaction as the geofence itself
+        with connections[using].cursor() as cursor:
+            save_shape(cursor, instance)
+    transaction.on_commit(partial(publish_geofence_change, geofence=instance))
+    if created:
+        transaction.on_commit(partial(bump_stat, 'total_geofences'))
+
+
+@receiver(post_delete, sender=Geofence)
+def geofence_deleted(sender, instance, using, **kwargs):
+    if spatialite_enabled():
+        with connections[using].cursor() as cursor:
+            delete_shape(cursor, instance.pk)
+    record_tombstone(instance.pk, using)
+    transaction.on_commit(partial(publish_geofence_change, removed_id=instance.pk))
+    transaction.on_commit(partial(bump_stat, 'total_geofences', -1))
+
+
+@receiver(pre_save, sender=Attendance)
+def attendance_saving(sender, instance, **kwargs):
+    # The row an edit replaces, for attendance_changed
+    instance._previous = None
+    if not instance._state.adding and not getattr(instance, '_recorded', False):
+        instance._previous = Attendance.objects.filter(pk=instance.pk).first()
+
+
+@receiver(post_save, sender=Attendance)
+def attendance_changed(sender, instance, **kwargs):
+    previous = instance.__dict__.pop('_previous', None)
+    if instance.__dict__.pop('_recorded', False):
+        return
+    # Written outside the services: move the rollup from the old values to
+    # the new ones, and rebuild the clock state of whoever it concerns
+    if previous is not None:
+        apply_to_rollups([previous], sign=-1)
+    apply_to_rollups([instance])
+    for user_id in {instance.user_id, getattr(previous, 'user_id', instance.user_id)}:
+        sync_attendance_state(user_id)
+
+
+@receiver(post_delete, sender=Attendance)
+def attendance_deleted(sender, instance, **kwargs):
+    apply_to_rollups([instance], sign=-1)
+    transaction.on_commit(partial(refresh_attendance_state, instance.user_id))
+    transaction.on_commit(partial(bump_stat, 'total_attendances', -1))
+    transaction.on_commit(partial(invalidate_stat, 'recent_attendances'))
+
+
+# Dashboard counters. Bulk writes bypass these and bump the counters themselves.
+
+@receiver(post_save, sender=Attendance)
+def attendance_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(bump_stat, 'total_attendances'))
+        transaction.on_commit(partial(bump_stat, 'recent_attendances'))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(bump_stat, 'total_users'))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_stat, 'total_users', -1))
+
+
+@receiver(post_save, sender=Complaint)
+def complaint_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(bump_stat, 'total_complaints'))
+        if instance.status == 'pending':
+            transaction.on_commit(partial(bump_stat, 'pending_complaints'))
+    else:
+        # The previous status is unknown, recount
+        transaction.on_commit(partial(invalidate_stat, 'pending_complaints'))
+
+
+@receiver(post_delete, sender=Complaint)
+def complaint_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_stat, 'total_complaints', -1))
+    transaction.on_commit(partial(invalidate_stat, 'pending_complaints'))
+
+
+@receiver(post_save, sender=LoginLog)
+def login_log_saved(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(bump_stat, 'recent_logins'))
+        if instance.logout_time is None:
+            transaction.on_commit(partial(bump_stat, 'active_logins'))
+    else:
+        transaction.on_commit(partial(invalidate_stat, 'active_logins'))
+
+
+@receiver(post_delete, sender=LoginLog)
+def login_log_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(invalidate_stat, 'active_logins'))
+    transaction.on_commit(partial(invalidate_stat, 'recent_logins'))
+
+
+# Count queries and database time per request
+connection_created.connect(install_query_recorder)
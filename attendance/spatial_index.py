@@ -0,0 +1,227 @@
+import logging
+import math
+import threading
+import uuid
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .geo import GEOFENCE_BUFFER_M, bounding_box, in_bounding_box
+from .matching import GeofenceMatcher
+from .spatialite import spatialite_enabled, spatialite_match
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CACHE_KEY = 'attendance:geofence-index:generation'
+
+
+class IndexedGeofence:
+    """A geofence plus the precomputed bounding box used by the index"""
+
+    __slots__ = ('geofence', 'id', 'latitude', 'longitude', 'limit', 'half_lat', 'half_lng')
+
+    def __init__(self, geofence):
+        self.geofence = geofence
+        self.id = geofence.id
+        self.latitude = geofence.latitude
+        self.longitude = geofence.longitude
+        # Containment distance: radius + 10m buffer
+        self.limit = geofence.radius + GEOFENCE_BUFFER_M
+        self.half_lat, self.half_lng = bounding_box(self.latitude, self.longitude, self.limit)
+
+    def covers(self, lat, lng):
+        return in_bounding_box(lat, lng, self.latitude, self.longitude, self.half_lat, self.half_lng)
+
+
+class GeofenceIndex:
+    """
+    Process-local uniform grid over geofence bounding boxes.
+
+    Each geofence is registered in every cell its bounding box touches, so a
+    lookup only inspects the geofences sharing the point's cell. Geofences
+    spanning more than `max_cells` cells are kept in a small list that is
+    always checked.
+    """
+
+    def __init__(self, cell_size=None, max_cells=None):
+        self.cell_size = cell_size or getattr(settings, 'GEOFENCE_INDEX_CELL_SIZE', 0.02)
+        self.max_cells = max_cells or getattr(settings, 'GEOFENCE_INDEX_MAX_CELLS', 4096)
+        self.columns = int(math.ceil(360.0 / self.cell_size))
+        self.generation = None
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._cells = defaultdict(set)
+        self._cells_by_id = {}
+        self._oversized = set()
+        self._matcher = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _row(self, lat):
+        return int(math.floor(lat / self.cell_size))
+
+    def _column(self, lng):
+        return int(math.floor((lng + 180.0) / self.cell_size)) % self.columns
+
+    def _cells_for(self, entry):
+        rows = range(self._row(entry.latitude - entry.half_lat),
+                     self._row(entry.latitude + entry.half_lat) + 1)
+        if entry.half_lng >= 180.0:
+            return None
+        first = self._column(entry.longitude - entry.half_lng)
+        span = int(math.ceil(2 * entry.half_lng / self.cell_size)) + 1
+        if len(rows) * min(span, self.columns) > self.max_cells:
+            return None
+        columns = {(first + i) % self.columns for i in range(min(span, self.columns))}
+        return [(row, column) for row in rows for column in columns]
+
+    def _insert(self, entry):
+        self._matcher = None
+        self._entries[entry.id] = entry
+        cells = self._cells_for(entry)
+        if cells is None:
+            self._oversized.add(entry.id)
+            return
+        self._cells_by_id[entry.id] = cells
+        for cell in cells:
+            self._cells[cell].add(entry.id)
+
+    def _discard(self, geofence_id):
+        if self._entries.pop(geofence_id, None) is None:
+            return
+        self._matcher = None
+        self._oversized.discard(geofence_id)
+        for cell in self._cells_by_id.pop(geofence_id, ()):
+            bucket = self._cells[cell]
+            bucket.discard(geofence_id)
+            if not bucket:
+                del self._cells[cell]
+
+    def build(self, geofences, generation=None):
+        """Replace the index contents with the given geofences"""
+        with self._lock:
+            self._entries = {}
+            self._cells = defaultdict(set)
+            self._cells_by_id = {}
+            self._oversized = set()
+            self._matcher = None
+            for geofence in geofences:
+                self._insert(IndexedGeofence(geofence))
+            self.generation = generation
+
+    def upsert(self, geofence):
+        with self._lock:
+            self._discard(geofence.id)
+            self._insert(IndexedGeofence(geofence))
+
+    def remove(self, geofence_id):
+        with self._lock:
+            self._discard(geofence_id)
+
+    def candidates(self, lat, lng):
+        """Geofences whose bounding box contains the point"""
+        with self._lock:
+            ids = self._cells.get((self._row(lat), self._column(lng)), set()) | self._oversized
+            entries = [self._entries[geofence_id] for geofence_id in ids]
+        return [entry for entry in entries if entry.covers(lat, lng)]
+
+    def get(self, geofence_id):
+        """Indexed entry for a geofence id, or None"""
+        with self._lock:
+            return self._entries.get(geofence_id)
+
+    def entries(self):
+        with self._lock:
+            return list(self._entries.values())
+
+    @property
+    def matcher(self):
+        """Vectorized engine over every indexed geofence, rebuilt after changes"""
+        with self._lock:
+            if self._matcher is None:
+                self._matcher = GeofenceMatcher(entry.geofence for entry in self._entries.values())
+            return self._matcher
+
+    def match(self, lat, lng):
+        """
+        Match a point against the geofences sharing its grid cell. The true
+        nearest geofence is only searched for when no geofence contains it.
+        """
+        with self._lock:
+            matcher = self.matcher
+            rows = [matcher.rows[entry.id] for entry in self.candidates(lat, lng)]
+        result = matcher.match(lat, lng, rows, nearest=False)
+        if result.geofence is None:
+            return matcher.match(lat, lng)
+        return result
+
+    def match_many(self, lats, lngs):
+        """Match many points in one vectorized pass over every geofence"""
+        return self.matcher.match_many(lats, lngs)
+
+
+_index = GeofenceIndex()
+_index_lock = threading.Lock()
+
+
+def get_geofence_index():
+    """
+    Return the process-local index, rebuilding it when another worker has
+    changed the geofence table since it was last loaded.
+    """
+    from .models import Geofence
+
+    generation = cache.get(GENERATION_CACHE_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        if not cache.add(GENERATION_CACHE_KEY, generation):
+            generation = cache.get(GENERATION_CACHE_KEY, generation)
+
+    if _index.generation != generation:
+        with _index_lock:
+            if _index.generation != generation:
+                _index.build(Geofence.objects.all(), generation=generation)
+                logger.info(f"Geofence index rebuilt with {len(_index)} geofences")
+    return _index
+
+
+async def aget_geofence_index():
+    """
+    Async version of get_geofence_index(). Only one cache read when the
+    index is current; a rebuild runs in a worker thread.
+    """
+    generation = await cache.aget(GENERATION_CACHE_KEY)
+    if generation is not None and _index.generation == generation:
+        return _index
+    return await sync_to_async(get_geofence_index)()
+
+
+def publish_geofence_change(geofence=None, removed_id=None):
+    """
+    Apply a geofence change to this process' index and tell the other workers
+    to reload theirs. Must run after the change is committed.
+    """
+    generation = uuid.uuid4().hex
+    with _index_lock:
+        # A stale index is rebuilt on next lookup anyway
+        up_to_date = _index.generation is not None and _index.generation == cache.get(GENERATION_CACHE_KEY)
+        if geofence is not None:
+            _index.upsert(geofence)
+        if removed_id is not None:
+            _index.remove(removed_id)
+        cache.set(GENERATION_CACHE_KEY, generation, timeout=None)
+        _index.generation = generation if up_to_date else None
+
+
+def match_geofence(lat, lng):
+    """
+    Match one point with the backend picked by GEOFENCE_SPATIAL_BACKEND:
+    the in-memory index ('memory') or an indexed SpatiaLite query
+    ('spatialite')
+    """
+    if spatialite_enabled():
+        return spatialite_match(lat, lng)
+    return get_geofence_index().match(lat, lng)
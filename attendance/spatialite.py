@@ -0,0 +1,159 @@
+"""
+Geofence matching inside SpatiaLite (GEOFENCE_SPATIAL_BACKEND = 'spatialite').
+
+Experimental: SpatialiteMatchTests only run on a database that can load
+mod_spatialite, which CI cannot, so this backend is opt-in and flagged by
+the attendance.W001 system check. `manage.py sync_geofence_shapes
+--verify` compares it with the in-memory matcher on a real database.
+
+Every geofence gets a row in SHAPE_TABLE holding two geometries, each with
+a SpatiaLite R*Tree index:
+
+- area: the polygon boundary (as simplified for matching), or for a
+  circular geofence the lat/lng bounding box of its circle
+- center: the geofence center, for nearest-fence searches
+
+A containment lookup is one query: the R*Tree finds the shapes whose box
+holds the point, polygons are settled with ST_Covers in the same query,
+and the few circles returned are checked with haversine so the results
+agree with the in-memory matcher. The nearest fence is only searched for
+when nothing contains the point, in growing frames around it.
+
+The table is created empty by migration 0014 and loaded with `manage.py
+sync_geofence_shapes`, after which the model signals keep it in step with
+the geofence table.
+"""
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+
+from .geo import GEOFENCE_BUFFER_M, bounding_box, haversine_distance
+from .matching import GeofenceMatch, NO_MATCH
+from .polygons import prepare_boundary
+
+SHAPE_TABLE = 'attendance_geofence_shape'
+
+# Frames (meters around the point) tried in turn by the nearest-fence search
+NEAREST_SEARCH_RADII_M = (10000, 100000, 1000000)
+
+CONTAINMENT_SQL = f"""
+    SELECT g.* FROM attendance_geofence g
+    JOIN {SHAPE_TABLE} s ON s.geofence_id = g.id
+    WHERE s.ROWID IN (
+        SELECT ROWID FROM SpatialIndex
+        WHERE f_table_name = '{SHAPE_TABLE}' AND f_geometry_column = 'area'
+        AND search_frame = MakePoint(%s, %s, 4326)
+    )
+    AND (g.boundary IS NULL OR ST_Covers(s.area, MakePoint(%s, %s, 4326)) = 1)
+"""
+
+NEAREST_SQL = f"""
+    SELECT g.* FROM attendance_geofence g
+    WHERE g.id IN (
+        SELECT ROWID FROM SpatialIndex
+        WHERE f_table_name = '{SHAPE_TABLE}' AND f_geometry_column = 'center'
+        AND search_frame = BuildMbr(%s, %s, %s, %s, 4326)
+    )
+"""
+
+
+def spatialite_enabled():
+    return getattr(settings, 'GEOFENCE_SPATIAL_BACKEND', 'memory') == 'spatialite'
+
+
+def is_spatialite(db_connection):
+    return getattr(db_connection.ops, 'spatialite', False)
+
+
+def create_shape_table(cursor):
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {SHAPE_TABLE} (geofence_id integer NOT NULL PRIMARY KEY)")
+    cursor.execute("SELECT COUNT(*) FROM geometry_columns WHERE f_table_name = %s", [SHAPE_TABLE])
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute(f"SELECT AddGeometryColumn('{SHAPE_TABLE}', 'area', 4326, 'GEOMETRY', 'XY')")
+    cursor.execute(f"SELECT AddGeometryColumn('{SHAPE_TABLE}', 'center', 4326, 'POINT', 'XY')")
+    cursor.execute(f"SELECT CreateSpatialIndex('{SHAPE_TABLE}', 'area')")
+    cursor.execute(f"SELECT CreateSpatialIndex('{SHAPE_TABLE}', 'center')")
+
+
+def frame(lat, lng, distance):
+    """(min_lng, min_lat, max_lng, max_lat) around a circle; the full longitude range across the antimeridian"""
+    half_lat, half_lng = bounding_box(lat, lng, distance)
+    min_lng, max_lng = lng - half_lng, lng + half_lng
+    if min_lng < -180 or max_lng > 180:
+        min_lng, max_lng = -180.0, 180.0
+    return min_lng, max(-90.0, lat - half_lat), max_lng, min(90.0, lat + half_lat)
+
+
+def shape_wkt(geofence):
+    """WKT of the area stored for a geofence"""
+    if geofence.boundary:
+        return prepare_boundary(geofence.boundary).geometry.wkt
+    return Polygon.from_bbox(frame(geofence.latitude, geofence.longitude, geofence.radius + GEOFENCE_BUFFER_M)).wkt
+
+
+def save_shape(cursor, geofence):
+    # Delete and insert rather than INSERT OR REPLACE, which would skip the
+    # spatial index triggers for the replaced row
+    cursor.execute(f"DELETE FROM {SHAPE_TABLE} WHERE geofence_id = %s", [geofence.id])
+    cursor.execute(
+        f"INSERT INTO {SHAPE_TABLE} (geofence_id, area, center) "
+        f"VALUES (%s, GeomFromText(%s, 4326), MakePoint(%s, %s, 4326))",
+        [geofence.id, shape_wkt(geofence), geofence.longitude, geofence.latitude],
+    )
+
+
+def delete_shape(cursor, geofence_id):
+    cursor.execute(f"DELETE FROM {SHAPE_TABLE} WHERE geofence_id = %s", [geofence_id])
+
+
+def rebuild_shapes(geofences):
+    """Recreate the shape of every geofence; returns how many were written"""
+    count = 0
+    with connection.cursor() as cursor:
+        create_shape_table(cursor)
+        cursor.execute(f"DELETE FROM {SHAPE_TABLE}")
+        for geofence in geofences:
+            save_shape(cursor, geofence)
+            count += 1
+    return count
+
+
+def closest(lat, lng, geofences):
+    """(geofence, distance) of the geofence whose center is closest, or (None, None)"""
+    best = best_distance = None
+    for geofence in geofences:
+        distance = haversine_distance(lat, lng, geofence.latitude, geofence.longitude)
+        if best is None or distance < best_distance:
+            best, best_distance = geofence, distance
+    return best, best_distance
+
+
+def nearest_geofence(lat, lng):
+    """Closest geofence center as (geofence, distance), searched in growing indexed frames"""
+    from .models import Geofence
+
+    for radius in NEAREST_SEARCH_RADII_M:
+        geofence, distance = closest(lat, lng, Geofence.objects.raw(NEAREST_SQL, frame(lat, lng, radius)))
+        # Anything outside the frame is further away than `radius`
+        if geofence is not None and distance <= radius:
+            return geofence, distance
+    return closest(lat, lng, Geofence.objects.all())
+
+
+def spatialite_match(lat, lng):
+    """Same result as GeofenceIndex.match(), computed by SpatiaLite"""
+    from .models import Geofence
+
+    inside = [
+        geofence for geofence in Geofence.objects.raw(CONTAINMENT_SQL, [lng, lat, lng, lat])
+        if haversine_distance(lat, lng, geofence.latitude, geofence.longitude) <= geofence.radius + GEOFENCE_BUFFER_M
+    ]
+    if inside:
+        best, distance = closest(lat, lng, inside)
+        return GeofenceMatch(best, distance, None, None)
+
+    nearest, nearest_distance = nearest_geofence(lat, lng)
+    if nearest is None:
+        return NO_MATCH
+    return GeofenceMatch(None, None, nearest, nearest_distance)
@@ -0,0 +1,41 @@
+"""
+SQLite backend for concurrent writers. Same as django.db.backends.sqlite3,
+plus two OPTIONS consumed here instead of by sqlite3.connect():
+
+- 'pragmas': PRAGMA name -> value, applied to every new connection
+  (WAL journal, synchronous=NORMAL, ...)
+- 'begin_immediate': start transactions with BEGIN IMMEDIATE, so a
+  transaction takes the write lock up front and waits on the busy timeout
+  instead of failing with "database is locked" when it upgrades from
+  reading to writing
+
+attendance.sqlite.spatialite is the same on top of the SpatiaLite backend.
+"""
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+}
+
+
+class ConcurrentSQLiteMixin:
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', DEFAULT_PRAGMAS)
+        self.begin_immediate = params.pop('begin_immediate', True)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
+
+
+class DatabaseWrapper(ConcurrentSQLiteMixin, base.DatabaseWrapper):
+    pass
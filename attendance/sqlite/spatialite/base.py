@@ -0,0 +1,8 @@
+"""SpatiaLite backend with the connection settings of attendance.sqlite"""
+from django.contrib.gis.db.backends.spatialite import base
+
+from attendance.sqlite.base import ConcurrentSQLiteMixin
+
+
+class DatabaseWrapper(ConcurrentSQLiteMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,81 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from users.models import User
+from .models import Attendance, Complaint, Geofence, LoginLog
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'attendance:stats:'
+COMPUTED_AT_KEY = CACHE_PREFIX + 'computed_at'
+COUNTERS = (
+    'total_users',
+    'total_geofences',
+    'total_attendances',
+    'total_complaints',
+    'pending_complaints',
+    'active_logins',
+    'recent_attendances',
+    'recent_logins',
+)
+RECENT_DAYS = 30
+
+
+def compute_system_stats():
+    """All dashboard counters with one aggregate query per table"""
+    since = timezone.now() - timedelta(days=RECENT_DAYS)
+    stats = {}
+    stats.update(User.objects.aggregate(total_users=Count('id')))
+    stats.update(Geofence.objects.aggregate(total_geofences=Count('id')))
+    stats.update(Attendance.objects.aggregate(
+        total_attendances=Count('id'),
+        recent_attendances=Count('id', filter=Q(timestamp__gte=since)),
+    ))
+    stats.update(Complaint.objects.aggregate(
+        total_complaints=Count('id'),
+        pending_complaints=Count('id', filter=Q(status='pending')),
+    ))
+    stats.update(LoginLog.objects.aggregate(
+        active_logins=Count('id', filter=Q(logout_time__isnull=True)),
+        recent_logins=Count('id', filter=Q(login_time__gte=since)),
+    ))
+    return stats
+
+
+def get_system_stats():
+    """
+    Returns (stats, computed_at). Counters are served from the cache and
+    only recomputed when one of them is missing or the TTL has expired.
+    Between recomputes, model signals keep the counters current; the
+    30-day windows can lag by up to the TTL.
+    """
+    keys = [CACHE_PREFIX + name for name in COUNTERS] + [COMPUTED_AT_KEY]
+    cached = cache.get_many(keys)
+    if len(cached) == len(keys):
+        stats = {name: cached[CACHE_PREFIX + name] for name in COUNTERS}
+        return stats, cached[COMPUTED_AT_KEY]
+
+    computed_at = timezone.now()
+    computed = compute_system_stats()
+    stats = {name: computed[name] for name in COUNTERS}
+    values = {CACHE_PREFIX + name: value for name, value in stats.items()}
+    values[COMPUTED_AT_KEY] = computed_at
+    cache.set_many(values, timeout=getattr(settings, 'SYSTEM_STATS_CACHE_TTL', 300))
+    return stats, computed_at
+
+
+def bump_stat(name, delta=1):
+    """Adjust a cached counter in place; a missing counter is recomputed on next read"""
+    try:
+        cache.incr(CACHE_PREFIX + name, delta)
+    except ValueError:
+        pass
+
+
+def invalidate_stat(name):
+    cache.delete(CACHE_PREFIX + name)
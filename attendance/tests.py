@@ -1,3 +1,1434 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import math
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import User
+from users.serializers import UserSerializer
+
+from .checks import check_spatial_backend
+from .geo import (
+    GEOFENCE_BUFFER_M,
+    bounding_box,
+    destination,
+    equirectangular_distance,
+    equirectangular_tolerance,
+    haversine_distance,
+    in_bounding_box,
+)
+from .log_writer import LoginLogWriter, pending_logout_key
+from .matching import NO_MATCH, GeofenceMatcher
+from .models import (
+    Attendance, AttendanceState, Complaint, DailyAttendanceRollup, Geofence, LocationPing, LocationTrail, LoginLog,
+    PayrollEntry,
+)
+from .payroll import PayrollRunner, save_chunk
+from .polygons import PreparedBoundary, parse_boundary
+from .presence import (
+    BAND, CLOCKED_OUT, INSIDE, LEAVING, NOT_CLOCKED_IN, OUTSIDE, UNTRACKED, ExitDetector, tracker_key,
+)
+from .rollups import rebuild_rollups
+from .serializers import AttendanceExportSerializer, AttendanceSerializer, UserFlatSerializer
+from .services import AttendanceSequenceError, get_attendance_state, record_attendance, record_attendance_batch
+from .spatial_index import GENERATION_CACHE_KEY, GeofenceIndex, get_geofence_index, match_geofence
+from .spatialite import is_spatialite, spatialite_match
+from .throttling import (
+    CacheTokenBucketBackend,
+    LocalTokenBucketBackend,
+    TokenBucketThrottle,
+    get_throttle_backend,
+)
+from .timesheets import AUTO_CLOCK_OUT, UNMATCHED_CLOCK_IN, UNMATCHED_CLOCK_OUT, Timesheet
+from .trails import append_to_trail, decode, encode, read_trail, trail_stats, unzigzag, write_varint, zigzag
+from .views import ClockInOutView
+
+
+def random_geofences(rng, count, max_latitude=89.0):
+    return [
+        Geofence(
+            id=i + 1,
+            name=f'Site {i + 1}',
+            latitude=rng.uniform(-max_latitude, max_latitude),
+            longitude=rng.uniform(-180, 180),
+            radius=rng.choice([5, 50, 150, 500, 2000, 20000, 80000]),
+        )
+        for i in range(count)
+    ]
+
+
+class TieredDistanceTests(SimpleTestCase):
+    """The tiered containment check must agree with plain haversine everywhere"""
+
+    def setUp(self):
+        self.rng = random.Random(20240601)
+
+    def test_destination_is_at_the_distance(self):
+        for _ in range(2000):
+            lat, lng = self.rng.uniform(-89, 89), self.rng.uniform(-180, 180)
+            distance = self.rng.choice([1, 100, 10000, 1000000]) * self.rng.random()
+            point = destination(lat, lng, distance, self.rng.uniform(0, 360))
+            self.assertAlmostEqual(haversine_distance(lat, lng, *point), distance, delta=1e-6 * distance + 1e-6)
+            self.assertTrue(-180 <= point[1] < 180)
+        # One degree north along the meridian, and across the antimeridian
+        for (lat, lng), expected in [(destination(0, 0, 111195, 0), (1.0, 0.0)),
+                                     (destination(0, 179.9, 22239, 90), (0.0, -179.9))]:
+            self.assertAlmostEqual(lat, expected[0], places=4)
+            self.assertAlmostEqual(lng, expected[1], places=4)
+
+    def test_bounding_box_never_rejects_points_inside_the_circle(self):
+        for _ in range(20000):
+            lat = self.rng.uniform(-89.9, 89.9)
+            lng = self.rng.uniform(-180, 180)
+            limit = self.rng.choice([10, 110, 1000, 50000, 500000])
+            point = destination(lat, lng, limit * self.rng.random(), self.rng.uniform(0, 360))
+            if haversine_distance(lat, lng, *point) > limit:
+                continue
+            half_lat, half_lng = bounding_box(lat, lng, limit)
+            self.assertTrue(in_bounding_box(*point, lat, lng, half_lat, half_lng),
+                            msg=f"{point} rejected by box around {(lat, lng)} r={limit}")
+
+    def test_equirectangular_error_stays_within_documented_bound(self):
+        checked = 0
+        while checked < 20000:
+            lat = self.rng.uniform(-85, 85)
+            lng = self.rng.uniform(-180, 180)
+            limit = self.rng.uniform(10, 50000)
+            tolerance = equirectangular_tolerance(lat, limit)
+            if tolerance is None:
+                continue
+            half_lat, half_lng = bounding_box(lat, lng, limit)
+            point = (lat + self.rng.uniform(-half_lat, half_lat),
+                     lng + self.rng.uniform(-half_lng, half_lng))
+            exact = haversine_distance(lat, lng, *point)
+            approx = equirectangular_distance(lat, lng, *point)
+            self.assertLessEqual(abs(approx - exact), tolerance * max(exact, 1.0))
+            checked += 1
+
+    def test_tolerance_disables_fast_path_for_large_or_polar_geofences(self):
+        self.assertIsNone(equirectangular_tolerance(10.0, 60000))
+        self.assertIsNone(equirectangular_tolerance(86.0, 100))
+        self.assertIsNotNone(equirectangular_tolerance(45.0, 500))
+
+    def test_tiered_containment_matches_haversine(self):
+        geofences = random_geofences(self.rng, 300)
+        matcher = GeofenceMatcher(geofences)
+        rows = np.arange(len(geofences))
+
+        for _ in range(3000):
+            target = self.rng.choice(geofences)
+            limit = target.radius + GEOFENCE_BUFFER_M
+            # Concentrate samples on the boundary, where the tiers disagree most
+            scale = self.rng.choice([0.5, 1 - 1e-6, 1 - 1e-9, 1.0, 1 + 1e-9, 1 + 1e-6, 1.5])
+            lat, lng = destination(target.latitude, target.longitude, limit * scale, self.rng.uniform(0, 360))
+
+            inside, _ = matcher.contains(lat, lng, rows)
+            expected = [
+                haversine_distance(lat, lng, g.latitude, g.longitude) <= g.radius + GEOFENCE_BUFFER_M
+                for g in geofences
+            ]
+            self.assertEqual(list(inside), expected)
+
+    def test_match_returns_same_geofence_and_distance_as_haversine_scan(self):
+        geofences = random_geofences(self.rng, 200, max_latitude=70.0)
+        matcher = GeofenceMatcher(geofences)
+
+        for _ in range(2000):
+            target = self.rng.choice(geofences)
+            lat, lng = destination(target.latitude, target.longitude,
+                                   (target.radius + GEOFENCE_BUFFER_M) * self.rng.uniform(0, 1.3),
+                                   self.rng.uniform(0, 360))
+            distances = {g.id: haversine_distance(lat, lng, g.latitude, g.longitude) for g in geofences}
+            inside = [g for g in geofences if distances[g.id] <= g.radius + GEOFENCE_BUFFER_M]
+            nearest = min(geofences, key=lambda g: distances[g.id])
+
+            match = matcher.match(lat, lng)
+            self.assertEqual(match.nearest, nearest)
+            self.assertAlmostEqual(match.nearest_distance, distances[nearest.id], places=6)
+            if not inside:
+                self.assertIsNone(match.geofence)
+                continue
+            best_distance = min(distances[g.id] for g in inside)
+            self.assertIn(match.geofence, inside)
+            self.assertAlmostEqual(match.distance, best_distance, delta=1e-6)
+
+    def test_match_many_agrees_with_single_point_match(self):
+        geofences = random_geofences(self.rng, 100, max_latitude=60.0)
+        matcher = GeofenceMatcher(geofences)
+        points = [
+            destination(g.latitude, g.longitude, g.radius * self.rng.uniform(0, 1.5), self.rng.uniform(0, 360))
+            for g in self.rng.choices(geofences, k=500)
+        ]
+
+        batch = matcher.match_many([p[0] for p in points], [p[1] for p in points])
+        for point, result in zip(points, batch):
+            single = matcher.match(*point)
+            self.assertEqual(result.geofence, single.geofence)
+            self.assertEqual(result.nearest, single.nearest)
+
+
+class GeofenceIndexTests(TestCase):
+    """The grid index finds what a full scan finds, and follows geofence changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.rng = random.Random(20240715)
+        self.owner = User.objects.create_user(username='owner', password='x')
+
+    def test_lookup_agrees_with_full_scan(self):
+        geofences = random_geofences(self.rng, 300)
+        # Oversized, polar and antimeridian geofences take the slow paths of the grid
+        geofences += [
+            Geofence(id=301, name='Huge', latitude=10.0, longitude=20.0, radius=900000),
+            Geofence(id=302, name='Pole', latitude=89.99, longitude=0.0, radius=5000),
+            Geofence(id=303, name='Date line', latitude=-17.0, longitude=179.999, radius=5000),
+        ]
+        index = GeofenceIndex(cell_size=0.5, max_cells=64)
+        index.build(geofences)
+        matcher = GeofenceMatcher(geofences)
+        rows = np.arange(len(geofences))
+        self.assertEqual(len(index), len(geofences))
+
+        for _ in range(3000):
+            target = self.rng.choice(geofences)
+            lat, lng = destination(target.latitude, target.longitude,
+                                   (target.radius + GEOFENCE_BUFFER_M) * self.rng.uniform(0, 1.3),
+                                   self.rng.uniform(0, 360))
+            expected = matcher.match(lat, lng)
+            match = index.match(lat, lng)
+            self.assertEqual(match.geofence, expected.geofence, msg=(lat, lng))
+            if match.geofence is None:
+                self.assertEqual(match.nearest, expected.nearest)
+            inside, _ = matcher.contains(lat, lng, rows)
+            self.assertLessEqual({geofences[row].id for row in np.flatnonzero(inside)},
+                                 {entry.id for entry in index.candidates(lat, lng)})
+
+    def test_upsert_and_remove(self):
+        index = GeofenceIndex()
+        site = Geofence(id=1, name='Site', latitude=6.5, longitude=3.3, radius=100)
+        index.build([site])
+        self.assertEqual(index.match(6.5, 3.3).geofence, site)
+
+        moved = Geofence(id=1, name='Site', latitude=7.5, longitude=3.3, radius=100)
+        index.upsert(moved)
+        self.assertIsNone(index.match(6.5, 3.3).geofence)
+        self.assertEqual(index.match(7.5, 3.3).geofence, moved)
+        self.assertEqual(len(index), 1)
+
+        index.remove(1)
+        self.assertEqual(index.match(7.5, 3.3), NO_MATCH)
+        self.assertEqual(index.candidates(7.5, 3.3), [])
+
+    def test_rebuilds_after_a_geofence_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = Geofence.objects.create(name='Site', latitude=6.5, longitude=3.3, radius=100, created_by=self.owner)
+        index = get_geofence_index()
+        self.assertEqual(index.match(6.5, 3.3).geofence, site)
+        generation = index.generation
+
+        # Saved in this process: applied to the index without a reload
+        with self.captureOnCommitCallbacks(execute=True):
+            site.latitude = 7.5
+            site.save()
+        self.assertIsNot(index.generation, None)
+        self.assertNotEqual(index.generation, generation)
+        self.assertEqual(get_geofence_index().match(7.5, 3.3).geofence.pk, site.pk)
+
+        # Changed by another worker: it only bumps the shared generation
+        Geofence.objects.filter(pk=site.pk).update(latitude=8.5)
+        self.assertEqual(get_geofence_index().match(7.5, 3.3).geofence.pk, site.pk)
+        cache.set(GENERATION_CACHE_KEY, 'other-worker')
+        self.assertEqual(get_geofence_index().match(8.5, 3.3).geofence.pk, site.pk)
+        self.assertEqual(get_geofence_index().generation, 'other-worker')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            site.delete()
+        self.assertEqual(match_geofence(8.5, 3.3), NO_MATCH)
+
+
+@override_settings(ATTENDANCE_THROTTLE_ENABLED=False)
+class BulkClockEventTests(TestCase):
+    """Offline queues are replayed in time order, one result per event"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='offline', password='x')
+        self.site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200,
+                                            created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now() - timedelta(hours=8)
+
+    def event(self, kind, minutes, latitude=6.5244, longitude=3.3792):
+        return {'type': kind, 'latitude': latitude, 'longitude': longitude,
+                'timestamp': (self.start + timedelta(minutes=minutes)).isoformat()}
+
+    def upload(self, events):
+        return self.client.post('/api/attendance/bulk/', {'events': events}, format='json')
+
+    def test_out_of_order_events_with_partial_failures(self):
+        events = [
+            self.event('clock-out', 60),
+            self.event('clock-in', 0),
+            self.event('clock-in', 120, latitude=7.0),  # Outside every geofence
+            self.event('clock-out', 90),  # Nothing to clock out of any more
+            {'type': 'clock-in', 'latitude': 'here'},
+            self.event('clock-in', 60 * 24),  # In the future
+            self.event('clock-in', 180),
+        ]
+        response = self.upload(events)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['summary'], {'created': 3, 'duplicate': 0, 'rejected': 4})
+        results = response.data['results']
+        self.assertEqual([result['index'] for result in results], list(range(len(events))))
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'created', 'rejected', 'rejected', 'rejected', 'rejected', 'created'])
+        self.assertEqual(results[2]['error'], 'Not within any geofence')
+        self.assertEqual(results[3]['error'], 'No active clock-in found')
+        self.assertIn('latitude', results[4]['error'])
+        self.assertEqual(results[5]['error'], 'Timestamp is in the future')
+        self.assertEqual(results[0]['geofence']['id'], self.site.pk)
+
+        stored = Attendance.objects.filter(user=self.user).order_by('timestamp')
+        self.assertEqual([a.type for a in stored], ['clock-in', 'clock-out', 'clock-in'])
+        self.assertEqual(stored[1].timestamp, self.start + timedelta(minutes=60))
+        state = AttendanceState.objects.get(pk=self.user.pk)
+        self.assertTrue(state.is_clocked_in)
+        self.assertEqual(state.last_action_time, self.start + timedelta(minutes=180))
+
+    def test_replay_reports_duplicates(self):
+        events = [self.event('clock-in', 0), self.event('clock-out', 60)]
+        self.upload(events)
+        response = self.upload(events + [self.event('clock-in', 0)])
+        self.assertEqual(response.data['summary'], {'created': 0, 'duplicate': 3, 'rejected': 0})
+        self.assertEqual(Attendance.objects.filter(user=self.user).count(), 2)
+
+    def test_events_before_the_latest_attendance_are_rejected(self):
+        record_attendance(self.user, 'clock-in', self.site, 6.5244, 3.3792, timestamp=self.start + timedelta(hours=2))
+        response = self.upload([self.event('clock-out', 60), self.event('clock-out', 180)])
+        self.assertEqual([result['status'] for result in response.data['results']], ['rejected', 'created'])
+        self.assertEqual(response.data['results'][0]['error'], 'Event precedes the latest recorded attendance')
+
+    @override_settings(ATTENDANCE_BULK_MAX_EVENTS=2)
+    def test_refuses_empty_and_oversized_batches(self):
+        self.assertEqual(self.upload([]).status_code, 400)
+        self.assertEqual(self.client.post('/api/attendance/bulk/', {'events': 'x'}, format='json').status_code, 400)
+        self.assertEqual(self.upload([self.event('clock-in', i) for i in range(3)]).status_code, 400)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class AttendanceStateTests(TestCase):
+    """The open-shift state only moves by compare-and-set, in the transaction of the attendance"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shift', password='x')
+        self.site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200,
+                                            created_by=self.user)
+
+    def clock(self, action, **kwargs):
+        return record_attendance(self.user, action, self.site, 6.5244, 3.3792, **kwargs)
+
+    def test_state_follows_each_attendance(self):
+        clock_in = self.clock('clock-in')
+        state = AttendanceState.objects.get(pk=self.user.pk)
+        self.assertEqual((state.is_clocked_in, state.last_attendance_id, state.last_action, state.geofence_id),
+                         (True, clock_in.pk, 'clock-in', self.site.pk))
+        clock_out = self.clock('clock-out')
+        state.refresh_from_db()
+        self.assertEqual((state.is_clocked_in, state.last_attendance_id), (False, clock_out.pk))
+
+    def test_lost_race_writes_nothing(self):
+        self.clock('clock-in')
+        with self.assertRaisesMessage(AttendanceSequenceError, 'Already clocked in'):
+            self.clock('clock-in')
+        self.assertEqual(Attendance.objects.filter(user=self.user).count(), 1)
+
+        # Validated against a state another request has moved since
+        stale = get_attendance_state(self.user)
+        self.clock('clock-out')
+        batch = [Attendance(user=self.user, geofence=self.site, type='clock-out', latitude=6.5244, longitude=3.3792)]
+        with self.assertRaises(AttendanceSequenceError):
+            record_attendance_batch(self.user, batch, stale)
+        self.assertEqual(Attendance.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(AttendanceState.objects.get(pk=self.user.pk).is_clocked_in)
+
+    def test_view_reports_a_lost_race(self):
+        self.clock('clock-in')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # The sequence check passes on a state read before the winning write
+        with mock.patch.object(ClockInOutView, 'validate_attendance_sequence'):
+            response = client.post('/api/attendance/clock-in/', {'latitude': 6.5244, 'longitude': 3.3792},
+                                   format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Already clocked in')
+        self.assertEqual(Attendance.objects.filter(user=self.user).count(), 1)
+
+    def test_deleting_the_last_attendance_rolls_the_state_back(self):
+        clock_in = self.clock('clock-in')
+        clock_out = self.clock('clock-out')
+        with self.captureOnCommitCallbacks(execute=True):
+            clock_out.delete()
+        state = AttendanceState.objects.get(pk=self.user.pk)
+        self.assertEqual((state.is_clocked_in, state.last_attendance_id), (True, clock_in.pk))
+
+
+    def test_records_written_outside_the_services(self):
+        # As the admin does it
+        clock_in = Attendance.objects.create(user=self.user, geofence=self.site, type='clock-in',
+                                             latitude=6.5244, longitude=3.3792)
+        state = AttendanceState.objects.get(pk=self.user.pk)
+        self.assertEqual((state.is_clocked_in, state.last_attendance_id, state.geofence_id),
+                         (True, clock_in.pk, self.site.pk))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertTrue(client.get('/api/current/attendance/').data['isClockedIn'])
+        response = client.post('/api/attendance/clock-out/', {'latitude': 6.5244, 'longitude': 3.3792}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # An edit, and a record moved to another user
+        clock_out = Attendance.objects.get(type='clock-out')
+        clock_out.type = 'clock-in'
+        clock_out.save()
+        self.assertTrue(AttendanceState.objects.get(pk=self.user.pk).is_clocked_in)
+        other = User.objects.create_user(username='other', password='x')
+        clock_out.user = other
+        clock_out.save()
+        self.assertEqual(AttendanceState.objects.get(pk=self.user.pk).last_attendance_id, clock_in.pk)
+        self.assertEqual(AttendanceState.objects.get(pk=other.pk).last_attendance_id, clock_out.pk)
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages neither skip nor repeat rows, whatever is written meanwhile"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='boss', password='x', role='admin')
+        self.worker = User.objects.create_user(username='worker', password='x')
+        self.site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200,
+                                            created_by=self.admin)
+        self.now = timezone.now().replace(microsecond=0)
+        # Runs of rows share a timestamp, so the id must break ties
+        Attendance.objects.bulk_create([
+            Attendance(user=self.worker, geofence=self.site if i % 3 else None,
+                       type='clock-in' if i % 2 else 'clock-out', latitude=6.5244, longitude=3.3792,
+                       timestamp=self.now - timedelta(days=i // 10, minutes=i // 4))
+            for i in range(40)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def walk(self, params):
+        """Ids of every page following the next links, and the pages' responses"""
+        ids, pages = [], []
+        response = self.client.get('/api/attendance/', params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response)
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def expected(self, queryset):
+        return list(queryset.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def test_pages_cover_every_row_once(self):
+        ids, pages = self.walk({'page_size': 7})
+        self.assertEqual(ids, self.expected(Attendance.objects.all()))
+        self.assertEqual(len(pages), 6)
+        self.assertIsNone(pages[0].data['previous'])
+
+        # Going back from a page gives the page before it
+        back = self.client.get(pages[2].data['previous'])
+        self.assertEqual([row['id'] for row in back.data['results']],
+                         [row['id'] for row in pages[1].data['results']])
+
+    def test_rows_written_meanwhile_do_not_shift_pages(self):
+        first = self.client.get('/api/attendance/', {'page_size': 10})
+        Attendance.objects.create(user=self.worker, type='clock-in', latitude=0, longitude=0)
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']],
+                         self.expected(Attendance.objects.filter(timestamp__lte=self.now))[10:20])
+
+    def test_filters_apply_across_pages(self):
+        day = timezone.localtime(self.now - timedelta(days=1)).strftime('%Y-%m-%d')
+        params = {'page_size': 4, 'type': 'clock-in', 'geofence_id': self.site.pk, 'date_from': day, 'date_to': day}
+        ids, _ = self.walk(params)
+        day_start = timezone.make_aware(datetime.strptime(day, '%Y-%m-%d'))
+        self.assertEqual(ids, self.expected(Attendance.objects.filter(
+            type='clock-in', geofence=self.site, timestamp__gte=day_start, timestamp__lt=day_start + timedelta(days=1),
+        )))
+        self.assertTrue(ids)
+
+        # The cursor's timestamp is selected even when not rendered
+        lean_ids, _ = self.walk({**params, 'lean': 1, 'fields': 'id,type'})
+        self.assertEqual(lean_ids, ids)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/attendance/', {'cursor': 'garbage'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/attendance/', {'date_from': 'yesterday'}).status_code, 400)
+
+
+class AttendanceExportTests(TestCase):
+    """Exports stream every matching row, oldest first, in chunks"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='boss', password='x', role='admin')
+        self.worker = User.objects.create_user(username='Doe, "JD"', password='x')
+        site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=self.admin)
+        self.start = timezone.now() - timedelta(hours=10)
+        for i in range(7):
+            user = self.worker if i % 2 else self.admin
+            record_attendance(user, 'clock-in', site, 6.5244, 3.3792, timestamp=self.start + timedelta(hours=i))
+            record_attendance(user, 'clock-out', site, 6.5244, 3.3792,
+                              timestamp=self.start + timedelta(hours=i, minutes=30), is_auto=i == 3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, user=None, **params):
+        if user is not None:
+            self.client.force_authenticate(user)
+        response = self.client.get('/api/attendance/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        return response, chunks
+
+    def test_csv(self):
+        response, chunks = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="attendance.csv"')
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(rows[0], list(AttendanceExportSerializer().field_names))
+        expected = list(Attendance.objects.order_by('timestamp', 'id'))
+        self.assertEqual([int(row[0]) for row in rows[1:]], [a.pk for a in expected])
+        # Quotes and commas survive the round trip
+        self.assertEqual(rows[3][2], 'Doe, "JD"')
+        self.assertEqual([row[6] for row in rows[1:]].count('True'), 1)
+
+    def test_ndjson(self):
+        response, chunks = self.export(output='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertEqual(len(records), 14)
+        self.assertEqual(records[2]['username'], 'Doe, "JD"')
+        self.assertEqual(records[0]['timestamp'], AttendanceSerializer(Attendance.objects.order_by('timestamp').first())
+                         .data['timestamp'])
+
+    @override_settings(ATTENDANCE_EXPORT_CHUNK_SIZE=4)
+    def test_written_in_chunks(self):
+        _, chunks = self.export()
+        # Header plus 14 rows, 4 lines per write
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual([chunk.count('\r\n') for chunk in chunks], [4, 4, 4, 3])
+
+    def test_filters_and_permissions(self):
+        day = timezone.localdate(self.start).strftime('%Y-%m-%d')
+        response, chunks = self.export(output='ndjson', type='clock-out', date_from=day, date_to=day)
+        self.assertTrue(response['Content-Disposition'].endswith(f'filename="attendance-{day}-{day}.ndjson"'))
+        records = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        self.assertTrue(records)
+        self.assertEqual({record['type'] for record in records}, {'clock-out'})
+
+        _, chunks = self.export(user=self.worker, output='ndjson')
+        self.assertEqual({json.loads(line)['user_id'] for line in ''.join(chunks).splitlines()}, {self.worker.pk})
+
+        self.assertEqual(self.client.get('/api/attendance/export/', {'output': 'xml'}).status_code, 400)
+
+
+class IdempotencyTests(TestCase):
+    """Retries with an Idempotency-Key get the first response back, even when throttled"""
+
+    def setUp(self):
+        cache.clear()
+        get_throttle_backend.cache_clear()
+        self.user = User.objects.create_user(username='retry', password='x')
+        Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.location = {'latitude': 6.5244, 'longitude': 3.3792}
+
+    def clock_in(self, key, data=None, url='/api/attendance/clock-in/', **headers):
+        return self.client.post(url, data or self.location, format='json', HTTP_IDEMPOTENCY_KEY=key, **headers)
+
+    def test_replay(self):
+        first = self.clock_in('abc')
+        self.assertEqual(first.status_code, 201)
+        again = self.clock_in('abc')
+        self.assertEqual(again.status_code, 201)
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(again.data, first.data)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+        # A new key runs the view, and is refused by the clock state
+        self.assertEqual(self.clock_in('def').status_code, 400)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.clock_in('abc')
+        response = self.clock_in('abc', {'latitude': 6.5245, 'longitude': 3.3792})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.clock_in('x' * 256).status_code, 400)
+
+    def test_retry_while_the_first_request_runs(self):
+        retries = []
+
+        def retry(*args):
+            retries.append(self.clock_in('abc'))
+
+        with mock.patch.object(ClockInOutView, 'validate_attendance_sequence', side_effect=retry):
+            self.assertEqual(self.clock_in('abc').status_code, 201)
+        self.assertEqual(retries[0].status_code, 409)
+        self.assertNotIn('Idempotent-Replayed', retries[0])
+
+    def test_server_errors_are_not_stored(self):
+        with mock.patch.object(ClockInOutView, 'get_nearest_geofence', side_effect=RuntimeError), \
+                self.assertLogs('attendance.views', 'ERROR'):
+            self.assertEqual(self.clock_in('abc').status_code, 500)
+        self.assertEqual(self.clock_in('abc').status_code, 201)
+
+    @mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'attendance_write': '1/min'})
+    def test_replays_are_not_throttled(self):
+        self.assertEqual(self.clock_in('abc').status_code, 201)
+        self.assertEqual(self.clock_in('abc').status_code, 201)
+        self.assertEqual(self.clock_in('def').status_code, 429)
+
+        token = AccessToken.for_user(self.user)
+        url = '/api/async/attendance/clock-out/'
+        self.client.force_authenticate(None)
+        self.assertEqual(self.clock_in('async', url=url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 429)
+        get_throttle_backend.cache_clear()
+        self.assertEqual(self.clock_in('async', url=url, HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 201)
+        replay = self.clock_in('async', url=url, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+
+
+class AsyncViewTests(TestCase):
+    """The async endpoints answer bad bodies with 400, like their sync counterparts"""
+
+    def setUp(self):
+        cache.clear()
+        get_throttle_backend.cache_clear()
+        user = User.objects.create_user(username='async', password='x')
+        Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=user)
+        self.client = APIClient(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+    def test_body_must_be_a_json_object(self):
+        for url in ('/api/async/attendance/clock-in/', '/api/async/attendance/auto-clockout/'):
+            for body in ('[6.5244, 3.3792]', '"6.5244,3.3792"', '42', 'null'):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (url, body))
+                self.assertEqual(response.json(), {'error': 'Request body must be a JSON object'})
+        self.assertEqual(Attendance.objects.count(), 0)
+
+    def test_clock_in(self):
+        url = '/api/async/attendance/clock-in/'
+        response = self.client.post(url, {'latitude': 6.5244, 'longitude': 3.3792}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['geofence']['name'], 'HQ')
+        self.assertEqual(self.client.post(url, {'latitude': 6.5244}, format='json').status_code, 400)
+
+
+class TokenBucketTests(TestCase):
+    """Buckets allow a burst, refill at the rate, and answer 429 with Retry-After when empty"""
+
+    def setUp(self):
+        cache.clear()
+        get_throttle_backend.cache_clear()
+        self.now = 1000.0
+
+    def clock(self):
+        return self.now
+
+    def check_backend(self, backend, clock):
+        with mock.patch(clock, self.clock):
+            self.assertEqual([backend.consume('k', 3, 0.5)[0] for _ in range(4)], [True, True, True, False])
+            allowed, wait = backend.consume('k', 3, 0.5)
+            self.assertFalse(allowed)
+            self.assertAlmostEqual(wait, 2.0)
+            self.now += 1.0
+            self.assertFalse(backend.consume('k', 3, 0.5)[0])
+            self.now += 1.0
+            self.assertTrue(backend.consume('k', 3, 0.5)[0])
+            # Refills stop at the capacity
+            self.now += 3600
+            self.assertEqual([backend.consume('k', 3, 0.5)[0] for _ in range(4)], [True, True, True, False])
+            self.assertTrue(backend.consume('other', 3, 0.5)[0])
+
+    def test_local_backend(self):
+        self.check_backend(LocalTokenBucketBackend(), 'attendance.throttling.time.monotonic')
+
+    def test_cache_backend(self):
+        self.check_backend(CacheTokenBucketBackend(), 'attendance.throttling.time.time')
+
+    def test_local_backend_forgets_least_recent_keys(self):
+        backend = LocalTokenBucketBackend(max_keys=2)
+        backend.consume('a', 1, 0.001)
+        backend.consume('b', 1, 0.001)
+        backend.consume('a', 1, 0.001)
+        backend.consume('c', 1, 0.001)
+        # 'a' is still empty, 'b' was dropped so it starts full again
+        self.assertFalse(backend.consume('a', 1, 0.001)[0])
+        self.assertTrue(backend.consume('b', 1, 0.001)[0])
+
+    @mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'attendance_write': '2/min', 'attendance_write_admin': '4/min'})
+    def test_views_answer_429(self):
+        employee = User.objects.create_user(username='worker', password='x')
+        admin = User.objects.create_user(username='boss', password='x', role='admin')
+        client = APIClient()
+
+        def post(user):
+            client.force_authenticate(user)
+            return client.post('/api/attendance/clock-in/', {}, format='json')
+
+        self.assertEqual([post(employee).status_code for _ in range(3)], [400, 400, 429])
+        response = post(employee)
+        self.assertEqual(int(response['Retry-After']), 30)
+        self.assertEqual([post(admin).status_code for _ in range(5)], [400, 400, 400, 400, 429])
+
+        with override_settings(ATTENDANCE_THROTTLE_ENABLED=False):
+            self.assertEqual(post(employee).status_code, 400)
+
+    @mock.patch.dict(TokenBucketThrottle.THROTTLE_RATES, {'attendance_write': '1/min', 'attendance_write_global': '3/min'})
+    def test_refused_requests_spend_no_other_tokens(self):
+        users = [User.objects.create_user(username=f'worker{i}', password='x') for i in range(3)]
+        client = APIClient()
+        client.force_authenticate(users[0])
+        # The per-user bucket refuses these before the global one is asked
+        for _ in range(5):
+            client.post('/api/attendance/clock-in/', {}, format='json')
+        codes = []
+        for user in users[1:]:
+            client.force_authenticate(user)
+            codes.append(client.post('/api/attendance/clock-in/', {}, format='json').status_code)
+        self.assertEqual(codes, [400, 400])
+
+
+@override_settings(ATTENDANCE_THROTTLE_ENABLED=False)
+class ConcurrentClockTests(TransactionTestCase):
+    """Parallel clock-ins and clock-outs must neither lose nor duplicate attendance"""
+    users = 6
+    racers = 4
+    cycles = 5
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a database file shared by the threads (SQLITE_PRODUCTION_PROFILE=1)")
+        # The flush between tests sends no signals: drop the cached geofence index
+        cache.clear()
+        self.employees = [User.objects.create_user(username=f'employee{i}', password='x') for i in range(self.users)]
+        Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=self.employees[0])
+
+    def clock(self, user, action):
+        client = APIClient()
+        client.force_authenticate(user)
+        try:
+            response = client.post(f'/api/attendance/{action}/', {'latitude': 6.5244, 'longitude': 3.3792}, format='json')
+            return user.pk, response.status_code
+        finally:
+            connection.close()
+
+    def run_parallel(self, func, tasks):
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            return list(executor.map(lambda task: func(*task), tasks))
+
+    def test_racing_clock_ins_record_exactly_one(self):
+        tasks = [(user, 'clock-in') for user in self.employees for _ in range(self.racers)]
+        random.Random(7).shuffle(tasks)
+        results = self.run_parallel(self.clock, tasks)
+
+        self.assertEqual({code for _, code in results} - {201, 400}, set(), msg=results)
+        accepted = Counter(pk for pk, code in results if code == 201)
+        for user in self.employees:
+            self.assertEqual(accepted[user.pk], 1)
+            self.assertEqual(Attendance.objects.filter(user=user).count(), 1)
+            self.assertTrue(AttendanceState.objects.get(pk=user.pk).is_clocked_in)
+
+    def test_parallel_clock_cycles_lose_nothing(self):
+        def cycle(user):
+            return [self.clock(user, action)[1] for _ in range(self.cycles) for action in ('clock-in', 'clock-out')]
+
+        results = self.run_parallel(cycle, [(user,) for user in self.employees])
+
+        for user, codes in zip(self.employees, results):
+            self.assertEqual(codes, [201] * 2 * self.cycles)
+            attendances = list(Attendance.objects.filter(user=user).order_by('timestamp', 'id'))
+            self.assertEqual([a.type for a in attendances], ['clock-in', 'clock-out'] * self.cycles)
+            state = AttendanceState.objects.get(pk=user.pk)
+            self.assertFalse(state.is_clocked_in)
+            self.assertEqual(state.last_attendance_id, attendances[-1].id)
+
+
+class AttendanceReportPermissionTests(TestCase):
+    """Employees see organisation-wide totals and their own counts, never other users'"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='boss', password='x', role='admin')
+        self.employee = User.objects.create_user(username='worker', password='x')
+        self.other = User.objects.create_user(username='other', password='x')
+        site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=self.admin)
+        for user in (self.employee, self.other):
+            record_attendance(user, 'clock-in', site, 6.5244, 3.3792)
+        self.start_date = timezone.localdate().strftime('%Y-%m-%d')
+
+    def get(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get('/api/reports/attendance/', {'start_date': self.start_date, **params})
+
+    def test_employee_cannot_see_other_users(self):
+        self.assertEqual(self.get(self.employee, breakdown='user').status_code, 403)
+        self.assertEqual(self.get(self.employee, user_id=self.other.pk).status_code, 403)
+
+    def test_employee_sees_totals_and_own_counts(self):
+        response = self.get(self.employee)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[-1]['clock_in'], 2)
+        response = self.get(self.employee, user_id=self.employee.pk)
+        self.assertEqual(response.data[-1]['clock_in'], 1)
+
+    def test_admin_sees_breakdown_by_user(self):
+        response = self.get(self.admin, breakdown='user')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(row['user']['name'] for row in response.data), ['other', 'worker'])
+
+    def test_start_date_is_required(self):
+        client = APIClient()
+        client.force_authenticate(self.employee)
+        self.assertEqual(client.get('/api/reports/attendance/').status_code, 400)
+        self.assertEqual(client.get('/api/reports/attendance/', {'start_date': 'soon'}).status_code, 400)
+
+
+class RollupTests(TestCase):
+    """The daily rollup follows attendance written outside the services too"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='worker', password='x')
+        self.site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200,
+                                            created_by=self.user)
+        self.today = timezone.localdate()
+
+    def counts(self):
+        # Rows emptied by decrements are kept, with zero counts
+        return sorted(DailyAttendanceRollup.objects.exclude(clock_ins=0, clock_outs=0).values_list(
+            'day', 'geofence_id', 'user_id', 'clock_ins', 'clock_outs', 'auto_clock_outs'
+        ))
+
+    def assertMatchesRebuild(self):
+        counts = self.counts()
+        rebuild_rollups()
+        self.assertEqual(counts, self.counts())
+
+    def test_created_and_edited_records(self):
+        record_attendance(self.user, 'clock-in', self.site, 6.5244, 3.3792)
+        # As the admin does it
+        attendance = Attendance.objects.create(user=self.user, geofence=self.site, type='clock-out',
+                                               latitude=6.5244, longitude=3.3792)
+        self.assertEqual(self.counts(), [(self.today, self.site.pk, self.user.pk, 1, 1, 0)])
+
+        attendance.type = 'clock-in'
+        attendance.save()
+        self.assertEqual(self.counts(), [(self.today, self.site.pk, self.user.pk, 2, 0, 0)])
+        self.assertMatchesRebuild()
+
+        attendance.timestamp -= timedelta(days=1)
+        attendance.type, attendance.is_auto = 'clock-out', True
+        attendance.save()
+        self.assertEqual(self.counts(), [
+            (self.today - timedelta(days=1), self.site.pk, self.user.pk, 0, 1, 1),
+            (self.today, self.site.pk, self.user.pk, 1, 0, 0),
+        ])
+        self.assertMatchesRebuild()
+
+        attendance.delete()
+        self.assertEqual(self.counts(), [(self.today, self.site.pk, self.user.pk, 1, 0, 0)])
+
+
+class TimesheetTests(TestCase):
+    """Clock-ins pair with the next clock-out of the same user; anything else is flagged"""
+
+    def at(self, day, hour):
+        return timezone.make_aware(datetime(2024, 3, day, hour))
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='worker', password='x')
+        other = User.objects.create_user(username='other', password='x')
+        self.site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=self.user)
+        events = [
+            (1, 9, 'clock-in', False), (1, 17, 'clock-out', False),  # 8h
+            (2, 9, 'clock-in', False), (2, 10, 'clock-in', False), (2, 12, 'clock-out', True),  # unmatched, 2h auto
+            (3, 8, 'clock-out', False),  # unmatched
+            (4, 22, 'clock-in', False), (5, 2, 'clock-out', False),  # 4h across midnight
+            (6, 9, 'clock-in', False), (6, 17, 'clock-out', False),  # outside the period
+        ]
+        Attendance.objects.bulk_create(
+            [Attendance(user=self.user, geofence=self.site, timestamp=self.at(day, hour), type=kind,
+                        latitude=6.5244, longitude=3.3792, is_auto=is_auto)
+             for day, hour, kind, is_auto in events] +
+            # Interleaved events of another user must not pair with these
+            [Attendance(user=other, geofence=self.site, timestamp=self.at(1, 12), type='clock-out',
+                        latitude=6.5244, longitude=3.3792)]
+        )
+
+    def test_pairs_flags_and_totals(self):
+        timesheet = Timesheet(self.at(1, 0), self.at(5, 0), user_id=self.user.pk).compute()
+
+        self.assertEqual(timesheet.totals(), {
+            'hours': 14.0, 'shifts': 3, 'auto_clock_outs': 1,
+            'unmatched_clock_ins': 1, 'unmatched_clock_outs': 1, 'open_shifts': 0,
+        })
+        self.assertEqual([(row['date'], row['hours']) for row in timesheet.results()], [
+            ('2024-03-01', 8.0), ('2024-03-02', 2.0), ('2024-03-03', 0.0), ('2024-03-04', 4.0),
+        ])
+        self.assertEqual(
+            [(exception['flag'], exception['timestamp']) for exception in timesheet.exceptions],
+            [(UNMATCHED_CLOCK_IN, self.at(2, 9)), (AUTO_CLOCK_OUT, self.at(2, 12)), (UNMATCHED_CLOCK_OUT, self.at(3, 8))],
+        )
+
+    def test_open_shift_has_no_hours(self):
+        clock_in = Attendance.objects.create(user=self.user, geofence=self.site, type='clock-in',
+                                             latitude=6.5244, longitude=3.3792)
+        start = clock_in.timestamp - timedelta(hours=1)
+        timesheet = Timesheet(start, start + timedelta(days=1), user_id=self.user.pk).compute()
+
+        self.assertEqual(timesheet.totals()['open_shifts'], 1)
+        self.assertEqual(timesheet.totals()['hours'], 0)
+        self.assertEqual(timesheet.exceptions, [])
+
+
+class PayrollRunnerTests(TestCase):
+    """Saved chunks are checkpoints: a rerun only computes users without an entry"""
+
+    def test_resume_computes_only_missing_users(self):
+        users = [User.objects.create_user(username=f'payee{i}', password='x') for i in range(5)]
+        site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=users[0])
+        for user in users:
+            for hour, kind in ((9, 'clock-in'), (17, 'clock-out')):
+                Attendance.objects.create(user=user, geofence=site, type=kind, latitude=6.5244, longitude=3.3792,
+                                          timestamp=timezone.make_aware(datetime(2024, 3, 4, hour)))
+
+        runner = PayrollRunner(datetime(2024, 3, 1).date(), datetime(2024, 3, 31).date(), workers=0, chunk_size=2)
+        run = runner.get_run()
+        first = runner.execute(runner.chunks(runner.pending_users(run)))
+        save_chunk(run, next(first))  # Then "crash"
+        first.close()
+
+        results = runner.run(run)
+
+        self.assertEqual(sum(len(result.user_ids) for result in results), 3)
+        self.assertEqual(PayrollEntry.objects.filter(run=run).count(), 5)
+        self.assertEqual({entry.hours for entry in PayrollEntry.objects.filter(run=run)}, {8})
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'completed')
+
+
+class GeofenceVersionTests(TestCase):
+    """Unchanged geofence sets answer 304, deltas carry changes and tombstones"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='phone', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.kept = Geofence.objects.create(name='Kept', latitude=6.5, longitude=3.3, radius=100, created_by=self.user)
+        self.moved = Geofence.objects.create(name='Moved', latitude=6.6, longitude=3.3, radius=100, created_by=self.user)
+        self.removed = Geofence.objects.create(name='Removed', latitude=6.7, longitude=3.3, radius=100, created_by=self.user)
+
+    def test_etag_and_delta(self):
+        response = self.client.get('/api/geofences/')
+        version, etag = response.data['version'], response['ETag']
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual(self.client.get('/api/geofences/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # The new version is published when the change commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.moved.radius = 150
+            self.moved.save()
+            removed_id = self.removed.pk
+            self.removed.delete()
+            added = Geofence.objects.create(name='Added', latitude=6.8, longitude=3.3, radius=100, created_by=self.user)
+
+        self.assertEqual(self.client.get('/api/geofences/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        response = self.client.get('/api/geofences/', {'since': version}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['full'])
+        self.assertEqual([geofence['id'] for geofence in response.data['geofences']], [self.moved.pk, added.pk])
+        self.assertEqual(response.data['deleted'], [removed_id])
+        self.assertGreater(response.data['version'], version)
+
+        response = self.client.get('/api/geofences/', {'since': response.data['version']},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+# A 1 km square around (6.52, 3.37) with a notch cut into its top edge
+NOTCHED = 'POLYGON((3.36 6.51, 3.38 6.51, 3.38 6.53, 3.372 6.53, 3.372 6.52, 3.368 6.52, 3.368 6.53, 3.36 6.53, 3.36 6.51))'
+WITH_HOLE = ('POLYGON((3.36 6.51, 3.38 6.51, 3.38 6.53, 3.36 6.53, 3.36 6.51), '
+             '(3.365 6.515, 3.375 6.515, 3.375 6.525, 3.365 6.525, 3.365 6.515))')
+
+
+class PolygonGeofenceTests(TestCase):
+    """Polygon geofences: containment, validation, simplification and derived columns"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='boss', password='x', role='admin', is_staff=True)
+
+    def test_concave_containment(self):
+        boundary = PreparedBoundary(parse_boundary(NOTCHED))
+        self.assertTrue(boundary.contains(6.515, 3.37))
+        self.assertTrue(boundary.contains(6.525, 3.365))
+        # Inside the enclosing circle and bounding box, but in the notch
+        self.assertFalse(boundary.contains(6.525, 3.37))
+
+        boundary = PreparedBoundary(parse_boundary(WITH_HOLE))
+        self.assertTrue(boundary.contains(6.512, 3.37))
+        self.assertFalse(boundary.contains(6.52, 3.37))
+        self.assertFalse(boundary.contains(6.52, 3.39))
+
+    def test_boundary_distance(self):
+        boundary = PreparedBoundary(parse_boundary(WITH_HOLE))
+        # From the middle of the hole to its nearer (east/west) edge, and from outside to the outer ring
+        self.assertAlmostEqual(boundary.boundary_distance(6.52, 3.37), haversine_distance(6.52, 3.37, 6.52, 3.365), delta=1)
+        self.assertAlmostEqual(boundary.boundary_distance(6.52, 3.39), haversine_distance(6.52, 3.39, 6.52, 3.38), delta=1)
+
+    def test_rejects_invalid_boundaries(self):
+        for boundary in (
+            'POLYGON((3.36 6.51, 3.38 6.53, 3.38 6.51, 3.36 6.53, 3.36 6.51))',  # Self-intersecting bow tie
+            'LINESTRING(3.36 6.51, 3.38 6.53)',
+            'not a polygon',
+        ):
+            with self.assertRaises(ValueError):
+                parse_boundary(boundary)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post('/api/geofences/', {
+            'name': 'Bow tie', 'boundary': 'POLYGON((3.36 6.51, 3.38 6.53, 3.38 6.51, 3.36 6.53, 3.36 6.51))',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('boundary', response.data)
+        self.assertFalse(Geofence.objects.exists())
+
+    @override_settings(GEOFENCE_POLYGON_SIMPLIFY_THRESHOLD=100, GEOFENCE_POLYGON_SIMPLIFY_TOLERANCE=0.0001)
+    def test_simplifies_large_rings(self):
+        # A 1 km circle drawn with 2000 vertices
+        ring = [destination(6.52, 3.37, 1000, bearing * 360 / 2000) for bearing in range(2000)]
+        wkt = 'POLYGON((%s))' % ', '.join(f'{lng} {lat}' for lat, lng in ring + ring[:1])
+        boundary = PreparedBoundary(parse_boundary(wkt))
+        self.assertLess(boundary.num_coords, 200)
+        self.assertTrue(boundary.contains(6.52, 3.37))
+        self.assertTrue(boundary.contains(*destination(6.52, 3.37, 980, 45)))
+        self.assertFalse(boundary.contains(*destination(6.52, 3.37, 1020, 45)))
+
+        with override_settings(GEOFENCE_POLYGON_SIMPLIFY_THRESHOLD=5000):
+            self.assertEqual(PreparedBoundary(parse_boundary(wkt)).num_coords, 2001)
+
+    def test_derived_columns(self):
+        geofence = Geofence.objects.create(name='Campus', latitude=0, longitude=0, radius=0,
+                                           boundary=NOTCHED, created_by=self.admin)
+        self.assertEqual(
+            (geofence.min_latitude, geofence.min_longitude, geofence.max_latitude, geofence.max_longitude),
+            (6.51, 3.36, 6.53, 3.38),
+        )
+        self.assertAlmostEqual(geofence.latitude, parse_boundary(NOTCHED).centroid.y)
+        # The enclosing circle reaches every corner
+        self.assertGreaterEqual(geofence.radius, haversine_distance(geofence.latitude, geofence.longitude, 6.51, 3.36))
+
+        geofence.boundary = ''
+        geofence.latitude, geofence.longitude, geofence.radius = 6.52, 3.37, 100
+        geofence.save()
+        geofence.refresh_from_db()
+        self.assertIsNone(geofence.boundary)
+        self.assertIsNone(geofence.min_latitude)
+        self.assertIsNone(geofence.max_longitude)
+
+    def test_outside_polygon_reports_distance_to_edge(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Geofence.objects.create(name='Campus', latitude=0, longitude=0, radius=0,
+                                    boundary=NOTCHED, created_by=self.admin)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='worker', password='x'))
+        response = client.post('/api/attendance/clock-in/', {'latitude': 6.525, 'longitude': 3.37}, format='json')
+        self.assertEqual(response.status_code, 403)
+        nearest = response.data['details']['nearest_geofence']
+        self.assertTrue(nearest['boundary'])
+        self.assertNotIn('required_radius', nearest)
+        # 0.002 degrees of longitude to either side of the notch
+        self.assertAlmostEqual(nearest['distance'], haversine_distance(6.525, 3.37, 6.525, 3.372), delta=1)
+
+
+class LeanListTests(TestCase):
+    """`?lean=1` must render exactly what the DRF serializers render"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='boss', password='x', role='admin', is_staff=True,
+                                              email='boss@example.com', first_name='Ada')
+        worker = User.objects.create_user(username='worker', password='x')
+        circle = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=self.admin)
+        campus = Geofence.objects.create(name='Campus', latitude=0, longitude=0, radius=0, boundary=NOTCHED,
+                                         created_by=self.admin)
+        record_attendance(worker, 'clock-in', circle, 6.5244, 3.3792)
+        record_attendance(worker, 'clock-out', campus, 6.515, 3.37)
+        Attendance.objects.create(user=self.admin, type='clock-in', latitude=1.5, longitude=2.5)
+        Complaint.objects.create(user=worker, subject='Late', message='Bus', admin_response='Noted')
+        Complaint.objects.create(user=self.admin, subject='Test', message='Ignore')
+        LoginLog.objects.create(user=worker, ip_address='10.0.0.1', user_agent='phone', logout_time=timezone.now())
+        LoginLog.objects.create(user=self.admin)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def assertLeanMatches(self, url):
+        full = self.client.get(url).json()
+        lean = self.client.get(url, {'lean': 1}).json()
+        self.assertTrue(full)
+        self.assertEqual(lean, full)
+
+    def test_attendance(self):
+        self.assertLeanMatches('/api/attendance/')
+
+    def test_complaints(self):
+        self.assertLeanMatches('/api/complaints/')
+
+    def test_login_logs(self):
+        self.assertLeanMatches('/api/login-logs/')
+
+
+class LoginLogTests(TestCase):
+    """Batched logins end up as one session row, whichever process sees the logout"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='worker', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.writer = LoginLogWriter()
+
+    def login(self, minutes_ago=0):
+        return LoginLog(user=self.user, login_time=timezone.now() - timedelta(minutes=minutes_ago),
+                        ip_address='10.0.0.1', user_agent='phone')
+
+    def test_logout_closes_the_open_session(self):
+        self.writer.write_batch([self.login(60), self.login(5)])
+        self.assertEqual(LoginLog.objects.filter(logout_time__isnull=True).count(), 2)
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        latest, earlier = LoginLog.objects.order_by('-login_time')
+        self.assertIsNotNone(latest.logout_time)
+        self.assertIsNone(earlier.logout_time)
+
+    def test_logout_without_ever_logging_in(self):
+        response = self.client.post('/api/logout/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'No active login session found'})
+        self.assertFalse(LoginLog.objects.exists())
+
+    def test_second_logout(self):
+        self.writer.write_batch([self.login(5)])
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertEqual(self.client.post('/api/logout/').status_code, 400)
+        self.assertEqual(LoginLog.objects.count(), 1)
+        self.assertEqual(LoginLog.objects.filter(logout_time__isnull=True).count(), 0)
+
+    def test_login_written_after_its_logout(self):
+        earlier, login = self.login(60), self.login(5)
+        # Still queued in another process: the logout is kept for that writer
+        self.assertEqual(self.client.post('/api/logout/').status_code, 400)
+        self.assertFalse(LoginLog.objects.exists())
+
+        later = self.login(-1)
+        self.writer.write_batch([earlier, login, later])
+        self.assertEqual(self.writer.counters['closed'], 1)
+        self.assertEqual(LoginLog.objects.count(), 3)
+        closed = LoginLog.objects.get(logout_time__isnull=False)
+        self.assertEqual((closed.login_time, closed.ip_address), (login.login_time, '10.0.0.1'))
+        self.assertGreater(closed.logout_time, closed.login_time)
+        self.assertIsNone(cache.get(pending_logout_key(self.user.pk)))
+
+        # Applied once
+        self.writer.write_batch([self.login(3)])
+        self.assertEqual(LoginLog.objects.filter(logout_time__isnull=True).count(), 3)
+
+    @override_settings(LOGIN_LOG_ASYNC=False)
+    def test_synchronous_writes_apply_it_too(self):
+        self.client.post('/api/logout/')
+        self.writer.log(self.login(5))
+        self.assertIsNotNone(LoginLog.objects.get().logout_time)
+
+
+class LoginLogFlushTests(TransactionTestCase):
+    """A logout finds a login still queued in its own process"""
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Needs a database file shared by the threads (SQLITE_PRODUCTION_PROFILE=1)")
+        self.user = User.objects.create_user(username='worker', password='x')
+
+    def test_logout_flushes_the_writer(self):
+        writer = LoginLogWriter(flush_interval=60)
+        self.addCleanup(writer.close)
+        writer.log(LoginLog(user=self.user, ip_address='10.0.0.1', user_agent='phone'))
+        self.assertFalse(LoginLog.objects.exists())
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('attendance.views.login_log_writer', writer):
+            self.assertEqual(client.post('/api/logout/').status_code, 200)
+        session = LoginLog.objects.get()
+        self.assertEqual(session.ip_address, '10.0.0.1')
+        self.assertIsNotNone(session.logout_time)
+        self.assertEqual(writer.stats()['written'], 1)
+
+
+@override_settings(LOCATION_TRAIL_CHUNK_POINTS=10)
+class LocationTrailTests(TestCase):
+    """Trails keep every point in time order, whatever order the batches arrive in"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='walker', password='x')
+        site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=200, created_by=user)
+        self.shift = record_attendance(user, 'clock-in', site, 6.5244, 3.3792)
+        self.start = self.shift.timestamp.replace(microsecond=0)
+        self.rng = random.Random(20241018)
+
+    def points(self, count, step=5):
+        lat, lng = 6.5244, 3.3792
+        points = []
+        for i in range(count):
+            lat += self.rng.uniform(-0.0002, 0.0002)
+            lng += self.rng.uniform(-0.0002, 0.0002)
+            points.append((round(lat, 5), round(lng, 5), self.start + timedelta(seconds=i * step)))
+        return points
+
+    def append(self, points):
+        return append_to_trail(self.shift.pk, self.shift.user_id, points)
+
+    def test_codec_round_trip(self):
+        for value in (0, 1, -1, 63, -64, 64, 2 ** 31, -(2 ** 31), 2 ** 62):
+            self.assertEqual(unzigzag(zigzag(value)), value)
+            data = bytearray()
+            write_varint(data, zigzag(value))
+            self.assertEqual(len(data), max(1, math.ceil(zigzag(value).bit_length() / 7)))
+
+        points = [(652440 + self.rng.randint(-5000, 5000), -337920 + self.rng.randint(-5000, 5000), 1_700_000_000 + i)
+                  for i in range(200)]
+        decoded = list(decode(encode(5, points)))
+        self.assertEqual([(round(lat * 1e5), round(lng * 1e5), seconds) for lat, lng, seconds in decoded], points)
+
+    def test_round_trip_across_chunks(self):
+        points = self.points(35)
+        self.assertEqual(self.append(points)['appended'], 35)
+        self.assertEqual(list(read_trail(self.shift.pk)), points)
+        chunks = LocationTrail.objects.filter(attendance=self.shift).order_by('sequence')
+        self.assertEqual([chunk.point_count for chunk in chunks], [10, 10, 10, 5])
+        self.assertEqual([chunk.sealed for chunk in chunks], [True, True, True, False])
+
+    def test_late_and_same_second_points_are_kept(self):
+        points = self.points(30)
+        self.append(points[10:])
+        # A late batch from another worker, covering sealed and open chunks
+        counts = self.append(points[:10] + [points[25]])
+        self.assertEqual(counts['merged'], 10)
+        self.assertEqual(counts['duplicates'], 1)
+
+        same_second = (points[-1][0] + 0.0001, points[-1][1], points[-1][2])
+        counts = self.append([same_second, points[-1]])
+        self.assertEqual((counts['merged'], counts['duplicates']), (1, 1))
+
+        self.assertEqual(list(read_trail(self.shift.pk)), points + [same_second])
+        self.assertEqual(trail_stats(LocationTrail.objects.filter(attendance=self.shift))['points'], 31)
+
+    def test_range_read(self):
+        points = self.points(35)
+        self.append(points)
+        start, end = points[12][2], points[27][2]
+        self.assertEqual(list(read_trail(self.shift.pk, start, end)), points[12:28])
+        # The start is compared to the second
+        self.assertEqual(list(read_trail(self.shift.pk, start + timedelta(microseconds=500000), end))[0], points[12])
+        self.assertEqual(list(read_trail(self.shift.pk, end + timedelta(days=1))), [])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(list(read_trail(self.shift.pk, points[31][2]))), 4)
+
+    def test_stats(self):
+        self.append(self.points(35))
+        stats = trail_stats()
+        self.assertEqual((stats['chunks'], stats['sealed_chunks'], stats['points']), (4, 3, 35))
+        self.assertEqual(stats['bytes'], sum(len(chunk.data) for chunk in LocationTrail.objects.all()))
+        self.assertEqual(stats['bytes_per_point'], round(stats['bytes'] / 35, 2))
+        self.assertLess(stats['bytes_per_point'], 20)
+        self.assertGreater(stats['compression_ratio'], 4)
+
+
+@override_settings(LOCATION_PING_ASYNC=False, LOCATION_TRAIL_ASYNC=False, GEOFENCE_EXIT_MARGIN_M=25,
+                   GEOFENCE_EXIT_DWELL_SECONDS=120, GEOFENCE_EXIT_MIN_PINGS=2, LOCATION_PING_MAX_ACCURACY_M=100)
+class ExitDetectionTests(TestCase):
+    """A user clocked in is clocked out once their pings stay outside the geofence for the dwell time"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='walker', password='x')
+        # Limit 110m with the buffer, clearly outside beyond 135m
+        self.site = Geofence.objects.create(name='HQ', latitude=6.5244, longitude=3.3792, radius=100,
+                                            created_by=self.user)
+        self.start = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        record_attendance(self.user, 'clock-in', self.site, 6.5244, 3.3792, timestamp=self.start)
+
+    def ping(self, distance, seconds, accuracy=10.0):
+        lat, lng = destination(6.5244, 3.3792, distance, 90)
+        return {'latitude': lat, 'longitude': lng, 'timestamp': self.start + timedelta(seconds=seconds),
+                'accuracy': accuracy}
+
+    def process(self, *pings):
+        return ExitDetector().process(self.user, list(pings))
+
+    def test_classifies_inside_band_and_outside(self):
+        detector = ExitDetector()
+        entry = get_geofence_index().get(self.site.pk)
+        for distance, accuracy, expected in [
+            (50, 10, INSIDE), (120, 0, BAND), (150, 0, OUTSIDE),
+            # The accuracy circle reaches back into the band
+            (150, 30, BAND),
+        ]:
+            ping = self.ping(distance, 0)
+            self.assertEqual(detector.classify(entry, ping['latitude'], ping['longitude'], accuracy)[0], expected)
+
+    def test_exit_confirmed_after_dwell_and_backdated(self):
+        first = self.ping(200, 60)
+        self.assertEqual(self.process(self.ping(20, 30), first), (LEAVING, None))
+        # Two outside pings, but not yet the dwell time since the first
+        self.assertEqual(self.process(self.ping(250, 150)), (LEAVING, None))
+
+        state, attendance = self.process(self.ping(300, 180))
+        self.assertEqual(state, CLOCKED_OUT)
+        self.assertEqual((attendance.type, attendance.is_auto), ('clock-out', True))
+        # At the time and place of the first outside ping
+        self.assertEqual(attendance.timestamp, first['timestamp'])
+        self.assertAlmostEqual(attendance.latitude, first['latitude'])
+        self.assertAlmostEqual(attendance.longitude, first['longitude'])
+        self.assertEqual(attendance.geofence, self.site)
+        self.assertFalse(get_attendance_state(self.user).is_clocked_in)
+        self.assertIsNone(cache.get(tracker_key(self.user.pk)))
+        self.assertEqual(self.process(self.ping(300, 240)), (NOT_CLOCKED_IN, None))
+
+    def test_single_outside_ping_is_not_an_exit(self):
+        self.assertEqual(self.process(self.ping(200, 60), self.ping(50, 600)), (INSIDE, None))
+        self.assertEqual(self.process(self.ping(200, 900)), (LEAVING, None))
+        self.assertTrue(get_attendance_state(self.user).is_clocked_in)
+
+    def test_band_keeps_state_and_inside_resets(self):
+        # Hovering at the edge does not start leaving
+        self.assertEqual(self.process(self.ping(120, 60), self.ping(125, 300)), (INSIDE, None))
+        # Nor does it stop it
+        self.assertEqual(self.process(self.ping(200, 360), self.ping(120, 600)), (LEAVING, None))
+        self.assertEqual(cache.get(tracker_key(self.user.pk))['outside_since'], self.start + timedelta(seconds=360))
+
+        # Back inside: the next exit starts over from its own first ping
+        self.assertEqual(self.process(self.ping(50, 660)), (INSIDE, None))
+        self.assertEqual(self.process(self.ping(200, 700), self.ping(200, 780)), (LEAVING, None))
+        state, attendance = self.process(self.ping(200, 820))
+        self.assertEqual(state, CLOCKED_OUT)
+        self.assertEqual(attendance.timestamp, self.start + timedelta(seconds=700))
+
+    def test_ignores_inaccurate_stale_and_out_of_order_pings(self):
+        self.assertEqual(self.process(
+            self.ping(500, 60, accuracy=300), self.ping(500, 300, accuracy=300),
+            # Taken before the clock-in
+            self.ping(500, -600), self.ping(500, -300),
+        ), (INSIDE, None))
+        self.assertEqual(self.process(self.ping(200, 400)), (LEAVING, None))
+        # Older than the last ping the tracker saw
+        self.assertEqual(self.process(self.ping(50, 350)), (LEAVING, None))
+        self.assertTrue(get_attendance_state(self.user).is_clocked_in)
+
+    def test_untracked_once_the_geofence_is_gone(self):
+        self.site.delete()
+        self.assertEqual(self.process(self.ping(500, 60), self.ping(500, 600)), (UNTRACKED, None))
+        # With the clock-in deleted along with its geofence, the pings are kept as rows
+        self.assertEqual(LocationPing.objects.filter(user=self.user).count(), 2)
+
+    def test_ping_endpoint_reports_the_auto_clock_out(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        pings = [self.ping(20, 30), self.ping(200, 60), self.ping(220, 200), self.ping(240, 240, accuracy=500)]
+        for ping in pings:
+            ping['timestamp'] = ping['timestamp'].isoformat()
+
+        response = client.post('/api/attendance/pings/', {'pings': pings}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['accepted'], response.data['state']), (4, CLOCKED_OUT))
+        auto = Attendance.objects.get(is_auto=True)
+        self.assertEqual(response.data['auto_clock_out']['id'], auto.pk)
+        self.assertEqual(auto.timestamp, self.start + timedelta(seconds=60))
+
+
+class SpatialBackendCheckTests(SimpleTestCase):
+    """The experimental SpatiaLite backend is flagged, unknown backends are refused"""
+
+    def test_check(self):
+        self.assertEqual(check_spatial_backend(None), [])
+        with override_settings(GEOFENCE_SPATIAL_BACKEND='spatialite'):
+            self.assertEqual([message.id for message in check_spatial_backend(None)], ['attendance.W001'])
+        with override_settings(GEOFENCE_SPATIAL_BACKEND='postgis'):
+            self.assertEqual([message.id for message in check_spatial_backend(None)], ['attendance.E001'])
+
+
+@override_settings(GEOFENCE_SPATIAL_BACKEND='spatialite')
+class SpatialiteMatchTests(TestCase):
+    """The SpatiaLite backend must match exactly like the haversine matcher"""
+
+    def setUp(self):
+        if not is_spatialite(connection):
+            self.skipTest("Needs a SpatiaLite database (GEOFENCE_SPATIAL_BACKEND=spatialite)")
+        self.rng = random.Random(20241018)
+        owner = User.objects.create_user(username='owner', password='x')
+        self.geofences = [
+            Geofence.objects.create(
+                name=f'Site {i}', created_by=owner,
+                latitude=self.rng.uniform(6.3, 6.7), longitude=self.rng.uniform(3.2, 3.6),
+                radius=self.rng.choice([20, 50, 150, 500, 2000]),
+            )
+            for i in range(80)
+        ]
+        self.geofences.append(Geofence.objects.create(
+            name='Campus', created_by=owner, latitude=0, longitude=0, radius=0,
+            boundary='POLYGON((3.30 6.50, 3.32 6.50, 3.32 6.52, 3.31 6.51, 3.30 6.52, 3.30 6.50))',
+        ))
+        self.geofences.append(Geofence.objects.create(
+            name='Date line', created_by=owner, latitude=-17.0, longitude=179.999, radius=5000,
+        ))
+
+    def test_matches_agree_with_haversine(self):
+        matcher = GeofenceMatcher(self.geofences)
+        points = [
+            destination(g.latitude, g.longitude, (g.radius + GEOFENCE_BUFFER_M) * self.rng.uniform(0, 1.5),
+                        self.rng.uniform(0, 360))
+            for g in self.rng.choices(self.geofences, k=1000)
+        ]
+        # And some far from every geofence
+        points += [(self.rng.uniform(-60, 60), self.rng.uniform(-180, 180)) for _ in range(50)]
+
+        for lat, lng in points:
+            expected = matcher.match(lat, lng)
+            actual = spatialite_match(lat, lng)
+            self.assertEqual(actual.geofence, expected.geofence, msg=(lat, lng))
+            if expected.geofence is None:
+                self.assertEqual(actual.nearest, expected.nearest, msg=(lat, lng))
+                self.assertAlmostEqual(actual.nearest_distance, expected.nearest_distance, places=6)
+            else:
+                self.assertAlmostEqual(actual.distance, expected.distance, places=6)
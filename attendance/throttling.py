@@ -0,0 +1,144 @@
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class LocalTokenBucketBackend:
+    """
+    In-process token buckets. Each check is a dict lookup and a little
+    arithmetic under a lock, so rejecting a request costs next to nothing.
+    The least recently used buckets are dropped beyond `max_keys`.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        """Take one token; returns (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class CacheTokenBucketBackend:
+    """
+    Token buckets kept in a Django cache so every process shares the same
+    limits. The read and write are not atomic: concurrent requests for one
+    key may occasionally both get the last token.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, rate):
+        now = time.time()
+        tokens, updated = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Expire once the bucket would be full again anyway
+        self.cache.set(key, (tokens, now), timeout=math.ceil(capacity / rate) + 1)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+@functools.lru_cache(maxsize=None)
+def get_throttle_backend():
+    options = dict(getattr(settings, 'ATTENDANCE_THROTTLE_BACKEND', {}))
+    backend = options.pop('BACKEND', 'attendance.throttling.LocalTokenBucketBackend')
+    return import_string(backend)(**options.get('OPTIONS', {}))
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Rate limit with a token bucket instead of DRF's request history: a rate
+    of 'N/period' (from DEFAULT_THROTTLE_RATES) allows a burst of N requests
+    and refills at N per period. Buckets live in the backend configured by
+    ATTENDANCE_THROTTLE_BACKEND.
+    """
+    cache_format = 'attendance:throttle:%(scope)s:%(ident)s'
+
+    def __init__(self):
+        # The scope, and with it the rate, is picked per request
+        self.wait_time = None
+
+    def get_scope(self, request):
+        return self.scope
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'ATTENDANCE_THROTTLE_ENABLED', True):
+            return True
+        # DRF asks every throttle even after one refused; don't spend the
+        # other buckets' tokens on a request that is rejected anyway
+        if getattr(request, '_attendance_throttled', False):
+            return True
+
+        self.scope = self.get_scope(request)
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+
+        capacity, duration = self.parse_rate(self.rate)
+        allowed, self.wait_time = get_throttle_backend().consume(key, capacity, capacity / duration)
+        if not allowed:
+            request._attendance_throttled = True
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class AttendanceWriteThrottle(TokenBucketThrottle):
+    """Per-user limit on attendance writes, with a separate limit for admins"""
+    scope = 'attendance_write'
+    admin_scope = 'attendance_write_admin'
+
+    def get_scope(self, request):
+        user = request.user
+        if getattr(user, 'role', None) == 'admin' or user.is_staff:
+            return self.admin_scope
+        return self.scope
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class GlobalAttendanceWriteThrottle(TokenBucketThrottle):
+    """
+    One bucket for all attendance writes, protecting the database writer.
+    Per process with the local backend, shared with the cache backend.
+    """
+    scope = 'attendance_write_global'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': 'all'}
+
+
+class LocationPingThrottle(AttendanceWriteThrottle):
+    """Per-user limit on location ping uploads"""
+    scope = 'location_ping'
+    admin_scope = 'location_ping'
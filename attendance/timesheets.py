@@ -0,0 +1,167 @@
+"""
+Worked hours from clock-in/clock-out pairs.
+
+One query pairs every clock-in with the next event of the same user using
+window functions (LEAD/LAG over user, timestamp, id). The clock-outs that
+close a shift are dropped by the database, so only clock-ins and stray
+clock-outs come back. They stream through a single pass that totals hours
+per day, geofence and user.
+
+A shift counts when a clock-in is directly followed by a clock-out within
+TIMESHEET_MAX_SHIFT_HOURS. It is reported on the local day and at the
+geofence of its clock-in. Everything else is flagged:
+
+- unmatched-clock-in: followed by another clock-in, by a clock-out later
+  than the longest shift, or by nothing for longer than the longest shift
+- unmatched-clock-out: not directly preceded by a clock-in
+- auto-clock-out: a counted shift closed by an automatic clock-out
+
+A clock-in with nothing after it yet, less than the longest shift ago, is
+an open shift: counted as open, without hours.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import BooleanField, Case, F, Value, When, Window
+from django.db.models.functions import Lag, Lead
+from django.utils import timezone
+
+from users.models import User
+from .models import Attendance, Geofence
+
+UNMATCHED_CLOCK_IN = 'unmatched-clock-in'
+UNMATCHED_CLOCK_OUT = 'unmatched-clock-out'
+AUTO_CLOCK_OUT = 'auto-clock-out'
+
+COUNTERS = ('shifts', 'auto_clock_outs', 'unmatched_clock_ins', 'unmatched_clock_outs', 'open_shifts')
+
+
+def paired_events(queryset):
+    """
+    (id, user_id, geofence_id, type, timestamp, next_type, next_timestamp,
+    next_is_auto, next_id) tuples of the clock-ins in `queryset` with the
+    user's next event, and of the clock-outs not directly following a
+    clock-in
+    """
+    def over(expression):
+        return Window(expression, partition_by=[F('user_id')], order_by=[F('timestamp').asc(), F('id').asc()])
+
+    return queryset.annotate(
+        next_type=over(Lead('type')),
+        next_timestamp=over(Lead('timestamp')),
+        next_is_auto=over(Lead('is_auto')),
+        next_id=over(Lead('id')),
+        prev_type=over(Lag('type')),
+    ).annotate(
+        closes_shift=Case(
+            When(type='clock-out', prev_type='clock-in', then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    ).filter(closes_shift=False).values_list(
+        'id', 'user_id', 'geofence_id', 'type', 'timestamp',
+        'next_type', 'next_timestamp', 'next_is_auto', 'next_id',
+    ).order_by()
+
+
+def new_row():
+    return dict.fromkeys(COUNTERS, 0) | {'seconds': 0.0}
+
+
+class Timesheet:
+    """Totals per (day, geofence, user) and flagged events over [start, end)"""
+
+    def __init__(self, start, end, user_id=None, geofence_id=None, max_shift=None, now=None, user_ids=None):
+        self.start = start
+        self.end = end
+        self.user_id = user_id
+        self.user_ids = user_ids
+        self.geofence_id = geofence_id
+        self.max_shift = max_shift or timedelta(hours=getattr(settings, 'TIMESHEET_MAX_SHIFT_HOURS', 24))
+        self.now = now or timezone.now()
+        self.rows = {}
+        self.exceptions = []
+        self.events_read = 0
+        # Looked up once, it is a context-local read on every call
+        self.tz = timezone.get_current_timezone()
+
+    def events(self):
+        # Read one longest shift around the period, so shifts crossing its
+        # edges still find their other half
+        queryset = Attendance.objects.filter(
+            timestamp__gte=self.start - self.max_shift, timestamp__lt=self.end + self.max_shift,
+        )
+        if self.user_id:
+            queryset = queryset.filter(user_id=self.user_id)
+        if self.user_ids is not None:
+            queryset = queryset.filter(user_id__in=self.user_ids)
+        return paired_events(queryset).iterator(chunk_size=5000)
+
+    def row(self, timestamp, geofence_id, user_id):
+        key = (timestamp.astimezone(self.tz).date(), geofence_id, user_id)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = new_row()
+        return row
+
+    def flag(self, flag, attendance_id, user_id, geofence_id, kind, timestamp):
+        self.exceptions.append({
+            'attendance': attendance_id,
+            'user': user_id,
+            'geofence': geofence_id,
+            'type': kind,
+            'timestamp': timestamp,
+            'flag': flag,
+        })
+
+    def compute(self):
+        start, end, max_shift, now, geofence_filter = self.start, self.end, self.max_shift, self.now, self.geofence_id
+        for (attendance_id, user_id, geofence_id, kind, timestamp,
+             next_type, next_timestamp, next_is_auto, next_id) in self.events():
+            self.events_read += 1
+            if not start <= timestamp < end or (geofence_filter and geofence_id != geofence_filter):
+                continue
+            row = self.row(timestamp, geofence_id, user_id)
+
+            if kind == 'clock-out':
+                row['unmatched_clock_outs'] += 1
+                self.flag(UNMATCHED_CLOCK_OUT, attendance_id, user_id, geofence_id, kind, timestamp)
+            elif next_type == 'clock-out' and next_timestamp - timestamp <= max_shift:
+                row['shifts'] += 1
+                row['seconds'] += (next_timestamp - timestamp).total_seconds()
+                if next_is_auto:
+                    row['auto_clock_outs'] += 1
+                    self.flag(AUTO_CLOCK_OUT, next_id, user_id, geofence_id, 'clock-out', next_timestamp)
+            elif next_type is None and now - timestamp <= max_shift:
+                row['open_shifts'] += 1
+            else:
+                row['unmatched_clock_ins'] += 1
+                self.flag(UNMATCHED_CLOCK_IN, attendance_id, user_id, geofence_id, kind, timestamp)
+
+        self.exceptions.sort(key=lambda exception: (exception['timestamp'], exception['attendance']))
+        return self
+
+    def results(self):
+        """Rows ordered by day, user and geofence, with user and geofence names"""
+        users = dict(User.objects.filter(pk__in={key[2] for key in self.rows}).values_list('id', 'username'))
+        geofences = dict(Geofence.objects.filter(pk__in={key[1] for key in self.rows}).values_list('id', 'name'))
+        return [
+            {
+                'date': day.strftime('%Y-%m-%d'),
+                'user': {'id': user_id, 'username': users.get(user_id)},
+                'geofence': {'id': geofence_id, 'name': geofences.get(geofence_id)},
+                'hours': round(row['seconds'] / 3600, 2),
+                **{counter: row[counter] for counter in COUNTERS},
+            }
+            for (day, geofence_id, user_id), row in sorted(
+                self.rows.items(), key=lambda item: (item[0][0], item[0][2], item[0][1] or 0)
+            )
+        ]
+
+    def totals(self):
+        totals = new_row()
+        for row in self.rows.values():
+            for field in totals:
+                totals[field] += row[field]
+        seconds = totals.pop('seconds')
+        return {'hours': round(seconds / 3600, 2), **totals}
@@ -0,0 +1,285 @@
+"""
+Delta-encoded location trails.
+
+As in Google's encoded polylines, coordinates are rounded to
+LOCATION_TRAIL_PRECISION decimals (5 is about 1.1m) and every point is
+stored as its difference from the previous one. The values are zigzag
+varints rather than printable characters, and each point's time is encoded
+the same way in whole seconds. Pings a few seconds and a few meters apart
+take 3-5 bytes, instead of a row per point.
+
+A shift's trail is split into LocationTrail chunks of at most
+LOCATION_TRAIL_CHUNK_POINTS points. Points in order are appended to the
+last one, which keeps the previous point in its columns so appending needs
+no decoding. A point older than the end of the trail (a late batch from
+another worker) is merged into the chunk covering its time, which is
+decoded and encoded again. Only exact repeats of a stored point are
+skipped. Full chunks are sealed and zlib-compressed. Reading decodes one
+chunk at a time and skips chunks outside the requested time range.
+"""
+import bisect
+import zlib
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Length
+
+from .models import LocationTrail
+from .services import retry_on_lock
+
+# A point queued for the trail of the shift started by `attendance_id` (the clock-in)
+TrailPoint = namedtuple('TrailPoint', ['attendance_id', 'user_id', 'latitude', 'longitude', 'timestamp'])
+
+# Bytes a point takes stored as a (id, user_id, latitude, longitude, timestamp)
+# row plus its (user_id, timestamp) index entry, measured on SQLite over 100k rows
+ROW_POINT_BYTES = 81
+
+
+def zigzag(value):
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode(data):
+    """Yield (latitude, longitude, seconds since the epoch) from an unsealed chunk's bytes"""
+    scale = 10 ** data[0]
+    values = []
+    value = shift = 0
+    lat = lng = seconds = 0
+    for byte in memoryview(data)[1:]:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(unzigzag(value))
+        value = shift = 0
+        if len(values) == 3:
+            lat += values[0]
+            lng += values[1]
+            seconds += values[2]
+            values.clear()
+            yield lat / scale, lng / scale, seconds
+
+
+def encode(precision, points):
+    """Bytes of an unsealed chunk holding (scaled latitude, scaled longitude, seconds) points"""
+    data = bytearray([precision])
+    lat = lng = seconds = 0
+    for point in points:
+        for delta in (point[0] - lat, point[1] - lng, point[2] - seconds):
+            write_varint(data, zigzag(delta))
+        lat, lng, seconds = point
+    return data
+
+
+def chunk_bytes(chunk):
+    data = bytes(chunk.data)
+    return zlib.decompress(data) if chunk.sealed else data
+
+
+class TrailAppender:
+    """
+    Adds points to the chunks of one shift, starting new chunks as they fill
+    up. `counts` tracks the points appended, merged (not after the end of
+    the trail) and skipped as duplicates.
+    """
+
+    def __init__(self, attendance_id, user_id):
+        self.attendance_id = attendance_id
+        self.user_id = user_id
+        self.precision = getattr(settings, 'LOCATION_TRAIL_PRECISION', 5)
+        self.chunk_points = getattr(settings, 'LOCATION_TRAIL_CHUNK_POINTS', 1000)
+        # Locks the shift's chunks until the transaction ends, so writers of one shift take turns
+        self.chunks = list(
+            LocationTrail.objects.select_for_update().filter(attendance_id=attendance_id).order_by('sequence')
+        )
+        self.chunk = self.chunks[-1] if self.chunks else None
+        self.data = bytearray(bytes(self.chunk.data)) if self.chunk is not None and not self.chunk.sealed else None
+        self.touched = []
+        self.counts = Counter()
+
+    def start_chunk(self, timestamp):
+        # The first point of a chunk is a delta from (0, 0, 0), so every
+        # chunk decodes on its own
+        sequence = self.chunk.sequence + 1 if self.chunk is not None else 0
+        self.chunk = LocationTrail(
+            attendance_id=self.attendance_id, user_id=self.user_id, sequence=sequence,
+            started_at=timestamp, ended_at=timestamp,
+        )
+        self.chunks.append(self.chunk)
+        self.data = bytearray([self.precision])
+
+    def touch(self, chunk):
+        if chunk not in self.touched:
+            self.touched.append(chunk)
+
+    def append(self, latitude, longitude, timestamp):
+        """Add one point; returns False for an exact repeat of a stored point"""
+        seconds = int(timestamp.timestamp())
+        chunk = self.chunk
+        if chunk is not None and chunk.point_count and seconds <= chunk.last_time:
+            # Late, or in the same second as the end: checked against the stored points
+            return self.merge(latitude, longitude, timestamp)
+        scale = 10 ** (self.precision if chunk is None or chunk.sealed else self.data[0])
+        lat, lng = round(latitude * scale), round(longitude * scale)
+        if chunk is None or chunk.sealed:
+            self.start_chunk(timestamp)
+            chunk = self.chunk
+
+        for delta in (lat - chunk.last_latitude, lng - chunk.last_longitude, seconds - chunk.last_time):
+            write_varint(self.data, zigzag(delta))
+        chunk.last_latitude, chunk.last_longitude, chunk.last_time = lat, lng, seconds
+        chunk.point_count += 1
+        chunk.ended_at = timestamp
+        self.touch(chunk)
+
+        if chunk.point_count >= self.chunk_points:
+            chunk.data = zlib.compress(bytes(self.data), 9)
+            chunk.sealed = True
+        else:
+            chunk.data = bytes(self.data)
+        self.counts['appended'] += 1
+        return True
+
+    def merge(self, latitude, longitude, timestamp):
+        """Insert a point not after the end of the trail into the chunk covering its time"""
+        # The last chunk starting at or before the point, or the first chunk
+        index = max(bisect.bisect_right([chunk.started_at for chunk in self.chunks], timestamp) - 1, 0)
+        chunk = self.chunks[index]
+        data = self.data if chunk is self.chunk and not chunk.sealed else chunk_bytes(chunk)
+        precision = data[0]
+        scale = 10 ** precision
+        points = [(round(lat * scale), round(lng * scale), seconds) for lat, lng, seconds in decode(data)]
+        point = (round(latitude * scale), round(longitude * scale), int(timestamp.timestamp()))
+        if point in points:
+            self.counts['duplicates'] += 1
+            return False
+
+        # After the points of the same second, as if it had arrived in order
+        points.insert(bisect.bisect_right([p[2] for p in points], point[2]), point)
+        data = encode(precision, points)
+        chunk.last_latitude, chunk.last_longitude, chunk.last_time = points[-1]
+        chunk.point_count = len(points)
+        chunk.started_at = min(chunk.started_at, timestamp)
+        chunk.ended_at = max(chunk.ended_at, timestamp)
+        if chunk.sealed:
+            chunk.data = zlib.compress(bytes(data), 9)
+        else:
+            chunk.data = bytes(data)
+            if chunk is self.chunk:
+                self.data = data
+        self.touch(chunk)
+        self.counts['merged'] += 1
+        return True
+
+    def save(self):
+        for chunk in self.touched:
+            chunk.save()
+
+
+@retry_on_lock
+def append_to_trail(attendance_id, user_id, points):
+    """
+    Add (latitude, longitude, timestamp) points to a shift's trail; returns
+    the appender's counts (appended, merged, duplicates)
+    """
+    points = sorted(points, key=lambda point: point[2])
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                appender = TrailAppender(attendance_id, user_id)
+                for point in points:
+                    appender.append(*point)
+                appender.save()
+            return appender.counts
+        except IntegrityError:
+            # Another writer started the same chunk first; its row is visible now
+            if attempt:
+                raise
+
+
+def append_trail_points(points):
+    """Add TrailPoints of any number of shifts, one transaction per shift; returns the total counts"""
+    by_shift = defaultdict(list)
+    for point in points:
+        by_shift[(point.attendance_id, point.user_id)].append((point.latitude, point.longitude, point.timestamp))
+    counts = Counter()
+    for (attendance_id, user_id), shift_points in by_shift.items():
+        counts.update(append_to_trail(attendance_id, user_id, shift_points))
+    return counts
+
+
+def seal_idle_chunks(before):
+    """
+    Compress the open chunks with no point since `before`; a point arriving
+    later just starts a new chunk. Returns how many were sealed.
+    """
+    sealed = 0
+    for chunk in LocationTrail.objects.filter(sealed=False, ended_at__lt=before).iterator():
+        chunk.data = zlib.compress(chunk_bytes(chunk), 9)
+        chunk.sealed = True
+        # Skipped if a point was appended since it was read
+        sealed += LocationTrail.objects.filter(pk=chunk.pk, sealed=False, point_count=chunk.point_count).update(
+            data=chunk.data, sealed=True,
+        )
+    return sealed
+
+
+def read_trail(attendance_id, start=None, end=None):
+    """
+    Stream the (latitude, longitude, timestamp) points of a shift, only
+    those between `start` and `end` when given. Only the chunks that
+    overlap the range are loaded, one at a time.
+    """
+    chunks = LocationTrail.objects.filter(attendance_id=attendance_id)
+    if start is not None:
+        chunks = chunks.filter(ended_at__gte=start)
+    if end is not None:
+        chunks = chunks.filter(started_at__lte=end)
+    # Points are stored to the second, so a point in the same second as `start` counts
+    first = int(start.timestamp()) if start is not None else None
+    last = end.timestamp() if end is not None else None
+
+    for chunk in chunks.order_by('sequence').iterator(chunk_size=20):
+        for lat, lng, seconds in decode(chunk_bytes(chunk)):
+            if first is not None and seconds < first:
+                continue
+            if last is not None and seconds > last:
+                return
+            yield lat, lng, datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+
+
+def trail_stats(chunks=None):
+    """Storage used by trails against one row per point"""
+    chunks = LocationTrail.objects.all() if chunks is None else chunks
+    totals = chunks.aggregate(
+        chunks=Count('id'),
+        sealed=Count('id', filter=Q(sealed=True)),
+        points=Sum('point_count'),
+        bytes=Sum(Length('data')),
+    )
+    points = totals['points'] or 0
+    data_bytes = totals['bytes'] or 0
+    bytes_per_point = data_bytes / points if points else 0.0
+    return {
+        'chunks': totals['chunks'],
+        'sealed_chunks': totals['sealed'],
+        'points': points,
+        'bytes': data_bytes,
+        'bytes_per_point': round(bytes_per_point, 2),
+        'row_bytes_per_point': ROW_POINT_BYTES,
+        'compression_ratio': round(ROW_POINT_BYTES / bytes_per_point, 1) if bytes_per_point else None,
+    }
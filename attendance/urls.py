@@ -1,32 +1,49 @@
 from django.urls import path
 from .views import (
     AutoClockOutView,
+    BulkClockEventView,
+    LocationPingView,
+    AttendanceTrailView,
     CurrentAttendanceStatusView,
     GeofenceListView, 
     GeofenceDetailView,
     AttendanceListView,
+    AttendanceExportView,
     ClockInOutView,
     ComplaintListView,
     ComplaintDetailView,
     LoginLogListView,
     LogoutView,
     AttendanceReportView,
+    TimesheetView,
     SystemStatsView,
+    MetricsView,
 )
+from .async_views import AsyncAutoClockOutView, AsyncClockInOutView, AsyncCurrentAttendanceStatusView
 
 urlpatterns = [
     path('geofences/', GeofenceListView.as_view(), name='geofence-list'),
     path('geofences/<int:pk>/', GeofenceDetailView.as_view(), name='geofence-detail'),
     path('attendance/', AttendanceListView.as_view(), name='attendance-list'),
     path('attendance/auto-clockout/', AutoClockOutView.as_view(), name='auto-clock-out'),
+    path('attendance/export/', AttendanceExportView.as_view(), name='attendance-export'),
+    path('attendance/bulk/', BulkClockEventView.as_view(), name='bulk-clock-events'),
+    path('attendance/pings/', LocationPingView.as_view(), name='location-pings'),
+    path('attendance/<int:pk>/trail/', AttendanceTrailView.as_view(), name='attendance-trail'),
     path('attendance/<str:action>/', ClockInOutView.as_view(), name='clock-in-out'),
+    # Native async versions of the mobile endpoints, for ASGI deployments
+    path('async/attendance/auto-clockout/', AsyncAutoClockOutView.as_view(), name='async-auto-clock-out'),
+    path('async/attendance/<str:action>/', AsyncClockInOutView.as_view(), name='async-clock-in-out'),
+    path('async/current/attendance/', AsyncCurrentAttendanceStatusView.as_view(), name='async-current-attendance-status'),
     path('current/attendance/', CurrentAttendanceStatusView.as_view(), name='current-attendance-status'),
     path('complaints/', ComplaintListView.as_view(), name='complaint-list'),
     path('complaints/<int:pk>/', ComplaintDetailView.as_view(), name='complaint-detail'),
     path('login-logs/', LoginLogListView.as_view(), name='login-log-list'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('reports/attendance/', AttendanceReportView.as_view(), name='attendance-report'),
+    path('reports/timesheet/', TimesheetView.as_view(), name='timesheet'),
     path('stats/', SystemStatsView.as_view(), name='system-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     
 
 ]
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Versioned geofence set, for conditional and incremental fetches.
+
+Every geofence change takes the next value of a single counter row in the
+same transaction as the change: a saved geofence stores it in `version`, a
+deleted one leaves a GeofenceTombstone with it. The counter row stays
+locked until the transaction commits, so versions become visible in
+order and a client that has seen version N has seen every change up to N.
+
+Clients send the version they hold (`?since=N`, or the ETag of their last
+list) and only get what changed after it. Tombstones are kept for
+GEOFENCE_TOMBSTONE_RETENTION_DAYS; a client older than the pruned
+tombstones gets the full list again.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+VERSION_CACHE_KEY = 'attendance:geofence-set:version'
+
+
+def version_cache_timeout():
+    return getattr(settings, 'GEOFENCE_VERSION_CACHE_TTL', 60)
+
+
+def next_geofence_version(using='default'):
+    """
+    Bump the geofence set version and return it. Must run in the
+    transaction of the change; the new version is published on commit.
+    """
+    from .models import GeofenceSetVersion
+
+    counter = GeofenceSetVersion.objects.using(using)
+    if not counter.filter(pk=1).update(version=F('version') + 1):
+        counter.get_or_create(pk=1)
+        counter.filter(pk=1).update(version=F('version') + 1)
+    version = counter.values_list('version', flat=True).get(pk=1)
+    transaction.on_commit(lambda: cache.set(VERSION_CACHE_KEY, version, timeout=version_cache_timeout()), using=using)
+    return version
+
+
+def current_geofence_version():
+    """Latest committed version, from the cache when possible (at most GEOFENCE_VERSION_CACHE_TTL old)"""
+    from .models import GeofenceSetVersion
+
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = GeofenceSetVersion.objects.values_list('version', flat=True).filter(pk=1).first() or 0
+        # add(), so a version published by a commit meanwhile is not overwritten
+        cache.add(VERSION_CACHE_KEY, version, timeout=version_cache_timeout())
+    return version
+
+
+def record_tombstone(geofence_id, using='default'):
+    """Record a deleted geofence, and prune tombstones past their retention"""
+    from .models import GeofenceSetVersion, GeofenceTombstone
+
+    GeofenceTombstone.objects.using(using).create(geofence_id=geofence_id, version=next_geofence_version(using))
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'GEOFENCE_TOMBSTONE_RETENTION_DAYS', 90))
+    expired = GeofenceTombstone.objects.using(using).filter(deleted_at__lt=cutoff)
+    pruned = expired.aggregate(Max('version'))['version__max']
+    if pruned is not None:
+        expired.delete()
+        GeofenceSetVersion.objects.using(using).filter(pk=1, pruned_version__lt=pruned).update(pruned_version=pruned)
+
+
+def geofence_changes(since):
+    """
+    (geofences saved after `since`, ids deleted after it), or None when
+    `since` is too old (or unknown) for a delta and the full set is needed
+    """
+    from .models import Geofence, GeofenceSetVersion, GeofenceTombstone
+
+    counter = GeofenceSetVersion.objects.filter(pk=1).values('version', 'pruned_version').first()
+    if counter is None or since <= 0 or since < counter['pruned_version'] or since > counter['version']:
+        return None
+    changed = Geofence.objects.filter(version__gt=since).order_by('version')
+    deleted = GeofenceTombstone.objects.filter(version__gt=since).values_list('geofence_id', flat=True)
+    return changed, list(deleted)
@@ -1,29 +1,94 @@
-import googlemaps
+import csv
+import json
+import logging
+from datetime import date, datetime, time, timedelta
+
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags
 from rest_framework import generics, status, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from users.serializers import UserSerializer
-from .models import Geofence, Attendance
-from .serializers import CurrentAttendanceStatusSerializer, GeofenceSerializer, AttendanceSerializer
-from django.shortcuts import get_object_or_404
 from users.models import User
-from django.contrib.gis.geos import Point
-from django.db import transaction
-from django.utils import timezone
-import math
-import logging
-from django.db.models import Count, Q
-from django.utils import timezone
-from datetime import timedelta
-from .models import Complaint, LoginLog
+from users.serializers import UserSerializer
+from .models import Attendance, Complaint, DailyAttendanceRollup, Geofence, LoginLog
+from .serializers import GeofenceSerializer, AttendanceSerializer, ClockEventSerializer
+from .serializers import LocationPingSerializer
 from .serializers import ComplaintSerializer, LoginLogSerializer, AttendanceReportSerializer
+from .serializers import AttendanceFlatSerializer, ComplaintFlatSerializer, LoginLogFlatSerializer
+from .serializers import AttendanceExportSerializer, TimesheetSerializer
+from .geo import EARTH_RADIUS_M, haversine_distance
+from .geocoding import label_attendance
+from .matching import nearest_geofence_details
+from .idempotency import ReplayUnthrottledMixin, idempotent
+from .throttling import AttendanceWriteThrottle, GlobalAttendanceWriteThrottle, LocationPingThrottle
+from .log_writer import login_log_writer
+from .metrics import PROMETHEUS_CONTENT_TYPE, request_metrics
+from .spatial_index import get_geofence_index, match_geofence
+from .stats import get_system_stats
+from .versioning import current_geofence_version, geofence_changes
+from .timesheets import Timesheet
+from .trails import read_trail
+from .pagination import KeysetPagination
+from .presence import ExitDetector
+from .services import (
+    AttendanceSequenceError,
+    check_sequence,
+    get_attendance_state,
+    record_attendance,
+    record_attendance_batch,
+)
 
+logger = logging.getLogger(__name__)
+
+
+class LeanListMixin:
+    """
+    Opt-in lean read mode for list endpoints: `?lean=1` serializes rows from
+    QuerySet.values() with a precompiled flat serializer, and
+    `?fields=id,type,...` limits the output to the given fields.
+    """
+    lean_serializer_class = None
+    lean_required_fields = ()
+
+    def is_lean(self):
+        return self.request.query_params.get('lean', '').lower() in ('1', 'true', 'yes')
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_lean():
+            return super().list(request, *args, **kwargs)
+
+        fields = request.query_params.get('fields')
+        serializer = self.lean_serializer_class(
+            fields=[name.strip() for name in fields.split(',')] if fields else None
+        )
+        # Ordering/pagination keys must be selected even if not rendered
+        paths = dict.fromkeys(serializer.paths + tuple(self.lean_required_fields))
+        rows = self.filter_queryset(self.get_queryset()).values(*paths)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(rows))
 
-gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
 
 class GeofenceListView(generics.ListCreateAPIView):
+    """
+    The geofence set, with its version as a strong ETag. A request with
+    `If-None-Match` set to the current ETag gets an empty 304. With
+    `?since=<version>`, only the geofences created or updated after that
+    version are returned, plus the ids deleted since (`deleted`). When the
+    version is too old for a delta, the full set is sent with `full: true`.
+    """
     queryset = Geofence.objects.all()
     serializer_class = GeofenceSerializer
 
@@ -36,12 +101,49 @@ class GeofenceListView(generics.ListCreateAPIView):
         serializer.save(created_by=self.request.user)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({
-            "total": queryset.count(),
-            "geofences": serializer.data
-        }, status=status.HTTP_200_OK)
+        # Read first: changes committed meanwhile are sent again next time, never missed
+        version = current_geofence_version()
+        since = self.get_since()
+        etag = f'"geofences-{version}-{request.accepted_renderer.format}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        changes = geofence_changes(since) if since is not None else None
+        if changes is not None:
+            changed, deleted = changes
+            return Response({
+                "version": version,
+                "full": False,
+                "geofences": self.get_serializer(changed, many=True).data,
+                "deleted": deleted,
+            }, status=status.HTTP_200_OK, headers=headers)
+
+        geofences = self.serialized_geofences(version)
+        data = {"version": version, "total": len(geofences), "geofences": geofences}
+        if since is not None:
+            data.update(full=True, deleted=[])
+        return Response(data, status=status.HTTP_200_OK, headers=headers)
+
+    def get_since(self):
+        value = self.request.query_params.get('since')
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({'since': f"Invalid version '{value}'"})
+
+    def serialized_geofences(self, version):
+        # Serialized once per version, not on every full fetch
+        key = f'attendance:geofence-set:list:{version}'
+        geofences = cache.get(key)
+        if geofences is None:
+            geofences = self.get_serializer(self.get_queryset(), many=True).data
+            cache.set(key, geofences, timeout=getattr(settings, 'GEOFENCE_LIST_CACHE_TTL', 60 * 60))
+        return geofences
 
 
 class GeofenceDetailView(generics.RetrieveUpdateDestroyAPIView):
@@ -49,42 +151,135 @@ class GeofenceDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = GeofenceSerializer
     permission_classes = [permissions.IsAdminUser]
 
-class AttendanceListView(generics.ListAPIView):
+class AttendanceListView(LeanListMixin, generics.ListAPIView):
     serializer_class = AttendanceSerializer
+    lean_serializer_class = AttendanceFlatSerializer
+    lean_required_fields = ('id', 'timestamp')
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         user = self.request.user
         if user.role == 'admin':
-            return Attendance.objects.all()
-        return Attendance.objects.filter(user=user)
+            queryset = Attendance.objects.select_related('user', 'geofence')
+            user_id = self.request.query_params.get('user_id')
+            if user_id:
+                queryset = queryset.filter(user_id=user_id)
+        else:
+            queryset = Attendance.objects.select_related('user', 'geofence').filter(user=user)
+        
+        # Filtering options
+        geofence_id = self.request.query_params.get('geofence_id')
+        attendance_type = self.request.query_params.get('type')
+        date_from = self.request.query_params.get('date_from')
+        date_to = self.request.query_params.get('date_to')
+        
+        if geofence_id:
+            queryset = queryset.filter(geofence_id=geofence_id)
+        if attendance_type:
+            queryset = queryset.filter(type=attendance_type)
+        # Plain timestamp ranges so the (timestamp, id) index is used
+        if date_from:
+            queryset = queryset.filter(timestamp__gte=self.start_of_day(date_from))
+        if date_to:
+            queryset = queryset.filter(timestamp__lt=self.start_of_day(date_to) + timedelta(days=1))
+            
+        return queryset
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        # ?addresses=1 labels the page's coordinates in one batched lookup
+        if request.query_params.get('addresses', '').lower() in ('1', 'true', 'yes'):
+            rows = response.data['results'] if isinstance(response.data, dict) else response.data
+            label_attendance(rows)
+        return response
 
+    def start_of_day(self, value):
+        try:
+            day = datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            raise ValidationError({'date': f"Invalid date '{value}', expected YYYY-MM-DD"})
+        return timezone.make_aware(datetime.combine(day, time.min))
 
 
-logger = logging.getLogger(__name__)
+class Echo:
+    """File-like object handing back what csv.writer writes, for streaming"""
+
+    def write(self, value):
+        return value
+
+
+class AttendanceExportView(AttendanceListView):
+    """
+    Stream attendance records as CSV (default) or NDJSON (`?output=ndjson`),
+    oldest first, with the same filters as the attendance list. Rows are read
+    with QuerySet.iterator() and written out in chunks, so memory use does
+    not grow with the size of the export.
+    """
+    pagination_class = None
+    content_types = {
+        'csv': 'text/csv',
+        'ndjson': 'application/x-ndjson',
+    }
+
+    def list(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'csv').lower()
+        if output not in self.content_types:
+            raise ValidationError({'output': f"Unsupported output '{output}', expected csv or ndjson"})
 
-class ClockInOutView(APIView):
+        serializer = AttendanceExportSerializer()
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .order_by('timestamp', 'id')
+            .values(*serializer.paths)
+        )
+        chunk_size = getattr(settings, 'ATTENDANCE_EXPORT_CHUNK_SIZE', 2000)
+        lines = self.csv_lines(serializer, rows, chunk_size) if output == 'csv' else \
+            self.ndjson_lines(serializer, rows, chunk_size)
+
+        response = StreamingHttpResponse(self.chunked(lines, chunk_size), content_type=self.content_types[output])
+        response['Content-Disposition'] = f'attachment; filename="{self.get_filename(output)}"'
+        return response
+
+    def csv_lines(self, serializer, rows, chunk_size):
+        writer = csv.writer(Echo())
+        yield writer.writerow(serializer.field_names)
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield writer.writerow(serializer.serialize_row(row).values())
+
+    def ndjson_lines(self, serializer, rows, chunk_size):
+        for row in rows.iterator(chunk_size=chunk_size):
+            yield json.dumps(serializer.serialize_row(row)) + '\n'
+
+    def chunked(self, lines, size):
+        # One write per chunk of rows rather than one per row
+        buffer = []
+        for line in lines:
+            buffer.append(line)
+            if len(buffer) >= size:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+
+    def get_filename(self, output):
+        params = self.request.query_params
+        period = '-'.join(value for value in (params.get('date_from'), params.get('date_to')) if value)
+        return f"attendance{'-' + period if period else ''}.{output}"
+
+
+class ClockInOutView(ReplayUnthrottledMixin, APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AttendanceWriteThrottle, GlobalAttendanceWriteThrottle]
     
-    EARTH_RADIUS_M = 6371000  # Earth radius in meters
+    EARTH_RADIUS_M = EARTH_RADIUS_M
     
     def haversine_distance(self, lat1, lon1, lat2, lon2):
         """
         Calculate distance between two points using Haversine formula
         """
         try:
-            # Convert decimal degrees to radians
-            lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-            
-            # Haversine formula
-            dlat = lat2 - lat1 
-            dlon = lon2 - lon1 
-            a = (math.sin(dlat/2)**2 + 
-                 math.cos(lat1) * math.cos(lat2) * 
-                 math.sin(dlon/2)**2)
-            c = 2 * math.asin(math.sqrt(a))
-            return self.EARTH_RADIUS_M * c
+            return haversine_distance(lat1, lon1, lat2, lon2)
         except Exception as e:
             logger.error(f"Distance calculation error: {str(e)}")
             raise
@@ -97,51 +292,22 @@ class ClockInOutView(APIView):
 
     def get_nearest_geofence(self, lat, lng):
         """
-        Find the nearest geofence with optimized query
-        Returns tuple of (geofence, distance)
+        Find the geofence containing the point using the configured spatial
+        backend (in-memory index or SpatiaLite)
+        Returns a GeofenceMatch with the containing geofence (if any) and the
+        nearest geofence for error reporting
         """
         try:
-            geofences = Geofence.objects.all()
-            if not geofences.exists():
-                return (None, None)
-            
-            nearest = None
-            min_distance = float('inf')
-            
-            for geofence in geofences:
-                distance = self.haversine_distance(
-                    lat, lng,
-                    geofence.latitude, geofence.longitude
-                )
-                
-                # Check if within radius + 10m buffer
-                if distance <= (geofence.radius + 10):
-                    return (geofence, distance)
-                
-                # Track nearest for error reporting
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest = geofence
-            
-            return (None, min_distance)
+            return match_geofence(lat, lng)
         except Exception as e:
             logger.error(f"Geofence lookup error: {str(e)}")
             raise
 
     def validate_attendance_sequence(self, user, action):
         """Ensure proper clock-in/out sequence"""
-        last_attendance = Attendance.objects.filter(user=user).last()
-        
-        if action == 'clock-in':
-            if last_attendance and last_attendance.type == 'clock-in':
-                raise ValueError("Already clocked in")
-        elif action == 'clock-out':
-            if not last_attendance or last_attendance.type == 'clock-out':
-                raise ValueError("No active clock-in found")
-        else:
-            raise ValueError("Invalid action type")
+        check_sequence(get_attendance_state(user), action)
 
-    @transaction.atomic
+    @idempotent
     def post(self, request, action, *args, **kwargs):
         try:
             user = request.user
@@ -167,19 +333,15 @@ class ClockInOutView(APIView):
                 )
             
             # Find appropriate geofence
-            within_geofence, distance = self.get_nearest_geofence(lat, lng)
+            match = self.get_nearest_geofence(lat, lng)
+            within_geofence, distance = match.geofence, match.distance
             
             if not within_geofence:
-                nearest_geofence = Geofence.objects.first()  # Simplified for example
                 return Response(
                     {
                         'error': 'Not within any geofence',
                         'details': {
-                            'nearest_geofence': {
-                                'name': nearest_geofence.name,
-                                'distance': distance,
-                                'required_radius': nearest_geofence.radius
-                            }
+                            'nearest_geofence': nearest_geofence_details(match, lat, lng)
                         }
                     },
                     status=status.HTTP_403_FORBIDDEN
@@ -195,23 +357,15 @@ class ClockInOutView(APIView):
                 )
             
             # Create attendance record
-            attendance_data = {
-                'user': user.id,
-                'geofence': within_geofence.id,
-                'type': action,
-                'latitude': lat,
-                'longitude': lng,
-                'timestamp': timezone.now()
-            }
-            
-            serializer = AttendanceSerializer(data=attendance_data)
-            if not serializer.is_valid():
+            try:
+                attendance = record_attendance(user, action, within_geofence, lat, lng)
+            except AttendanceSequenceError as e:
                 return Response(
-                    serializer.errors,
+                    {'error': str(e)},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            attendance = serializer.save()
+            serializer = AttendanceSerializer(attendance)
             
             return Response(
                 {
@@ -235,8 +389,8 @@ class ClockInOutView(APIView):
 
 class AutoClockOutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AttendanceWriteThrottle, GlobalAttendanceWriteThrottle]
     
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         try:
             user = request.user
@@ -273,31 +427,34 @@ class AutoClockOutView(APIView):
                 )
             
             # Verify user is currently clocked in
-            last_attendance = Attendance.objects.filter(user=user).order_by('-timestamp').first()
+            state = get_attendance_state(user)
             
-            if not last_attendance or last_attendance.type != 'clock-in':
+            if not state.is_clocked_in:
                 return Response(
                     {'error': 'No active clock-in found. User is not currently clocked in.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
             # Additional validation: ensure they clocked in at the same geofence
-            if last_attendance.geofence_id != original_geofence_id:
-                logger.warning(f"Auto clock-out geofence mismatch: clocked in at {last_attendance.geofence_id}, trying to clock out from {original_geofence_id}")
+            if state.geofence_id != original_geofence.id:
+                logger.warning(f"Auto clock-out geofence mismatch: clocked in at {state.geofence_id}, trying to clock out from {original_geofence_id}")
                 # Still allow it but log the discrepancy
             
             # Create auto clock-out record
             # Note: We don't check if they're within ANY geofence because 
             # the whole point is they've LEFT the geofence
-            attendance = Attendance.objects.create(
-                user=user,
-                geofence=original_geofence,  # Use the original geofence they clocked in from
-                type='clock-out',
-                latitude=lat,
-                longitude=lng,
-                is_auto=True,
-                timestamp=timezone.now()
-            )
+            try:
+                attendance = record_attendance(
+                    user, 'clock-out',
+                    original_geofence,  # Use the original geofence they clocked in from
+                    lat, lng,
+                    is_auto=True
+                )
+            except AttendanceSequenceError:
+                return Response(
+                    {'error': 'No active clock-in found. User is not currently clocked in.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
             
             logger.info(f"Auto clock-out successful: User {user.username} from {original_geofence.name}")
             
@@ -335,19 +492,243 @@ class AutoClockOutView(APIView):
             )
         
 
-logger = logging.getLogger(__name__)
+class BulkClockEventView(APIView):
+    """
+    Replay a batch of clock-ins/outs queued by the mobile app while offline.
+
+    Events are validated and sequenced in memory, matched against the
+    geofences in one vectorized pass and written with a single bulk_create.
+    Events already stored are reported as duplicates, so replaying the same
+    queue again after a reconnect is cheap.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AttendanceWriteThrottle, GlobalAttendanceWriteThrottle]
+
+    def post(self, request, *args, **kwargs):
+        events = request.data.get('events') if isinstance(request.data, dict) else request.data
+        max_events = getattr(settings, 'ATTENDANCE_BULK_MAX_EVENTS', 500)
+
+        if not isinstance(events, list) or not events:
+            return Response(
+                {'error': 'A non-empty list of events is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(events) > max_events:
+            return Response(
+                {'error': f'Too many events, send at most {max_events} per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        user = request.user
+        results = [None] * len(events)
+        valid = []
+        latest_allowed = timezone.now() + timedelta(minutes=5)  # Tolerate some clock skew
+
+        for index, event in enumerate(events):
+            serializer = ClockEventSerializer(data=event)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'status': 'rejected', 'error': serializer.errors}
+            elif serializer.validated_data['timestamp'] > latest_allowed:
+                results[index] = {'index': index, 'status': 'rejected', 'error': 'Timestamp is in the future'}
+            else:
+                valid.append((index, serializer.validated_data))
+
+        valid.sort(key=lambda item: item[1]['timestamp'])
+
+        # Drop events that are already stored or repeated within the batch
+        if valid:
+            stored = set(Attendance.objects.filter(
+                user=user,
+                timestamp__gte=valid[0][1]['timestamp'],
+                timestamp__lte=valid[-1][1]['timestamp'],
+            ).values_list('type', 'timestamp'))
+            pending = []
+            for index, event in valid:
+                key = (event['type'], event['timestamp'])
+                if key in stored:
+                    results[index] = {'index': index, 'status': 'duplicate'}
+                else:
+                    stored.add(key)
+                    pending.append((index, event))
+            valid = pending
+
+        matches = get_geofence_index().match_many(
+            [event['latitude'] for _, event in valid],
+            [event['longitude'] for _, event in valid],
+        ) if valid else []
+
+        # Walk the events in time order from the user's current clock state
+        state = get_attendance_state(user)
+        last_type = state.last_action
+        last_time = state.last_action_time
+
+        accepted = []
+        for (index, event), match in zip(valid, matches):
+            error = None
+            if last_time and event['timestamp'] < last_time:
+                error = 'Event precedes the latest recorded attendance'
+            elif match.geofence is None:
+                error = 'Not within any geofence'
+            elif event['type'] == 'clock-in' and last_type == 'clock-in':
+                error = 'Already clocked in'
+            elif event['type'] == 'clock-out' and last_type != 'clock-in':
+                error = 'No active clock-in found'
+
+            if error:
+                results[index] = {'index': index, 'status': 'rejected', 'error': error}
+                continue
+
+            last_type, last_time = event['type'], event['timestamp']
+            accepted.append((index, match, Attendance(
+                user=user,
+                geofence=match.geofence,
+                type=event['type'],
+                latitude=event['latitude'],
+                longitude=event['longitude'],
+                timestamp=event['timestamp'],
+            )))
+
+        try:
+            record_attendance_batch(user, [attendance for _, _, attendance in accepted], state)
+        except AttendanceSequenceError as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        except Exception:
+            logger.exception(f"Bulk attendance upload failed for user {user.username}")
+            return Response(
+                {'error': 'Internal server error'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        for index, match, attendance in accepted:
+            results[index] = {
+                'index': index,
+                'status': 'created',
+                'id': attendance.id,
+                'geofence': {
+                    'id': match.geofence.id,
+                    'name': match.geofence.name,
+                    'distance': match.distance
+                }
+            }
+
+        summary = {state: 0 for state in ('created', 'duplicate', 'rejected')}
+        for result in results:
+            summary[result['status']] += 1
+
+        return Response({'summary': summary, 'results': results}, status=status.HTTP_200_OK)
+
 
-# ... (keep your existing views)
+class LocationPingView(APIView):
+    """
+    Location pings from a clocked-in phone. Pings are queued and written in
+    batches; the server decides from them when the user has left their
+    clock-in geofence and clocks them out itself (see presence.py).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [LocationPingThrottle]
+
+    def post(self, request, *args, **kwargs):
+        pings = request.data.get('pings') if isinstance(request.data, dict) else request.data
+        max_pings = getattr(settings, 'LOCATION_PING_MAX_BATCH', 200)
+
+        if not isinstance(pings, list) or not pings:
+            return Response(
+                {'error': 'A non-empty list of pings is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(pings) > max_pings:
+            return Response(
+                {'error': f'Too many pings, send at most {max_pings} per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        valid = []
+        rejected = []
+        latest_allowed = timezone.now() + timedelta(minutes=5)  # Tolerate some clock skew
+        for index, ping in enumerate(pings):
+            serializer = LocationPingSerializer(data=ping)
+            if not serializer.is_valid():
+                rejected.append({'index': index, 'error': serializer.errors})
+            elif serializer.validated_data['timestamp'] > latest_allowed:
+                rejected.append({'index': index, 'error': 'Timestamp is in the future'})
+            else:
+                valid.append(serializer.validated_data)
+
+        try:
+            presence, attendance = ExitDetector().process(request.user, valid)
+        except Exception:
+            logger.exception(f"Location ping processing failed for user {request.user.username}")
+            return Response(
+                {'error': 'Internal server error'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response(
+            {
+                'accepted': len(valid),
+                'rejected': rejected,
+                'state': presence,
+                'auto_clock_out': AttendanceSerializer(attendance).data if attendance else None,
+            },
+            status=status.HTTP_200_OK
+        )
+
+
+class AttendanceTrailView(APIView):
+    """
+    The movement trail of the shift started by clock-in `pk`, optionally only
+    between `?from=` and `?to=` (ISO 8601). Streamed as JSON while the
+    stored chunks are decoded, one chunk at a time.
+    """
+    permission_classes = [permissions.IsAuthenticated]
 
-class ComplaintListView(generics.ListCreateAPIView):
+    def get(self, request, pk, *args, **kwargs):
+        clock_in = get_object_or_404(Attendance, pk=pk, type='clock-in')
+        if request.user.role != 'admin' and request.user.pk != clock_in.user_id:
+            return Response(
+                {'error': 'You do not have permission to perform this action.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        start = self.parse_time('from')
+        end = self.parse_time('to')
+        points = read_trail(clock_in.pk, start, end)
+        return StreamingHttpResponse(self.render(clock_in, points), content_type='application/json')
+
+    def parse_time(self, param):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({param: f"Invalid datetime '{value}', expected ISO 8601"})
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+    def render(self, clock_in, points, chunk_size=500):
+        yield f'{{"attendance": {clock_in.pk}, "user": {clock_in.user_id}, "points": ['
+        buffer = []
+        for index, (lat, lng, timestamp) in enumerate(points):
+            buffer.append(('' if index == 0 else ',') + json.dumps([lat, lng, timestamp.isoformat()]))
+            if len(buffer) >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+        yield ''.join(buffer) + ']}'
+
+
+class ComplaintListView(LeanListMixin, generics.ListCreateAPIView):
     serializer_class = ComplaintSerializer
+    lean_serializer_class = ComplaintFlatSerializer
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
         user = self.request.user
+        queryset = Complaint.objects.select_related('user')
         if user.role == 'admin':
-            return Complaint.objects.all().order_by('-created_at')
-        return Complaint.objects.filter(user=user).order_by('-created_at')
+            return queryset.order_by('-created_at')
+        return queryset.filter(user=user).order_by('-created_at')
     
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -376,12 +757,13 @@ class ComplaintDetailView(generics.RetrieveUpdateAPIView):
         
         return Response(serializer.data)
 
-class LoginLogListView(generics.ListAPIView):
+class LoginLogListView(LeanListMixin, generics.ListAPIView):
     serializer_class = LoginLogSerializer
+    lean_serializer_class = LoginLogFlatSerializer
     permission_classes = [permissions.IsAdminUser]
     
     def get_queryset(self):
-        queryset = LoginLog.objects.all().order_by('-login_time')
+        queryset = LoginLog.objects.select_related('user').order_by('-login_time')
         
         # Filtering options
         user_id = self.request.query_params.get('user_id')
@@ -403,16 +785,22 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             # Get the most recent login log without logout time
-            login_log = LoginLog.objects.filter(
+            sessions = LoginLog.objects.filter(
                 user=request.user,
                 logout_time__isnull=True
-            ).order_by('-login_time').first()
+            ).order_by('-login_time')
+            login_log = sessions.first()
+            if login_log is None and login_log_writer.flush():
+                # The login may still be queued in this process' writer
+                login_log = sessions.first()
             
             if login_log:
                 login_log.logout_time = timezone.now()
                 login_log.save()
                 return Response({'success': True}, status=status.HTTP_200_OK)
-            
+
+            # Or in another process' writer, which closes it when writing it
+            login_log_writer.defer_logout(request.user.pk, timezone.now())
             return Response(
                 {'error': 'No active login session found'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -423,84 +811,165 @@ class LogoutView(APIView):
                 {'error': 'Internal server error'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        
 
-from rest_framework.views import APIView
-from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Count
-from django.db.models.functions import TruncDate
-from datetime import timedelta, date, datetime
 
 class AttendanceReportView(APIView):
+    """
+    Clock-in/out counts per day, week or month, optionally broken down by
+    geofence or user. Reads the daily rollup table, never raw attendance.
+    Only admins may break down by user or ask for another user's counts.
+    """
     permission_classes = [IsAuthenticated]
 
+    PERIODS = {
+        'day': None,
+        'week': TruncWeek,
+        'month': TruncMonth,
+    }
+    BREAKDOWNS = {
+        'geofence': ('geofence_id', 'geofence__name'),
+        'user': ('user_id', 'user__username'),
+    }
+
+    def period_starts(self, group_by, start_date, end_date):
+        """Every period between the two dates, so empty periods are reported as zero"""
+        if group_by == 'week':
+            current = start_date - timedelta(days=start_date.weekday())
+        elif group_by == 'month':
+            current = start_date.replace(day=1)
+        else:
+            current = start_date
+
+        while current <= end_date:
+            yield current
+            if group_by == 'week':
+                current += timedelta(days=7)
+            elif group_by == 'month':
+                current = (current + timedelta(days=32)).replace(day=1)
+            else:
+                current += timedelta(days=1)
+
     def get(self, request):
-        group_by = request.query_params.get('group_by', 'day')
-        start_date_str = request.query_params.get('start_date')
+        params = AttendanceReportSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=400)
 
-        try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-        except (ValueError, TypeError):
-            return Response({"error": "Invalid or missing start_date"}, status=400)
+        # Other users' counts are for admins only; employees see
+        # organisation-wide totals and their own
+        if request.user.role != 'admin' and (
+            params.validated_data.get('breakdown') == 'user' or
+            params.validated_data.get('user_id') not in (None, request.user.pk)
+        ):
+            return Response(
+                {'error': 'You do not have permission to view other users\' attendance.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        start_date = params.validated_data['start_date']
+        group_by = params.validated_data['group_by']
+        breakdown = params.validated_data.get('breakdown')
+        end_date = params.validated_data.get('end_date') or date.today()
 
-        end_date = date.today()
+        queryset = DailyAttendanceRollup.objects.filter(day__gte=start_date, day__lte=end_date)
+        if params.validated_data.get('user_id'):
+            queryset = queryset.filter(user_id=params.validated_data['user_id'])
+        if params.validated_data.get('geofence_id'):
+            queryset = queryset.filter(geofence_id=params.validated_data['geofence_id'])
 
-        # Group by date
-        queryset = Attendance.objects.filter(
-            timestamp__date__gte=start_date,
-            timestamp__date__lte=end_date
-        ).annotate(day=TruncDate('timestamp'))
+        trunc = self.PERIODS[group_by]
+        queryset = queryset.annotate(period=trunc('day') if trunc else F('day'))
+        group_fields = ['period'] + list(self.BREAKDOWNS.get(breakdown, ()))
+        rows = queryset.values(*group_fields).annotate(
+            clock_in=Sum('clock_ins'),
+            clock_out=Sum('clock_outs'),
+            auto_clock_out=Sum('auto_clock_outs'),
+        ).order_by(*group_fields)
 
-        # Count clock-ins and outs by day
-        clock_in_data = queryset.filter(type='clock-in').values('day').annotate(count=Count('id'))
-        clock_out_data = queryset.filter(type='clock-out').values('day').annotate(count=Count('id'))
+        if breakdown:
+            id_field, name_field = self.BREAKDOWNS[breakdown]
+            return Response([
+                {
+                    'date': row['period'].strftime('%Y-%m-%d'),
+                    breakdown: {'id': row[id_field], 'name': row[name_field]},
+                    'clock_in': row['clock_in'],
+                    'clock_out': row['clock_out'],
+                    'auto_clock_out': row['auto_clock_out'],
+                }
+                for row in rows
+            ])
 
-        # Convert to dict
-        clock_in_dict = {d['day'].strftime('%Y-%m-%d'): d['count'] for d in clock_in_data}
-        clock_out_dict = {d['day'].strftime('%Y-%m-%d'): d['count'] for d in clock_out_data}
+        totals = {row['period']: row for row in rows}
 
-        # Build 7-day padded response
+        # Build padded response
         results = []
-        current_date = start_date
-        while current_date <= end_date:
-            date_str = current_date.strftime('%Y-%m-%d')
+        for period in self.period_starts(group_by, start_date, end_date):
+            row = totals.get(period, {})
             results.append({
-                'date': date_str,
-                'clock_in': clock_in_dict.get(date_str, 0),
-                'clock_out': clock_out_dict.get(date_str, 0),
+                'date': period.strftime('%Y-%m-%d'),
+                'clock_in': row.get('clock_in', 0),
+                'clock_out': row.get('clock_out', 0),
+                'auto_clock_out': row.get('auto_clock_out', 0),
             })
-            current_date += timedelta(days=1)
 
         return Response(results)
 
 
+class TimesheetView(APIView):
+    """
+    Worked hours per day, geofence and user between start_date and end_date
+    (inclusive), from clock-ins paired with their clock-outs in one
+    window-function query (see timesheets.py). Unmatched events and
+    automatic clock-outs are listed under `exceptions`. Users other than
+    admins only see their own timesheet.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = TimesheetSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response(params.errors, status=400)
+
+        start_date = params.validated_data['start_date']
+        end_date = params.validated_data.get('end_date') or timezone.localdate()
+        user_id = params.validated_data.get('user_id')
+        if request.user.role != 'admin':
+            user_id = request.user.pk
+
+        timesheet = Timesheet(
+            timezone.make_aware(datetime.combine(start_date, time.min)),
+            timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)),
+            user_id=user_id,
+            geofence_id=params.validated_data.get('geofence_id'),
+        ).compute()
+
+        return Response({
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'totals': timesheet.totals(),
+            'results': timesheet.results(),
+            'exceptions': timesheet.exceptions,
+        })
+
+
 class SystemStatsView(APIView):
     permission_classes = [permissions.IsAdminUser]
     
     def get(self, request):
-        # Basic stats
-        stats = {
-            'total_users': User.objects.count(),
-            'total_geofences': Geofence.objects.count(),
-            'total_attendances': Attendance.objects.count(),
-            'total_complaints': Complaint.objects.count(),
-            'pending_complaints': Complaint.objects.filter(status='pending').count(),
-            'active_logins': LoginLog.objects.filter(logout_time__isnull=True).count(),
-        }
-        
-        # Attendance stats for last 30 days
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        stats['recent_attendances'] = Attendance.objects.filter(
-            timestamp__gte=thirty_days_ago
-        ).count()
+        stats, computed_at = get_system_stats()
         
-        # Login stats for last 30 days
-        stats['recent_logins'] = LoginLog.objects.filter(
-            login_time__gte=thirty_days_ago
-        ).count()
+        # How fresh the cached counters are
+        stats['computed_at'] = computed_at
+        stats['age_seconds'] = round((timezone.now() - computed_at).total_seconds(), 1)
         
         return Response(stats)
+
+
+class MetricsView(APIView):
+    """Per-route request histograms of this process, in Prometheus text format"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(request_metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
     
 
 
@@ -537,10 +1006,7 @@ class CurrentAttendanceStatusView(APIView):
     
     def get(self, request):
         try:
-            # Get the most recent attendance record for this user
-            last_attendance = Attendance.objects.filter(
-                user=request.user
-            ).select_related('geofence').order_by('-timestamp').first()
+            state = get_attendance_state(request.user)
             
             response_data = {
                 'isClockedIn': False,
@@ -549,15 +1015,15 @@ class CurrentAttendanceStatusView(APIView):
                 'lastGeofence': None
             }
             
-            if last_attendance:
+            if state.last_action:
                 response_data = {
-                    'isClockedIn': last_attendance.type == 'clock-in',
-                    'lastAction': last_attendance.type,
-                    'lastActionTime': last_attendance.timestamp,
+                    'isClockedIn': state.is_clocked_in,
+                    'lastAction': state.last_action,
+                    'lastActionTime': state.last_action_time,
                     'lastGeofence': {
-                        'id': last_attendance.geofence.id,
-                        'name': last_attendance.geofence.name
-                    } if last_attendance.geofence else None
+                        'id': state.geofence.id,
+                        'name': state.geofence.name
+                    } if state.geofence else None
                 }
             
             return Response(response_data)
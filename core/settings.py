@@ -2,6 +2,8 @@ import os
 from datetime import timedelta
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 GEOS_LIBRARY_PATH = os.path.join(
     os.getenv("HOMEBREW_PREFIX", "/opt/homebrew"),
     "opt", "geos", "lib", "libgeos_c.dylib"
@@ -35,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'attendance.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -74,6 +77,48 @@ DATABASES = {
     }
 }
 
+# Opt-in SQLite profile for many concurrent clock-ins: WAL journal, a busy
+# timeout, transactions that take the write lock up front and persistent
+# connections. Set SQLITE_PRODUCTION_PROFILE=1 to enable.
+if os.getenv('SQLITE_PRODUCTION_PROFILE') == '1':
+    DATABASES['default'].update({
+        'ENGINE': 'attendance.sqlite',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        # Concurrency tests need a database file the test threads share
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        'OPTIONS': {
+            'timeout': 20,  # Seconds a writer waits for the lock (busy timeout)
+            'begin_immediate': True,
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'cache_size': -64000,  # 64MB page cache
+                'temp_store': 'MEMORY',
+                'mmap_size': 268435456,
+                'wal_autocheckpoint': 1000,
+            },
+        },
+    })
+
+# Geofence matching for clock-in/out: 'memory' (in-process grid index) or
+# 'spatialite' (one indexed SpatiaLite query per lookup, see
+# attendance/spatialite.py). 'spatialite' is experimental: it needs
+# mod_spatialite, which CI does not have, so it is untested there. Run
+# `manage.py sync_geofence_shapes --verify 1000` after switching to load
+# the shapes and compare its matches with the in-memory matcher.
+GEOFENCE_SPATIAL_BACKEND = os.getenv('GEOFENCE_SPATIAL_BACKEND', 'memory')
+if GEOFENCE_SPATIAL_BACKEND == 'spatialite':
+    DATABASES['default']['ENGINE'] = (
+        'attendance.sqlite.spatialite' if DATABASES['default']['ENGINE'] == 'attendance.sqlite'
+        else 'django.contrib.gis.db.backends.spatialite'
+    )
+
+# Writes that still fail with "database is locked" are retried this many
+# times, backing off exponentially from DATABASE_LOCK_RETRY_DELAY seconds
+DATABASE_LOCK_RETRIES = 3
+DATABASE_LOCK_RETRY_DELAY = 0.05
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -106,6 +151,14 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Token buckets on the attendance write endpoints: N/period allows a
+    # burst of N and refills at N per period
+    'DEFAULT_THROTTLE_RATES': {
+        'attendance_write': '20/min',
+        'attendance_write_admin': '120/min',
+        'attendance_write_global': '50/s',
+        'location_ping': '30/min',
+    },
 }
 
 SIMPLE_JWT = {
@@ -125,6 +178,10 @@ CORS_ALLOWED_ORIGINS = [
 # Must be True to allow cookies/auth headers
 CORS_ALLOW_CREDENTIALS = True
 
+# Clock-in/out retries carry an Idempotency-Key header
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
+
 # Optional but recommended if you're using CSRF protection
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:5173",
@@ -133,3 +190,104 @@ CSRF_TRUSTED_ORIGINS = [
 
 # Google Maps API
 GOOGLE_MAPS_API_KEY = ''
+
+# Reverse geocoding of attendance coordinates. Without an API key the
+# offline stub labels points with their geofence name.
+REVERSE_GEOCODING_PROVIDER = (
+    'attendance.geocoding.GoogleMapsGeocoder' if GOOGLE_MAPS_API_KEY else 'attendance.geocoding.StubGeocoder'
+)
+REVERSE_GEOCODING_PRECISION = 4  # Decimals kept in cache keys (~11 m)
+REVERSE_GEOCODING_CACHE_SIZE = 10000  # In-memory LRU entries per process
+REVERSE_GEOCODING_BATCH_SIZE = 50  # Points per provider request
+
+# Caches
+# The geofence index uses the default cache to tell workers when to reload.
+# Point it at a shared backend (Redis, Memcached) when running several processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Geofence spatial index
+GEOFENCE_INDEX_CELL_SIZE = 0.02  # Grid cell size in degrees (~2.2 km of latitude)
+GEOFENCE_INDEX_MAX_CELLS = 4096  # Larger geofences are checked on every lookup
+
+# Versioned geofence set (see attendance/versioning.py): how long the current
+# version may be served from the cache, how long a serialized full list is
+# kept, and how long deleted geofences are remembered for delta fetches
+GEOFENCE_VERSION_CACHE_TTL = 60
+GEOFENCE_LIST_CACHE_TTL = 60 * 60
+GEOFENCE_TOMBSTONE_RETENTION_DAYS = 90
+
+# Polygon geofences with more vertices than this are simplified once when loaded
+GEOFENCE_POLYGON_SIMPLIFY_THRESHOLD = 500
+GEOFENCE_POLYGON_SIMPLIFY_TOLERANCE = 0.00001  # Degrees (~1 m)
+
+# Maximum number of queued clock events accepted by one bulk upload
+ATTENDANCE_BULK_MAX_EVENTS = 500
+
+# Seconds the admin dashboard counters are served from the cache
+SYSTEM_STATS_CACHE_TTL = 300
+
+# Rows fetched per database round trip (and per written chunk) by attendance exports
+ATTENDANCE_EXPORT_CHUNK_SIZE = 2000
+
+# Login logs are queued and written in batches by a background thread
+LOGIN_LOG_ASYNC = True
+LOGIN_LOG_BATCH_SIZE = 200  # Events per bulk insert
+LOGIN_LOG_FLUSH_INTERVAL = 1.0  # Seconds before a partial batch is written
+LOGIN_LOG_QUEUE_SIZE = 10000  # Beyond this, events are written synchronously
+
+# Location pings are buffered the same way, in larger batches
+LOCATION_PING_ASYNC = True
+LOCATION_PING_BATCH_SIZE = 500
+LOCATION_PING_FLUSH_INTERVAL = 2.0
+LOCATION_PING_QUEUE_SIZE = 50000
+LOCATION_PING_MAX_BATCH = 200  # Pings per request
+LOCATION_PING_MAX_ACCURACY_M = 100  # Less accurate pings are stored but ignored for exits
+# 'trail': pings taken during a shift go to the shift's compact trail, only
+# the others are stored as LocationPing rows; 'rows': every ping is a row;
+# 'both': shift pings are stored both ways
+LOCATION_PING_STORAGE = 'trail'
+
+# Shift trails (see attendance/trails.py), appended in batches
+LOCATION_TRAIL_ASYNC = True
+LOCATION_TRAIL_BATCH_SIZE = 500
+LOCATION_TRAIL_FLUSH_INTERVAL = 2.0
+LOCATION_TRAIL_QUEUE_SIZE = 50000
+LOCATION_TRAIL_CHUNK_POINTS = 1000  # Points per chunk before it is sealed and compressed
+LOCATION_TRAIL_PRECISION = 5  # Decimal places kept, 5 is about 1.1m
+
+# Server-side exit detection: a user is clocked out automatically after
+# GEOFENCE_EXIT_DWELL_SECONDS (and at least GEOFENCE_EXIT_MIN_PINGS pings)
+# more than GEOFENCE_EXIT_MARGIN_M outside their clock-in geofence
+GEOFENCE_EXIT_MARGIN_M = 25
+GEOFENCE_EXIT_DWELL_SECONDS = 120
+GEOFENCE_EXIT_MIN_PINGS = 2
+
+# Timesheets: a clock-out more than this long after the clock-in does not
+# close it, both events are reported as unmatched
+TIMESHEET_MAX_SHIFT_HOURS = 24
+
+# Responses to clock-in/out requests sent with an Idempotency-Key are kept
+# this many seconds and replayed for retries with the same key
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_CACHE = 'default'
+
+# Switch for the attendance write throttles (benchmark_attendance turns them off)
+ATTENDANCE_THROTTLE_ENABLED = True
+
+# Where attendance throttle buckets live. The local backend is per process;
+# attendance.throttling.CacheTokenBucketBackend shares them through a cache
+# alias (OPTIONS: {'alias': 'default'}) across workers.
+ATTENDANCE_THROTTLE_BACKEND = {
+    'BACKEND': 'attendance.throttling.LocalTokenBucketBackend',
+    'OPTIONS': {'max_keys': 10000},
+}
+
+# Per-request query/timing metrics: Server-Timing header and rolling
+# per-route histograms (this many seconds) at /api/metrics/ for admins
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_SERVER_TIMING = True
+REQUEST_METRICS_WINDOW = 300